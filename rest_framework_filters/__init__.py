@@ -1,2 +1,2 @@
 from .filters import *  # noqa
-from .filterset import FilterSet  # noqa
+from .filterset import FilterSet, warmup  # noqa
@@ -1,17 +1,44 @@
+from collections import OrderedDict
 from contextlib import contextmanager
 
+from django.db import connections
+from django.db.models import Q
+from django.db.models.constants import LOOKUP_SEP
 from django.http import QueryDict
+from django.utils.translation import gettext as _
 from django_filters import compat
 from django_filters.rest_framework import backends
+from django_filters.utils import translate_validation
 from rest_framework.exceptions import ValidationError
 
-from .complex_ops import combine_complex_queryset, decode_complex_ops
+from . import utils
+from .complex_ops import (
+    COMPLEX_OPERATORS, EMPTY, UNIVERSAL, Operand, combine_complex_sets,
+    combine_complex_tree, compile_complex_tree, factor_complex_tree, get_operands,
+    parse_complex_ops, simplify_complex_tree,
+)
 from .filterset import FilterSet
 
+# Modes for combining the querystrings of a complex query.
+# See: :attr:`rest_framework_filters.backends.ComplexFilterBackend.complex_filter_mode`
+COMBINE = 'combine'
+COMPILE = 'compile'
+SETS = 'sets'
+
 
 class RestFrameworkFilterBackend(backends.DjangoFilterBackend):
     filterset_base = FilterSet
 
+    # Limits on the query complexity of a request, which are checked before the
+    # filterset is initialized. See ``FilterSet.get_query_complexity()``.
+    max_related_depth = None
+    max_related_filtersets = None
+    max_filters = None
+
+    # Policy that checks the query plan of the filtered queryset, or ``None`` to
+    # disable the check. See ``explain.ExplainPolicy``.
+    explain_policy = None
+
     @property
     def template(self):
         if compat.is_crispy():
@@ -37,11 +64,86 @@ class RestFrameworkFilterBackend(backends.DjangoFilterBackend):
 
             return filterset_class
 
+        # The rendered form doesn't filter the queryset, so the query complexity isn't
+        # checked. Otherwise, rendering the response to a rejected query would fail.
+        check_query_complexity = self.check_query_complexity
+
+        def skip_query_complexity(filterset_class, params):
+            pass
+
         self.get_filterset_class = get_filterset_class
+        self.check_query_complexity = skip_query_complexity
         try:
             yield
         finally:
             self.get_filterset_class = original
+            self.check_query_complexity = check_query_complexity
+
+    def get_filterset(self, request, queryset, view):
+        filterset_class = self.get_filterset_class(view, queryset)
+        if filterset_class is None:
+            return None
+
+        kwargs = self.get_filterset_kwargs(request, queryset, view)
+        return self.build_filterset(filterset_class, kwargs)
+
+    def build_filterset(self, filterset_class, kwargs):
+        """Build a filterset, after checking the query complexity of its data.
+
+        Args:
+            filterset_class: The filterset class.
+            kwargs: The filterset's kwargs (see ``get_filterset_kwargs()``).
+
+        Returns:
+            The filterset instance.
+        """
+        # django-filter compatibility
+        if issubclass(filterset_class, FilterSet):
+            self.check_query_complexity(filterset_class, kwargs['data'])
+
+        return filterset_class(**kwargs)
+
+    def filter_queryset(self, request, queryset, view):
+        filtered = super().filter_queryset(request, queryset, view)
+        self.check_query_plan(filtered, queryset)
+        return filtered
+
+    def check_query_plan(self, queryset, base=None):
+        """Check the query plan of the filtered ``queryset`` against the policy.
+
+        Args:
+            queryset: The filtered queryset.
+            base: The unfiltered queryset, whose query plan issues are not reported.
+        """
+        if self.explain_policy is not None:
+            self.explain_policy.check(queryset, base)
+
+    def check_query_complexity(self, filterset_class, params):
+        """Check the query complexity of the request ``params`` against the limits.
+
+        Args:
+            filterset_class: The filterset class used to filter the queryset.
+            params: The request's query params.
+
+        Raises:
+            ValidationError: If the query exceeds any of the limits.
+        """
+        complexity = filterset_class.get_query_complexity(params)
+        checks = [
+            (complexity.depth, self.max_related_depth,
+             _('Filtering across relationships is limited to a depth of %(limit)d.')),
+            (complexity.related_filtersets, self.max_related_filtersets,
+             _('Filtering is limited to %(limit)d related filtersets.')),
+            (complexity.filters, self.max_filters,
+             _('Filtering is limited to %(limit)d filters.')),
+        ]
+
+        errors = [
+            msg % {'limit': limit} for value, limit, msg in checks
+            if limit is not None and value > limit
+        ]
+        if errors:
+            raise ValidationError(errors)
 
     def to_html(self, request, queryset, view):
         # Patching the behavior of ``.get_filterset_class()`` in this method allows us
@@ -55,44 +157,446 @@ class ComplexFilterBackend(RestFrameworkFilterBackend):
     operators = None
     negation = True
 
+    # How the querystrings' filtering is combined, either 'combine' (combine the
+    # filtered querysets), 'compile' (compile the filtersets into a single ``Q``), or
+    # 'sets' (combine the querysets' primary keys with SQL set operations). Views may
+    # override the mode with a ``complex_filter_mode`` attribute.
+    # See: :meth:`.compile_complex_queryset()` and :meth:`.combine_complex_sets()`
+    complex_filter_mode = COMBINE
+
+    # Limit on the number of querystrings in a complex query. The other complexity
+    # limits are checked for each querystring.
+    max_complex_ops = None
+
+    # Limit on the length of the encoded complex querystring, which is checked before
+    # the querystring is parsed.
+    max_complex_length = None
+
+    # Limit on the number of nested groups and negations in a complex query, which is
+    # checked while the querystring is parsed. Deeply nested queries may exceed the
+    # limits of the database's SQL parser (or Python's recursion limit).
+    max_complex_depth = 10
+
+    # Cache of parsed complex querystrings (or their parsing errors), shared by all
+    # backend classes. Replace the cache to change its size, or set to ``None`` to
+    # disable caching.
+    complex_cache = utils.LRUCache(maxsize=256)
+
+    # Simplify the parsed complex query, removing redundant operands and detecting
+    # contradictions.
+    # See: :func:`rest_framework_filters.complex_ops.simplify_complex_tree`
+    simplify_complex_ops = True
+
+    # Factor the params shared by the operands of ``|`` operations out of the operation,
+    # so that they're only filtered once. See: :meth:`.factor_complex_tree()`
+    factor_complex_ops = True
+
+    # The filterset class and kwargs resolved for the request, and the filtersets built
+    # for its querystrings, which are reused when the querystrings are validated and
+    # filtered. Backends are instantiated for each request, and both are reset by
+    # ``filter_queryset()``. See: :meth:`.get_filtersets()`
+    resolved_filterset = None
+    filterset_cache = None
+
     def filter_queryset(self, request, queryset, view):
         if self.complex_filter_param not in request.query_params:
             return super().filter_queryset(request, queryset, view)
 
-        # Decode the set of complex operations
+        self.resolved_filterset, self.filterset_cache = None, {}
+        tree = self.get_complex_tree(request, queryset, view)
+        if tree == EMPTY:
+            return queryset.none()
+        if tree == UNIVERSAL:
+            return queryset
+
+        tree = self.factor_complex_tree(tree, request, queryset, view)
+        operands = get_operands(tree)
+        querystrings = list(OrderedDict.fromkeys(op.querystring for op in operands))
+
+        mode = self.get_complex_filter_mode(view)
+        try:
+            if mode == COMPILE and self.operators is None:
+                filtered = self.compile_complex_queryset(
+                    tree, querystrings, request, queryset, view,
+                )
+            elif mode == SETS and self.operators is None:
+                filtered = self.combine_complex_sets(
+                    tree, querystrings, request, queryset, view,
+                )
+            else:
+                querysets = self.get_filtered_querysets(
+                    querystrings, request, queryset, view,
+                )
+                querysets = dict(zip(querystrings, querysets))
+                filtered = combine_complex_tree(
+                    tree, querysets, queryset, self.operators,
+                )
+        except ValidationError as exc:
+            raise ValidationError({self.complex_filter_param: exc.detail})
+
+        self.check_query_plan(filtered, queryset)
+        return filtered
+
+    def get_complex_filter_mode(self, view):
+        """Get the mode for combining the querystrings of a complex query.
+
+        Args:
+            view: The view.
+
+        Returns:
+            The view's ``complex_filter_mode``, or the backend's if the view does not
+            declare one.
+        """
+        return getattr(view, 'complex_filter_mode', self.complex_filter_mode)
+
+    def get_complex_tree(self, request, queryset, view):
+        """Parse the request's complex querystring into an expression tree.
+
+        The ``max_complex_ops`` limit is checked, and each querystring's filterset is
+        built and validated (see ``get_filtersets()``), before the tree is simplified.
+        So, operands that are simplified away are still checked against the query
+        complexity limits and the cost policy. The tree is simplified if
+        ``simplify_complex_ops`` is enabled, and the ``operators`` are not customized.
+
+        Args:
+            request: The request.
+            queryset: The queryset to filter.
+            view: The view.
+
+        Returns:
+            The root node of the expression tree, ``EMPTY`` for a contradiction, or
+            ``UNIVERSAL`` for a tautology.
+
+        Raises:
+            ValidationError: If the querystring can't be parsed, if it has too many
+                querystrings, or if any querystring's filterset is invalid.
+        """
         encoded_querystring = request.query_params[self.complex_filter_param]
         try:
-            complex_ops = decode_complex_ops(
-                encoded_querystring,
-                self.operators,
-                self.negation,
-            )
+            tree = self.parse_complex_ops(encoded_querystring)
         except ValidationError as exc:
             raise ValidationError({self.complex_filter_param: exc.detail})
 
-        # Collect the individual filtered querysets
-        querystrings = [op.querystring for op in complex_ops]
+        operands = get_operands(tree)
+        if self.max_complex_ops is not None and len(operands) > self.max_complex_ops:
+            msg = _('Complex filtering is limited to %(limit)d querystrings.')
+            raise ValidationError({
+                self.complex_filter_param: [msg % {'limit': self.max_complex_ops}],
+            })
+
+        querystrings = list(OrderedDict.fromkeys(op.querystring for op in operands))
         try:
-            querysets = self.get_filtered_querysets(querystrings, request, queryset, view)
+            self.get_filtersets(querystrings, request, queryset, view)
         except ValidationError as exc:
             raise ValidationError({self.complex_filter_param: exc.detail})
 
-        return combine_complex_queryset(querysets, complex_ops)
+        if self.simplify_complex_ops and self.operators is None:
+            tree = simplify_complex_tree(tree)
+        return tree
 
-    def get_filtered_querysets(self, querystrings, request, queryset, view):
-        original_GET = request._request.GET
+    def parse_complex_ops(self, encoded_querystring):
+        """Parse the encoded complex querystring, using the ``complex_cache``.
+
+        The parsed tree, or the parsing error, is cached by the encoded querystring and
+        the backend's ``operators``, ``negation``, ``max_complex_length``, and
+        ``max_complex_depth`` settings. Querystrings that exceed the
+        ``max_complex_length`` are not cached.
+
+        Args:
+            encoded_querystring (str): The encoded complex querystring.
+
+        Returns:
+            The root node of the expression tree.
+
+        Raises:
+            ValidationError: If the querystring can't be parsed.
+        """
+        max_length = self.max_complex_length
+        if self.complex_cache is None \
+                or (max_length is not None and len(encoded_querystring) > max_length):
+            return parse_complex_ops(
+                encoded_querystring, self.operators, self.negation, max_length,
+                self.max_complex_depth,
+            )
+
+        operators = frozenset(self.operators or COMPLEX_OPERATORS)
+        key = (
+            encoded_querystring, operators, self.negation, max_length,
+            self.max_complex_depth,
+        )
+        result = self.complex_cache.get(key)
+
+        if result is None:
+            try:
+                result = parse_complex_ops(
+                    encoded_querystring, self.operators, self.negation, max_length,
+                    self.max_complex_depth,
+                )
+            except ValidationError as exc:
+                result = exc
+            self.complex_cache.set(key, result)
+
+        if isinstance(result, ValidationError):
+            raise ValidationError(result.detail)
+        return result
+
+    def factor_complex_tree(self, tree, request, queryset, view):
+        """Factor the params shared by the operands of ``|`` operations.
 
-        querysets, errors = [], {}
+        e.g., ``(author__username=bob&title=x) | (author__username=bob&title=y)`` is
+        filtered as ``(author__username=bob) & ((title=x) | (title=y))``, so that the
+        related ``author`` filterset is only validated and filtered once. Params are only
+        factored if they're filtered independently of the rest of their querystring (see
+        :meth:`.is_factorable_param()`), and not for custom ``operators``.
+
+        The original querystrings have already been validated (see
+        ``get_complex_tree()``). If the factored querystrings are invalid, e.g. because
+        a filterset's validation depends on the combination of its params, the tree is
+        not factored.
+
+        Args:
+            tree: The root node of the expression tree.
+            request: The request.
+            queryset: The queryset to filter.
+            view: The view.
+
+        Returns:
+            The root node of the factored expression tree.
+        """
+        if not self.factor_complex_ops or self.operators is not None:
+            return tree
+
+        # the filterset class is only resolved if the operands share any params
+        resolved = []
+
+        def is_factorable(param):
+            if not resolved:
+                resolved.append(self.get_filterset_class(view, queryset))
+            filterset_class = resolved[0]
+            return filterset_class is not None \
+                and self.is_factorable_param(filterset_class, param)
+
+        factored = factor_complex_tree(tree, is_factorable)
+        if factored == tree:
+            return tree
+
+        operands = get_operands(factored)
+        querystrings = list(OrderedDict.fromkeys(op.querystring for op in operands))
+        try:
+            self.get_filtersets(querystrings, request, queryset, view)
+        except ValidationError:
+            return tree
+        return factored
+
+    def is_factorable_param(self, filterset_class, param, rel=None):
+        """Determine if a param may be filtered separately from its querystring.
+
+        Filtering a param separately is equivalent if it's handled by a declared filter
+        that doesn't traverse a multi-valued relationship, either directly or through
+        related filtersets. The filtering of ``method`` filters is unknown, as is the
+        filtering of filtersets that override it (see ``overrides_filtering()``). The
+        ``cost_policy`` of a filterset is checked against each querystring's filters,
+        so its params aren't factored either.
+
+        Args:
+            filterset_class: The filterset class.
+            param (str): The query param.
+            rel (str, optional): The relationship the ``param`` is resolved against.
+
+        Returns:
+            ``True`` if the param may be factored.
+        """
+        if filterset_class.overrides_filtering() \
+                or filterset_class.cost_policy is not None:
+            return False
+
+        name = filterset_class.get_param_filter_name(param, rel)
+        f = filterset_class.base_filters.get(name) if name else None
+        if f is None or f.method is not None:
+            return False
+
+        if utils.is_multi_valued_path(filterset_class._meta.model, f.field_name):
+            return False
+
+        # params that traverse the relationship are filtered by the related filterset
+        local_param = param[len(rel) + len(LOOKUP_SEP):] if rel else param
+        if name not in filterset_class.related_filters \
+                or local_param in filterset_class.param_filter_names:
+            return True
+
+        related_rel = LOOKUP_SEP.join([rel, name]) if rel else name
+        return self.is_factorable_param(f.filterset, param, related_rel)
+
+    def compile_complex_queryset(self, tree, querystrings, request, queryset, view):
+        """Filter the ``queryset`` by the expression tree, compiled into a single ``Q``.
+
+        Each querystring's filterset is compiled into a ``Q`` object (see
+        ``FilterSet.get_filter_q()``), and the ``Q`` objects are combined by the
+        tree's operators. This avoids filtering and combining a queryset for each
+        querystring. If any filterset can't be compiled, the filtersets' querysets
+        are combined instead.
+
+        Args:
+            tree: The root node of the expression tree.
+            querystrings: The unique querystrings of the tree's operands.
+            request: The request.
+            queryset: The queryset to filter.
+            view: The view.
+
+        Returns:
+            The filtered queryset.
+        """
+        filtersets = self.get_filtersets(querystrings, request, queryset, view)
+
+        conditions, distinct = {}, False
+        for querystring, filterset in zip(querystrings, filtersets):
+            if filterset is None:
+                compiled = Q(), False
+            elif isinstance(filterset, FilterSet):
+                compiled = filterset.get_filter_q()
+            else:
+                compiled = None
+
+            if compiled is None:
+                querysets = [queryset if fs is None else fs.qs for fs in filtersets]
+                querysets = dict(zip(querystrings, querysets))
+                return combine_complex_tree(tree, querysets, queryset, self.operators)
+
+            conditions[querystring] = compiled[0]
+            distinct = distinct or compiled[1]
+
+        queryset = queryset.filter(compile_complex_tree(tree, conditions))
+        return queryset.distinct() if distinct else queryset
+
+    def combine_complex_sets(self, tree, querystrings, request, queryset, view):
+        """Filter the ``queryset`` by SQL set operations of the operands' primary keys.
+
+        The ``|``, ``&``, and negation operations are mapped onto ``UNION``,
+        ``INTERSECT``, and ``EXCEPT`` of each operand's primary keys, and the
+        ``queryset`` is filtered by the resulting set (see ``combine_complex_sets()``).
+        Unlike combining the querysets, each operand is queried separately, and may use
+        its own joins and indexes. If the database doesn't support the set operations,
+        the querysets are combined instead.
+
+        Args:
+            tree: The root node of the expression tree.
+            querystrings: The unique querystrings of the tree's operands.
+            request: The request.
+            queryset: The queryset to filter.
+            view: The view.
+
+        Returns:
+            The filtered queryset.
+        """
+        querysets = self.get_filtered_querysets(querystrings, request, queryset, view)
+        querysets = dict(zip(querystrings, querysets))
+
+        # a single operand doesn't need to be combined
+        if isinstance(tree, Operand):
+            return querysets[tree.querystring]
+
+        features = connections[queryset.db].features
+        if not (features.supports_select_union and features.supports_select_intersection
+                and features.supports_select_difference):
+            return combine_complex_tree(tree, querysets, queryset)
+
+        return queryset.filter(pk__in=combine_complex_sets(tree, querysets, queryset))
+
+    @contextmanager
+    def patch_for_querystring(self, filterset_class, kwargs):
+        # Patch ``.get_filterset_class()`` and ``.get_filterset_kwargs()``, so that
+        # ``.get_filterset()`` builds a querystring's filterset from the class and
+        # kwargs that were resolved once for the request, without modifying it.
+        get_filterset_class = self.get_filterset_class
+        get_filterset_kwargs = self.get_filterset_kwargs
+
+        def get_resolved_class(view, queryset=None):
+            return filterset_class
+
+        def get_resolved_kwargs(request, queryset, view):
+            return kwargs
+
+        self.get_filterset_class = get_resolved_class
+        self.get_filterset_kwargs = get_resolved_kwargs
+        try:
+            yield
+        finally:
+            self.get_filterset_class = get_filterset_class
+            self.get_filterset_kwargs = get_filterset_kwargs
+
+    def get_filtersets(self, querystrings, request, queryset, view):
+        """Build and validate a filterset for each querystring.
+
+        The filterset class and kwargs are resolved once for the request, and each
+        filterset is built by ``get_filterset()`` with the querystring's own
+        ``QueryDict`` as its data (see ``patch_for_querystring()``). The request is not
+        modified. The resolved class and kwargs, and the valid filtersets, are cached
+        for the rest of the request (see ``filterset_cache``).
+
+        Args:
+            querystrings: The decoded querystrings.
+            request: The request.
+            queryset: The queryset to filter.
+            view: The view.
+
+        Returns:
+            A list of the filtersets, or of ``None`` if the view has no filterset class.
+
+        Raises:
+            ValidationError: If any filterset is invalid, with the errors of each
+                querystring.
+        """
+        if self.resolved_filterset is None:
+            filterset_class = self.get_filterset_class(view, queryset)
+            base_kwargs = filterset_class and self.get_filterset_kwargs(
+                request, queryset, view,
+            )
+            self.resolved_filterset = filterset_class, base_kwargs
+
+        filterset_class, base_kwargs = self.resolved_filterset
+        if filterset_class is None:
+            return [None] * len(querystrings)
+
+        cache = self.filterset_cache if self.filterset_cache is not None else {}
+
+        filtersets, errors = [], {}
         for qs in querystrings:
-            request._request.GET = QueryDict(qs)
+            if qs in cache:
+                filtersets.append(cache[qs])
+                continue
+
+            kwargs = dict(base_kwargs, data=QueryDict(qs))
             try:
-                result = super().filter_queryset(request, queryset, view)
-                querysets.append(result)
+                with self.patch_for_querystring(filterset_class, kwargs):
+                    filterset = self.get_filterset(request, queryset, view)
             except ValidationError as exc:
                 errors[qs] = exc.detail
-            finally:
-                request._request.GET = original_GET
+                continue
+
+            if filterset is not None and not filterset.is_valid() \
+                    and self.raise_exception:
+                errors[qs] = translate_validation(filterset.errors).detail
+                continue
+
+            cache[qs] = filterset
+            filtersets.append(filterset)
 
         if errors:
             raise ValidationError(errors)
-        return querysets
+        return filtersets
+
+    def get_filtered_querysets(self, querystrings, request, queryset, view):
+        """Filter the ``queryset`` by each querystring's filterset.
+
+        Args:
+            querystrings: The decoded querystrings.
+            request: The request.
+            queryset: The queryset to filter.
+            view: The view.
+
+        Returns:
+            A list of the filtered querysets.
+        """
+        # the query plan is checked for the combined queryset
+        filtersets = self.get_filtersets(querystrings, request, queryset, view)
+        return [queryset if fs is None else fs.qs for fs in filtersets]
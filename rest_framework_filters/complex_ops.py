@@ -1,30 +1,655 @@
-import re
-from collections import namedtuple
-from urllib.parse import unquote
+import operator
+from collections import OrderedDict, namedtuple
+from urllib.parse import parse_qsl, unquote
 
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
+from django.db.models.sql.where import WhereNode
 from django.utils.translation import gettext as _
 from rest_framework.serializers import ValidationError
 
-from rest_framework_filters.utils import lookahead
-
-# originally based on: https://regex101.com/r/5rPycz/1
-# current iteration: https://regex101.com/r/5rPycz/3
-# special thanks to @JohnDoe2 on the #regex IRC channel!
-# matches groups of "<negate>(<encoded querystring>)<set op>"
-COMPLEX_OP_RE = re.compile(r'()\(([^)]+)\)([^(]*?(?=\())?')
-COMPLEX_OP_NEG_RE = re.compile(r'(~?)\(([^)]+)\)([^(]*?(?=~\(|\())?')
 COMPLEX_OPERATORS = {
     '&': QuerySet.__and__,
     '|': QuerySet.__or__,
 }
 
+# The operators that can be compiled into a single ``Q`` object.
+# See: :func:`rest_framework_filters.complex_ops.compile_complex_tree`
+COMPILED_OPERATORS = {
+    '&': operator.and_,
+    '|': operator.or_,
+}
+
+# The SQL set operations that combine the primary keys of the operands.
+# See: :func:`rest_framework_filters.complex_ops.combine_complex_sets`
+SET_OPERATORS = {
+    '&': QuerySet.intersection,
+    '|': QuerySet.union,
+}
+
+# Operators bind more tightly than operators with a lower precedence. Operators that
+# are not listed (e.g., custom operators) have the same precedence as ``|``.
+OPERATOR_PRECEDENCE = {
+    '&': 2,
+    '|': 1,
+}
+DEFAULT_PRECEDENCE = 1
+
 ComplexOp = namedtuple('ComplexOp', ['querystring', 'negate', 'op'])
 
+# The nodes of a parsed complex query. An ``Operation`` applies its operator to its
+# ``operands`` from left to right, e.g. ``(a) & (b) & (c)`` is a single operation.
+# See: :func:`rest_framework_filters.complex_ops.parse_complex_ops`
+Operand = namedtuple('Operand', ['querystring'])
+Negation = namedtuple('Negation', ['operand'])
+Operation = namedtuple('Operation', ['op', 'operands'])
+
+# A contradiction, which never matches, and a tautology, which always matches. That
+# is, an OR and an AND operation without operands.
+# See: :func:`rest_framework_filters.complex_ops.simplify_complex_tree`
+EMPTY = Operation('|', ())
+UNIVERSAL = Operation('&', ())
+
+# The tokens of a decoded complex querystring.
+# See: :func:`rest_framework_filters.complex_ops.tokenize_complex_ops`
+Token = namedtuple('Token', ['kind', 'value', 'position'])
+
+QUERYSTRING = 'querystring'
+LPAREN = '('
+RPAREN = ')'
+NOT = '~'
+OP = 'op'
+
+WHITESPACE = ' \t\r\n'
+# Characters that end an operator, in addition to whitespace.
+OPERATOR_DELIMITERS = WHITESPACE + '()~'
+
+
+def tokenize_complex_ops(decoded_querystring):
+    """Tokenize a decoded complex querystring in a single pass.
+
+    A ``'('`` that is followed by another group (or a negated group) opens a group,
+    and otherwise wraps an encoded querystring, which extends to the next ``')'``. A
+    ``ValidationError`` is raised if a querystring is empty, not closed, or contains
+    a ``'('``.
+
+    .. code-block:: python
+
+        >>> tokenize_complex_ops('~((a%3D1) | (b%3D2))')
+        [
+            Token('~', '~', 0),
+            Token('(', '(', 1),
+            Token('querystring', 'a%3D1', 2),
+            Token('op', '|', 10),
+            Token('querystring', 'b%3D2', 12),
+            Token(')', ')', 19),
+        ]
+
+    Args:
+        decoded_querystring (str): The complex querystring, after decoding the outer
+            layer of URL-encoding.
+
+    Returns:
+        A list of ``Token`` tuples.
+    """
+    s = decoded_querystring
+    length = len(s)
+    tokens = []
+
+    pos = 0
+    while pos < length:
+        char = s[pos]
+        if char in WHITESPACE:
+            pos += 1
+
+        elif char == '(' and is_group(s, pos + 1):
+            tokens.append(Token(LPAREN, char, pos))
+            pos += 1
+
+        elif char == '(':
+            token, pos = read_querystring(s, pos)
+            tokens.append(token)
+
+        elif char in (RPAREN, NOT):
+            tokens.append(Token(char, char, pos))
+            pos += 1
+
+        else:
+            end = pos + 1
+            while end < length and s[end] not in OPERATOR_DELIMITERS:
+                end += 1
+
+            tokens.append(Token(OP, s[pos:end], pos))
+            pos = end
+
+    return tokens
+
+
+def read_querystring(s, pos):
+    # Read the querystring that is wrapped by the parenthesis at `pos`, and return its
+    # token and the position after the closing parenthesis.
+    length = len(s)
+    end = pos + 1
+    while end < length and s[end] not in '()':
+        end += 1
+
+    if end == length:
+        msg = _("Missing ')' for the querystring at position %(pos)d.")
+        raise ValidationError([msg % {'pos': pos}])
+    if s[end] == '(':
+        msg = _("Unexpected '(' at position %(pos)d.")
+        raise ValidationError([msg % {'pos': end}])
+
+    querystring = s[pos + 1:end].strip(WHITESPACE)
+    if not querystring:
+        msg = _('Empty querystring at position %(pos)d.')
+        raise ValidationError([msg % {'pos': pos}])
+
+    return Token(QUERYSTRING, querystring, pos), end + 1
+
+
+def is_group(s, pos):
+    # Determine if the parenthesis before `pos` opens a group, which starts with
+    # another parenthesis or a negation.
+    length = len(s)
+    while pos < length and s[pos] in WHITESPACE:
+        pos += 1
+
+    if pos < length and s[pos] == '~':
+        while pos < length and s[pos] in WHITESPACE + '~':
+            pos += 1
+    return pos < length and s[pos] == '('
+
+
+class ComplexOpsParser:
+    """A recursive-descent parser for the tokens of a complex querystring.
+
+    The grammar is as follows, where operators are parsed by their precedence and
+    are left-associative.
+
+    .. code-block::
+
+        expression := factor (operator factor)*
+        factor     := '~' factor | '(' expression ')' | '(' querystring ')'
+
+    Args:
+        tokens: The ``Token`` tuples of the complex querystring.
+        operators: The supported operator symbols.
+        negation: Whether to parse negation.
+        max_depth: The maximum number of nested groups and negations, or ``None``.
+    """
+
+    def __init__(self, tokens, operators, negation=True, max_depth=None):
+        self.tokens = tokens
+        self.operators = operators
+        self.negation = negation
+        self.max_depth = max_depth
+        self.index = 0
+        self.depth = 0
+
+    def peek(self):
+        if self.index < len(self.tokens):
+            return self.tokens[self.index]
+        return None
+
+    def advance(self):
+        token = self.peek()
+        self.index += 1
+        return token
+
+    def nest(self, token):
+        # Enter a group or negation, checking the nesting depth.
+        self.depth += 1
+        if self.max_depth is not None and self.depth > self.max_depth:
+            msg = _('Ensure the complex querystring is nested at most %(max_depth)d '
+                    'levels deep (position %(pos)d).')
+            raise ValidationError([
+                msg % {'max_depth': self.max_depth, 'pos': token.position},
+            ])
+
+    def end_position(self):
+        if not self.tokens:
+            return 0
+        last = self.tokens[-1]
+        return last.position + len(last.value) + (2 if last.kind == QUERYSTRING else 0)
+
+    def parse(self):
+        """Parse the tokens into an expression tree.
+
+        Returns:
+            The root ``Operand``, ``Negation``, or ``Operation`` node.
+
+        Raises:
+            ValidationError: If the tokens are not a valid complex query.
+        """
+        expression = self.parse_expression(0)
+
+        token = self.peek()
+        if token is not None:
+            if token.kind == RPAREN:
+                msg = _("Unexpected ')' at position %(pos)d.")
+            else:
+                msg = _('Expected an operator at position %(pos)d.')
+            raise ValidationError([msg % {'pos': token.position}])
+
+        return expression
+
+    def parse_expression(self, min_precedence):
+        left = self.parse_factor()
+
+        while True:
+            token = self.peek()
+            if token is None or token.kind != OP:
+                return left
+
+            if token.value not in self.operators:
+                raise ValidationError([
+                    _("Invalid querystring operator '%(op)s' at position %(pos)d.")
+                    % {'op': token.value, 'pos': token.position},
+                ])
+
+            precedence = OPERATOR_PRECEDENCE.get(token.value, DEFAULT_PRECEDENCE)
+            if precedence < min_precedence:
+                return left
+
+            self.advance()
+            right = self.parse_expression(precedence + 1)
+
+            # operations are left-associative, so `(a) & (b) & (c)` is flattened
+            if isinstance(left, Operation) and left.op == token.value:
+                left = Operation(left.op, left.operands + (right, ))
+            else:
+                left = Operation(token.value, (left, right))
+
+    def parse_factor(self):
+        token = self.advance()
+        if token is None:
+            msg = _('Unexpected end of querystring at position %(pos)d.')
+            raise ValidationError([msg % {'pos': self.end_position()}])
+
+        if token.kind == QUERYSTRING:
+            return Operand(unquote(token.value))
+
+        if token.kind == NOT:
+            if not self.negation:
+                msg = _('Negation is not supported (position %(pos)d).')
+                raise ValidationError([msg % {'pos': token.position}])
+            self.nest(token)
+            node = Negation(self.parse_factor())
+            self.depth -= 1
+            return node
+
+        if token.kind == LPAREN:
+            self.nest(token)
+            expression = self.parse_expression(0)
+
+            closing = self.advance()
+            if closing is None or closing.kind != RPAREN:
+                msg = _("Missing ')' for the group at position %(pos)d.")
+                raise ValidationError([msg % {'pos': token.position}])
+            self.depth -= 1
+            return expression
+
+        msg = _("Expected '(' at position %(pos)d.")
+        raise ValidationError([msg % {'pos': token.position}])
+
+
+def parse_complex_ops(encoded_querystring, operators=None, negation=True,
+                      max_length=None, max_depth=None):
+    """Parse the complex encoded querystring into an expression tree.
+
+    Groups may be nested and negated, and ``&`` binds more tightly than ``|``.
+
+    .. code-block:: python
+
+        # unencoded query: ((a=1) | (b=2)) & ~(c=3)
+        >>> s = '%28%28a%253D1%29%20%7C%20%28b%253D2%29%29%20%26%20~%28c%253D3%29'
+        >>> parse_complex_ops(s)
+        Operation('&', (
+            Operation('|', (Operand('a=1'), Operand('b=2'))),
+            Negation(Operand('c=3')),
+        ))
+
+    Args:
+        encoded_querystring: The encoded querystring.
+        operators: A map of {operator symbols: queryset operations}. Defaults to the
+            ``COMPLEX_OPERATORS`` mapping.
+        negation: Whether to parse negation.
+        max_length: The maximum length of the encoded querystring, or ``None``.
+        max_depth: The maximum number of nested groups and negations, or ``None``.
+
+    Returns:
+        The root ``Operand``, ``Negation``, or ``Operation`` node.
+
+    Raises:
+        ValidationError: If the querystring is too long, is nested too deeply, or is
+            not a valid complex query. Error positions refer to the decoded
+            querystring.
+    """
+    if operators is None:
+        operators = COMPLEX_OPERATORS
+
+    # reject long querystrings before decoding them
+    if max_length is not None and len(encoded_querystring) > max_length:
+        msg = _('Ensure the complex querystring has at most %(max_length)d characters.')
+        raise ValidationError([msg % {'max_length': max_length}])
+
+    # decode into: (a%3D1) & (b%3D2) | ~(c%3D3)
+    decoded_querystring = unquote(encoded_querystring)
+    tokens = tokenize_complex_ops(decoded_querystring)
+
+    try:
+        return ComplexOpsParser(tokens, operators, negation, max_depth).parse()
+    except RecursionError:
+        raise ValidationError([_('The complex querystring is nested too deeply.')])
+
+
+def get_operands(node):
+    """Get the operands of an expression tree, from left to right.
+
+    Args:
+        node: The ``Operand``, ``Negation``, or ``Operation`` node.
+
+    Returns:
+        A list of the ``Operand`` nodes.
+    """
+    if isinstance(node, Operand):
+        return [node]
+    if isinstance(node, Negation):
+        return get_operands(node.operand)
+    return [operand for child in node.operands for operand in get_operands(child)]
+
+
+def negate_queryset(queryset):
+    # Negate a copy of the queryset's filtering. The negated clause is wrapped in a new
+    # root node, as conditions that are later added to a negated root (e.g., by `&`)
+    # would also be negated.
+    queryset = queryset.all()
+    where = queryset.query.where
+    where.negate()
+    queryset.query.where = WhereNode([where])
+    return queryset
+
+
+def get_pk_queryset(queryset):
+    # Select only the primary keys of the queryset, without ordering, as ordering is
+    # not supported within compound statements on some databases (e.g., SQLite).
+    return queryset.order_by().values('pk')
+
+
+def combine_complex_tree(node, querysets, queryset, operators=None):
+    """Combine the filtered querysets of an expression tree's operands.
+
+    Negations exclude the primary keys of the negated queryset from the unfiltered
+    ``queryset``, so that, as with ``~Q`` (or ``exclude()``), rows for which the
+    negated conditions are unknown (e.g., a comparison with a ``NULL`` foreign key)
+    are included.
+
+    Args:
+        node: The ``Operand``, ``Negation``, or ``Operation`` node.
+        querysets: A map of {querystrings: filtered querysets}.
+        queryset: The unfiltered queryset, which negated operands are excluded from.
+        operators: A map of {operator symbols: queryset operations}. Defaults to the
+            ``COMPLEX_OPERATORS`` mapping.
+
+    Returns:
+        The combined queryset.
+    """
+    if operators is None:
+        operators = COMPLEX_OPERATORS
+
+    if isinstance(node, Operand):
+        return querysets[node.querystring]
+    if isinstance(node, Negation):
+        negated = combine_complex_tree(node.operand, querysets, queryset, operators)
+        return queryset.exclude(pk__in=get_pk_queryset(negated))
+    if not node.operands:
+        return queryset if node == UNIVERSAL else queryset.none()
+
+    combined = combine_complex_tree(node.operands[0], querysets, queryset, operators)
+    for operand in node.operands[1:]:
+        combined = operators[node.op](
+            combined, combine_complex_tree(operand, querysets, queryset, operators),
+        )
+    return combined
+
+
+def compile_complex_tree(node, conditions):
+    """Compile the filter conditions of an expression tree's operands into a ``Q``.
+
+    Only the ``&`` and ``|`` operators can be compiled (see ``COMPILED_OPERATORS``).
+    An empty ``Q`` (i.e., an operand without active filters) matches all rows, as an
+    unfiltered queryset would. Django omits an empty ``Q`` from ``|`` and ``~``
+    instead, so it's compiled as an explicit match-all condition.
+
+    Args:
+        node: The ``Operand``, ``Negation``, or ``Operation`` node.
+        conditions: A map of {querystrings: ``Q`` objects}.
+
+    Returns:
+        The combined ``Q`` object.
+    """
+    if isinstance(node, Operand):
+        return conditions[node.querystring] or Q(pk__isnull=False)
+    if isinstance(node, Negation):
+        return ~compile_complex_tree(node.operand, conditions)
+    if not node.operands:
+        return Q(pk__isnull=False) if node == UNIVERSAL else Q(pk__in=[])
+
+    combine = COMPILED_OPERATORS[node.op]
+    compiled = compile_complex_tree(node.operands[0], conditions)
+    for operand in node.operands[1:]:
+        compiled = combine(compiled, compile_complex_tree(operand, conditions))
+    return compiled
+
+
+def combine_complex_sets(node, querysets, queryset):
+    """Combine the primary keys of an expression tree's operands with SQL set operations.
+
+    ``|`` and ``&`` are mapped onto ``QuerySet.union()`` and ``QuerySet.intersection()``,
+    and negation onto the ``difference()`` of the unfiltered ``queryset`` and the
+    operand. Each operand only selects its primary keys, so that the database can plan
+    each operand's query independently (e.g., using a different index).
+
+    Args:
+        node: The ``Operand``, ``Negation``, or ``Operation`` node.
+        querysets: A map of {querystrings: filtered querysets}.
+        queryset: The unfiltered queryset, which negated operands are subtracted from.
+
+    Returns:
+        A queryset of the matching primary keys, to be filtered by a ``pk__in`` lookup.
+    """
+    if isinstance(node, Operand):
+        return get_pk_queryset(querysets[node.querystring])
+    if isinstance(node, Negation):
+        negated = combine_complex_sets(node.operand, querysets, queryset)
+        return get_pk_queryset(queryset).difference(negated)
+    if not node.operands:
+        return get_pk_queryset(queryset if node == UNIVERSAL else queryset.none())
+
+    combine = SET_OPERATORS[node.op]
+    operands = [
+        combine_complex_sets(child, querysets, queryset) for child in node.operands
+    ]
+    return combine(operands[0], *operands[1:])
+
+
+def get_querystring_params(querystring):
+    # Group the raw 'key=value' pairs of a querystring by their decoded keys, along
+    # with their decoded values. e.g., 'a=1&b=2&a=3' => {'a': [('a=1', '1'), ('a=3',
+    # '3')], 'b': [('b=2', '2')]}. Returns `None` if the pairs are ambiguous, as ';'
+    # is a pair separator in older versions of Django.
+    if ';' in querystring:
+        return None
+
+    params = OrderedDict()
+    for pair in querystring.split('&'):
+        for key, value in parse_qsl(pair, keep_blank_values=True):
+            params.setdefault(key, []).append((pair, value))
+    return params
+
+
+def factor_operands(operands, is_factorable):
+    # Factor the params shared by the `Operand` nodes of an OR operation.
+    positions = [i for i, node in enumerate(operands) if isinstance(node, Operand)]
+    if len(positions) < 2:
+        return operands
+
+    params = [get_querystring_params(operands[i].querystring) for i in positions]
+    if None in params:
+        return operands
+
+    def values(pairs):
+        return [value for _pair, value in pairs]
+
+    first = params[0]
+    shared = [
+        key for key, pairs in first.items()
+        if all(values(p.get(key, [])) == values(pairs) for p in params[1:])
+        and is_factorable(key)
+    ]
+    if not shared:
+        return operands
+
+    factored = Operand('&'.join(pair for key in shared for pair, _value in first[key]))
+    remaining = []
+    for p in params:
+        querystring = '&'.join(
+            pair for key, pairs in p.items() if key not in shared
+            for pair, _value in pairs
+        )
+        # An operand that only consists of the shared params absorbs the others.
+        if not querystring:
+            break
+        remaining.append(Operand(querystring))
+    else:
+        factored = Operation('&', (factored, Operation('|', tuple(remaining))))
+
+    # replace the first operand, which precedes the others
+    result = [node for i, node in enumerate(operands) if i not in positions[1:]]
+    result[positions[0]] = factored
+    return tuple(result)
+
+
+def factor_complex_tree(node, is_factorable):
+    """Factor the params shared by the operands of ``|`` operations out of the operation.
+
+    For example, ``(a=1&b=2) | (a=1&c=3)`` is rewritten as ``(a=1) & ((b=2) | (c=3))``,
+    so that the shared params are only filtered (and validated) once. An operand that
+    only consists of the shared params absorbs the operation, e.g. ``(a=1) | (a=1&b=2)``
+    is rewritten as ``(a=1)``. Params are only shared if their values are identical.
+
+    Args:
+        node: The ``Operand``, ``Negation``, or ``Operation`` node.
+        is_factorable: A callable that determines if a param may be filtered separately
+            from the rest of its querystring.
+
+    Returns:
+        The rewritten node. The ``node`` is not modified.
+    """
+    if isinstance(node, Operand):
+        return node
+    if isinstance(node, Negation):
+        return Negation(factor_complex_tree(node.operand, is_factorable))
+
+    operands = tuple(factor_complex_tree(child, is_factorable) for child in node.operands)
+    if node.op == '|':
+        operands = factor_operands(operands, is_factorable)
+        if len(operands) == 1:
+            return operands[0]
+
+    return Operation(node.op, operands)
+
+
+def is_contradicted(node, operands, op):
+    # Determine if the negation of the node contradicts the operands of an AND (or,
+    # for an OR, if they're a tautology).
+    if isinstance(node, Operation) and node.op == op and node.operands:
+        return all(operand in operands for operand in node.operands)
+    return node in operands
+
+
+def simplify_operation(node):
+    # Simplify the operands of an AND or OR operation.
+    dual = '|' if node.op == '&' else '&'
+
+    # nested operations with the same operator are flattened, which also removes
+    # the operation's identity (i.e., `UNIVERSAL` from AND, and `EMPTY` from OR)
+    operands = []
+    for child in node.operands:
+        child = simplify_complex_tree(child)
+        if isinstance(child, Operation) and child.op == node.op:
+            operands.extend(child.operands)
+        else:
+            operands.append(child)
+
+    # remove duplicate operands, then absorbed operands, e.g. `a | (a & b)`
+    operands = list(OrderedDict.fromkeys(operands))
+    operands = [
+        child for child in operands
+        if not (isinstance(child, Operation) and child.op == dual
+                and any(operand in operands for operand in child.operands))
+    ]
+
+    # `EMPTY` annihilates an AND, and `UNIVERSAL` annihilates an OR, as do
+    # contradictions (`a & ~a`) and tautologies (`a | ~a`), respectively
+    annihilator = Operation(dual, ())
+    if annihilator in operands or any(
+        is_contradicted(child.operand, operands, node.op)
+        for child in operands if isinstance(child, Negation)
+    ):
+        return annihilator
+
+    if len(operands) == 1:
+        return operands[0]
+    return Operation(node.op, tuple(operands))
+
+
+def simplify_complex_tree(node):
+    """Simplify the boolean expression of a parsed complex query.
+
+    The simplification flattens nested ``&`` and ``|`` operations, removes duplicate
+    operands, applies absorption (``a | (a & b)`` => ``a``), and folds double negation
+    (``~~a`` => ``a``). Operations with custom operators are not simplified, although
+    their operands are.
+
+    Contradictions (``a & ~a``) are simplified to ``EMPTY``, and tautologies
+    (``a | ~a``) to ``UNIVERSAL``. The negation of one is the other, ``EMPTY`` is
+    removed from ``|`` operations and annihilates ``&`` operations, and vice versa for
+    ``UNIVERSAL``. This relies on negations matching the complement of their operand,
+    including the rows for which the operand's conditions are unknown (i.e., ``NULL``).
+
+    Args:
+        node: The ``Operand``, ``Negation``, or ``Operation`` node.
+
+    Returns:
+        The simplified node, which is ``EMPTY`` if the expression never matches, or
+        ``UNIVERSAL`` if it always matches. The ``node`` is not modified.
+    """
+    if isinstance(node, Operand):
+        return node
+    if isinstance(node, Negation):
+        operand = simplify_complex_tree(node.operand)
+        if isinstance(operand, Negation):
+            return operand.operand
+        if operand in (EMPTY, UNIVERSAL):
+            return UNIVERSAL if operand == EMPTY else EMPTY
+        return Negation(operand)
+
+    if node.op in COMPILED_OPERATORS:
+        return simplify_operation(node)
+
+    return Operation(node.op, tuple(
+        simplify_complex_tree(child) for child in node.operands
+    ))
+
 
 def decode_complex_ops(encoded_querystring, operators=None, negation=True):
     """Decode the complex encoded querysting into a list of complex operations.
 
+    The querystring must not contain nested groups. Note that the operations are
+    combined from left to right by ``combine_complex_queryset()``, without operator
+    precedence. Use ``parse_complex_ops()`` to parse nested groups with precedence.
+
     .. code-block:: python
 
         # unencoded query: (a=1) & (b=2) | ~(c=3)
@@ -46,52 +671,40 @@ def decode_complex_ops(encoded_querystring, operators=None, negation=True):
         A list of ``(querystring, negate, op)`` tuples that represent the operations.
 
     Raises:
-        ValidationError: Raised under the following conditions:
-            - the individual querystrings are not wrapped in parentheses
-            - the set operators do not match the provided `operators`
-            - there is trailing content after the ending querysting
+        ValidationError: If the querystring is not a valid complex query, or if it
+            contains nested groups.
     """
-    complex_op_re = COMPLEX_OP_NEG_RE if negation else COMPLEX_OP_RE
     if operators is None:
         operators = COMPLEX_OPERATORS
 
-    # decode into: (a%3D1) & (b%3D2) | ~(c%3D3)
-    decoded_querystring = unquote(encoded_querystring)
-    matches = list(complex_op_re.finditer(decoded_querystring))
-
-    if not matches:
-        msg = _("Unable to parse querystring. Decoded: '%(decoded)s'.")
-        raise ValidationError(msg % {'decoded': decoded_querystring})
-
-    results, errors = [], []
-    for match, has_next in lookahead(matches):
-        negate, querystring, op = match.groups()
-
-        negate = negate == '~'
-        querystring = unquote(querystring)
-        op_func = operators.get(op.strip()) if op else None
-        if op_func is None and has_next:
-            msg = _("Invalid querystring operator. Matched: '%(op)s'.")
-            errors.append(msg % {'op': op})
-
-        results.append(ComplexOp(querystring, negate, op_func))
+    tokens = tokenize_complex_ops(unquote(encoded_querystring))
+    for token in tokens:
+        if token.kind == LPAREN:
+            msg = _('Nested groups are not supported (position %(pos)d).')
+            raise ValidationError([msg % {'pos': token.position}])
 
-    msg = _("Ending querystring must not have trailing characters. Matched: '%(chars)s'.")
-    trailing_chars = decoded_querystring[matches[-1].end():]
-    if trailing_chars:
-        errors.append(msg % {'chars': trailing_chars})
+    # validate the querystring
+    ComplexOpsParser(tokens, operators, negation).parse()
 
-    if errors:
-        raise ValidationError(errors)
+    results, negate = [], False
+    for token in tokens:
+        if token.kind == NOT:
+            negate = not negate
+        elif token.kind == QUERYSTRING:
+            results.append(ComplexOp(unquote(token.value), negate, None))
+            negate = False
+        elif token.kind == OP:
+            results[-1] = results[-1]._replace(op=operators[token.value])
 
     return results
 
 
 def combine_complex_queryset(querysets, complex_ops, negation=True):
     # Negate querysets
-    for queryset, op in zip(querysets, complex_ops):
-        if negation and op.negate:
-            queryset.query.where.negate()
+    querysets = [
+        negate_queryset(queryset) if negation and op.negate else queryset
+        for queryset, op in zip(querysets, complex_ops)
+    ]
 
     # Combine querysets
     combined = querysets[0]
@@ -0,0 +1,269 @@
+import time
+from collections import OrderedDict
+
+from django.core.validators import EMPTY_VALUES
+from django.db.models.constants import LOOKUP_SEP
+from django.utils.translation import gettext as _
+from django_filters.utils import get_model_field
+
+
+class LookupCostPolicy:
+    """A declarative policy that limits the cost of the filters used by a request.
+
+    Each lookup and transform of a filter's ``lookup_expr`` has a weight, and the cost
+    of a filter is the sum of its weights (e.g., ``date__week_day`` costs the weight
+    of ``date`` plus ``week_day``). The policy may then:
+
+    - reject requests whose total cost exceeds ``max_cost``.
+    - reject regular expressions that are longer than ``max_regex_length``.
+    - require that expensive filters (costing at least ``paired_cost``) are combined
+      with an indexed filter, which narrows the rows that must be scanned.
+    - require the same for leading-wildcard lookups (e.g., ``icontains``) when the
+      table has more than ``max_scan_rows`` rows.
+
+    The attributes may be set by subclassing, or by passing them as keyword args.
+
+    .. code-block:: python
+
+        class PostFilter(FilterSet):
+            cost_policy = LookupCostPolicy(max_cost=20, max_regex_length=50)
+
+    Args:
+        **kwargs: Overrides for the policy's attributes.
+
+    Raises:
+        TypeError: If a keyword arg is not a policy attribute.
+    """
+
+    # The weights of lookups and transforms that can't generally use an index.
+    weights = {
+        'iexact': 2,
+        'istartswith': 2,
+        'contains': 5,
+        'icontains': 5,
+        'endswith': 5,
+        'iendswith': 5,
+        'regex': 10,
+        'iregex': 10,
+        'search': 10,
+        'unaccent': 5,
+        'date': 3,
+        'time': 3,
+        'year': 3,
+        'iso_year': 3,
+        'quarter': 3,
+        'month': 3,
+        'week': 3,
+        'day': 3,
+        'week_day': 3,
+        'iso_week_day': 3,
+        'hour': 3,
+        'minute': 3,
+        'second': 3,
+    }
+    # The weight of lookups and transforms that are not in ``weights``.
+    default_weight = 1
+
+    # The maximum total cost of a filterset's filters, or ``None`` for no limit.
+    max_cost = None
+    # The maximum length of ``regex`` and ``iregex`` values, or ``None`` for no limit.
+    max_regex_length = None
+    # The cost at which filters must be paired with an indexed filter.
+    paired_cost = None
+    # The number of rows above which leading-wildcard lookups must be paired.
+    max_scan_rows = None
+    # How long (in seconds) the row counts for ``max_scan_rows`` are cached.
+    row_count_timeout = 300
+
+    regex_lookups = frozenset(['regex', 'iregex'])
+    leading_wildcard_lookups = frozenset([
+        'contains', 'icontains', 'endswith', 'iendswith', 'regex', 'iregex', 'search',
+    ])
+    # Lookups that can use the index of an indexed field.
+    indexed_lookups = frozenset([
+        'exact', 'in', 'gt', 'gte', 'lt', 'lte', 'range', 'isnull', 'startswith',
+    ])
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            if not hasattr(type(self), key):
+                raise TypeError("'%s' is not a cost policy attribute." % key)
+            setattr(self, key, value)
+
+        self._row_counts = {}
+
+    def get_lookups(self, f):
+        """Get the lookups and transforms of a filter.
+
+        Args:
+            f: The filter instance.
+
+        Returns:
+            The list of lookup and transform names.
+        """
+        return f.lookup_expr.split(LOOKUP_SEP)
+
+    def get_cost(self, f):
+        """Get the cost of a filter.
+
+        Args:
+            f: The filter instance.
+
+        Returns:
+            The sum of the weights of the filter's lookups and transforms.
+        """
+        lookups = self.get_lookups(f)
+        return sum(self.weights.get(lookup, self.default_weight) for lookup in lookups)
+
+    def is_indexed(self, f, model):
+        """Determine if the filter ``f`` can use the index of its model field.
+
+        Args:
+            f: The filter instance.
+            model: The filterset's model.
+
+        Returns:
+            ``True`` if the filter's field is indexed and its lookups can use the index.
+        """
+        field = get_model_field(model, f.field_name)
+        if field is None or f.exclude or f.method is not None:
+            return False
+
+        indexed = field.primary_key or field.unique or field.db_index
+        return indexed and self.indexed_lookups.issuperset(self.get_lookups(f))
+
+    def estimate_rows(self, queryset):
+        """Estimate the number of rows scanned by filtering the ``queryset``.
+
+        The row count of the model's table is cached for ``row_count_timeout``
+        seconds. Override this method to use the database's statistics instead.
+
+        Args:
+            queryset: The filterset's queryset.
+
+        Returns:
+            The estimated number of rows.
+        """
+        model = queryset.model
+        count, expires = self._row_counts.get(model, (None, 0))
+        if count is None or expires < time.monotonic():
+            count = model._default_manager.count()
+            self._row_counts[model] = (count, time.monotonic() + self.row_count_timeout)
+
+        return count
+
+    def requires_index(self, f, filterset):
+        """Determine if the filter ``f`` must be paired with an indexed filter.
+
+        Args:
+            f: The filter instance.
+            filterset: The filterset instance.
+
+        Returns:
+            ``True`` if the filter is too expensive to be used on its own.
+        """
+        if self.paired_cost is not None and self.get_cost(f) >= self.paired_cost:
+            return True
+
+        if self.max_scan_rows is None \
+                or self.leading_wildcard_lookups.isdisjoint(self.get_lookups(f)):
+            return False
+        return self.estimate_rows(filterset.queryset) > self.max_scan_rows
+
+    def get_active_filters(self, filterset, cleaned_data, prefix=None):
+        """Get the filters with values, including those of the related filtersets.
+
+        Args:
+            filterset: The filterset instance.
+            cleaned_data: The filterset form's cleaned data.
+            prefix (str, optional): The relationship that prefixes the filter names.
+
+        Returns:
+            A list of ``(filter name, filter, value, filterset)`` tuples. The names of
+            related filters are prefixed by their relationship (e.g.,
+            ``author__username``).
+        """
+        def prefixed(name):
+            return LOOKUP_SEP.join([prefix, name]) if prefix else name
+
+        active = [
+            (prefixed(name), filterset.filters[name], value, filterset)
+            for name, value in cleaned_data.items()
+            if name in filterset.filters and value not in EMPTY_VALUES
+        ]
+
+        related_filtersets = getattr(filterset, 'related_filtersets', {})
+        for related_name in related_filtersets:
+            if not filterset.has_related_data(related_name):
+                continue
+
+            related_filterset = related_filtersets[related_name]
+            related_filterset.is_valid()
+            active += self.get_active_filters(
+                related_filterset, related_filterset.form.cleaned_data,
+                prefixed(related_name),
+            )
+
+        return active
+
+    def get_pairing_errors(self, active):
+        """Check that expensive filters are paired with an indexed filter.
+
+        A filter must be paired with an indexed filter of its own filterset, as each
+        related filterset's table is filtered separately.
+
+        Args:
+            active: The active filters (see ``get_active_filters()``).
+
+        Returns:
+            A list of ``(filter name, error)`` pairs.
+        """
+        msg = _('This filter must be combined with a filter on an indexed field.')
+        filtersets = list(OrderedDict.fromkeys(fs for _n, _f, _v, fs in active))
+
+        errors = []
+        for filterset in filtersets:
+            filters = [(name, f) for name, f, _v, fs in active if fs is filterset]
+            model = filterset.queryset.model
+            if not any(self.is_indexed(f, model) for _name, f in filters):
+                errors += [
+                    (name, msg) for name, f in filters
+                    if self.requires_index(f, filterset)
+                ]
+
+        return errors
+
+    def get_errors(self, filterset, cleaned_data):
+        """Check the filters with values in the ``cleaned_data`` against the policy.
+
+        The filters of the related filtersets are also checked, and count towards the
+        ``max_cost`` of the request.
+
+        Args:
+            filterset: The filterset instance.
+            cleaned_data: The filterset form's cleaned data.
+
+        Returns:
+            A list of ``(filter name, error)`` pairs. Errors that apply to the whole
+            request have a ``None`` filter name.
+        """
+        active = self.get_active_filters(filterset, cleaned_data)
+
+        errors = []
+        for name, f, value, _filterset in active:
+            if self.max_regex_length is not None \
+                    and isinstance(value, str) and len(value) > self.max_regex_length \
+                    and self.regex_lookups.intersection(self.get_lookups(f)):
+                msg = _('Ensure this regular expression has at most %(limit)d '
+                        'characters.')
+                errors.append((name, msg % {'limit': self.max_regex_length}))
+
+        errors += self.get_pairing_errors(active)
+
+        cost = sum(self.get_cost(f) for _name, f, _value, _filterset in active)
+        if self.max_cost is not None and cost > self.max_cost:
+            msg = _('The cost of the requested filters (%(cost)d) exceeds the '
+                    'maximum of %(limit)d.')
+            errors.append((None, msg % {'cost': cost, 'limit': self.max_cost}))
+
+        return errors
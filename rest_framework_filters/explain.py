@@ -0,0 +1,269 @@
+import logging
+import re
+import warnings
+from collections import namedtuple
+
+from django.core.exceptions import EmptyResultSet
+from django.db.models import QuerySet
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import ValidationError
+
+from . import utils
+
+logger = logging.getLogger('rest_framework_filters.explain')
+
+FULL_SCAN = 'full_scan'
+TEMP_B_TREE = 'temp_b_tree'
+SUBQUERY_SCAN = 'subquery_scan'
+
+REJECT = 'reject'
+WARN = 'warn'
+LOG = 'log'
+
+# SQLite's `EXPLAIN QUERY PLAN` rows, formatted as "<id> <parent> <notused> <detail>"
+SQLITE_ROW_RE = re.compile(r'^(\d+) (\d+) \d+ (.*)$')
+# Full scans of a table, excluding index scans (SQLite & PostgreSQL).
+FULL_SCAN_RE = re.compile(
+    r'^(?:SCAN (?:TABLE )?(?!SUBQUERY\b|CONSTANT ROW\b)(\w+)'
+    r'(?!.* USING (?:COVERING )?INDEX)|Seq Scan on (\w+))',
+)
+TEMP_B_TREE_RE = re.compile(r'USE TEMP B-TREE|^Sort\b(?!\s*(?:Key|Method))')
+SUBQUERY_RE = re.compile(r'SUBQUERY|^(?:SubPlan|InitPlan)\b')
+
+# An issue found in a query plan, such as a full scan of a table.
+QueryPlanIssue = namedtuple('QueryPlanIssue', ['kind', 'table', 'detail'])
+
+# ``QuerySet.explain()`` was added in Django 2.1.
+SUPPORTS_EXPLAIN = hasattr(QuerySet, 'explain')
+
+
+class QueryPlanWarning(UserWarning):
+    pass
+
+
+def parse_plan(plan):
+    """Parse the output of ``QuerySet.explain()`` into its plan entries.
+
+    SQLite's plan rows reference their parent row, while other databases (such as
+    PostgreSQL) indent their nested plan nodes.
+
+    Args:
+        plan (str): The query plan.
+
+    Returns:
+        A list of ``(detail, ancestors)`` tuples, where ``ancestors`` are the details
+        of the entry's parent entries.
+    """
+    entries, details, stack = [], {}, []
+
+    for line in plan.splitlines():
+        if not line.strip():
+            continue
+
+        match = SQLITE_ROW_RE.match(line)
+        if match:
+            row_id, parent_id, detail = match.groups()
+            ancestors = details.get(parent_id, ())
+            details[row_id] = ancestors + (detail, )
+        else:
+            indent = len(line) - len(line.lstrip())
+            detail = line.strip()
+            if detail.startswith('->'):
+                detail = detail[2:].strip()
+
+            while stack and stack[-1][0] >= indent:
+                stack.pop()
+            ancestors = tuple(d for _indent, d in stack)
+            stack.append((indent, detail))
+
+        entries.append((detail, ancestors))
+
+    return entries
+
+
+def get_plan_issues(plan):
+    """Find the full scans, temporary B-trees, and subquery scans in a query plan.
+
+    Args:
+        plan (str): The query plan.
+
+    Returns:
+        A list of ``QueryPlanIssue`` tuples.
+    """
+    issues = []
+
+    for detail, ancestors in parse_plan(plan):
+        match = FULL_SCAN_RE.match(detail)
+        if match:
+            table = match.group(1) or match.group(2)
+            nested = any(SUBQUERY_RE.search(ancestor) for ancestor in ancestors)
+            kind = SUBQUERY_SCAN if nested else FULL_SCAN
+            issues.append(QueryPlanIssue(kind, table, detail))
+
+        elif TEMP_B_TREE_RE.search(detail):
+            issues.append(QueryPlanIssue(TEMP_B_TREE, None, detail))
+
+    return issues
+
+
+class ExplainPolicy:
+    """A policy that checks the query plan of a filtered queryset.
+
+    The queryset is explained with ``QuerySet.explain()`` (``EXPLAIN QUERY PLAN`` on
+    SQLite), and the plan is checked for full table scans, temporary B-trees (e.g.,
+    sorts that can't use an index), and scans within subqueries. Depending on the
+    ``action``, issues are rejected as a ``ValidationError``, emitted as a
+    ``QueryPlanWarning``, or logged. The issues are cached by the query's SQL, which
+    excludes the param values, so each query shape is only explained once. Query plans
+    are not checked on Django versions without ``QuerySet.explain()`` (before 2.1).
+
+    .. code-block:: python
+
+        class FilterBackend(RestFrameworkFilterBackend):
+            explain_policy = ExplainPolicy(action='reject', ignored_tables={'auth_group'})
+
+    Args:
+        **kwargs: Overrides for the policy's attributes.
+
+    Raises:
+        TypeError: If a keyword arg is not a policy attribute.
+        ValueError: If the ``action`` is not valid.
+    """
+
+    # The kinds of issues to check for.
+    checks = frozenset([FULL_SCAN, TEMP_B_TREE, SUBQUERY_SCAN])
+    # Either 'reject', 'warn', or 'log'.
+    action = WARN
+    # Tables that may be scanned (e.g., small lookup tables).
+    ignored_tables = frozenset()
+    # The number of query shapes to cache the issues for.
+    maxsize = 256
+
+    messages = {
+        FULL_SCAN: _("The filtered query scans the full '%(table)s' table."),
+        TEMP_B_TREE: _('The filtered query uses a temporary B-tree.'),
+        SUBQUERY_SCAN: _("The filtered query scans the full '%(table)s' table within "
+                         "a subquery."),
+    }
+
+    def __init__(self, **kwargs):
+        for key, value in kwargs.items():
+            if not hasattr(type(self), key):
+                raise TypeError("'%s' is not an explain policy attribute." % key)
+            setattr(self, key, value)
+
+        if self.action not in (REJECT, WARN, LOG):
+            raise ValueError(
+                "Invalid explain policy action '%s'. Expected one of: %s." % (
+                    self.action, ', '.join([REJECT, WARN, LOG])),
+            )
+
+        self.cache = utils.LRUCache(maxsize=self.maxsize)
+
+        if not SUPPORTS_EXPLAIN:
+            warnings.warn(
+                'Query plans are not checked, as QuerySet.explain() requires Django 2.1 '
+                'or later.', RuntimeWarning, stacklevel=2,
+            )
+
+    def explain(self, queryset):
+        """Get the query plan of the ``queryset``.
+
+        Args:
+            queryset: The filtered queryset.
+
+        Returns:
+            The query plan, as formatted by ``QuerySet.explain()``.
+        """
+        return queryset.explain()
+
+    def get_issues(self, queryset):
+        """Get the issues in the query plan of the ``queryset``, using the cache.
+
+        Args:
+            queryset: The filtered queryset.
+
+        Returns:
+            A list of the ``QueryPlanIssue`` tuples that violate the policy.
+        """
+        sql, _params = queryset.query.sql_with_params()
+        key = (queryset.db, sql)
+
+        issues = self.cache.get(key)
+        if issues is None:
+            issues = tuple(
+                issue for issue in get_plan_issues(self.explain(queryset))
+                if issue.kind in self.checks and issue.table not in self.ignored_tables
+            )
+            self.cache.set(key, issues)
+
+        return list(issues)
+
+    def get_introduced_issues(self, queryset, base):
+        """Get the issues in the query plan of the ``queryset`` that its filtering added.
+
+        Issues that are also in the query plan of the unfiltered ``base`` queryset
+        (e.g., a sort by the view's ordering) are not reported, except for a full scan
+        of the queryset's own table, which the filtering is expected to avoid. If the
+        querysets have the same SQL, then no filtering was applied, and neither
+        queryset is explained.
+
+        Args:
+            queryset: The filtered queryset.
+            base: The unfiltered queryset.
+
+        Returns:
+            A list of ``QueryPlanIssue`` tuples.
+        """
+        sql, _params = queryset.query.sql_with_params()
+        base_sql, _params = base.query.sql_with_params()
+        if sql == base_sql:
+            return []
+
+        issues = self.get_issues(queryset)
+        if not issues:
+            return issues
+
+        table = queryset.model._meta.db_table
+        known = {
+            (issue.kind, issue.table) for issue in self.get_issues(base)
+            if not (issue.kind == FULL_SCAN and issue.table == table)
+        }
+        return [issue for issue in issues if (issue.kind, issue.table) not in known]
+
+    def check(self, queryset, base=None):
+        """Check the query plan of the ``queryset``, and apply the policy's ``action``.
+
+        Args:
+            queryset: The filtered queryset.
+            base: The unfiltered queryset. If provided, only the issues introduced by
+                the filtering are reported (see ``get_introduced_issues()``).
+
+        Raises:
+            ValidationError: If the action is ``'reject'`` and the plan has issues.
+        """
+        if not SUPPORTS_EXPLAIN:
+            return
+
+        try:
+            if base is None:
+                issues = self.get_issues(queryset)
+            else:
+                issues = self.get_introduced_issues(queryset, base)
+        except EmptyResultSet:
+            # the queryset is empty, and doesn't query the database
+            return
+
+        errors = [
+            self.messages[issue.kind] % {'table': issue.table} for issue in issues
+        ]
+        if not errors:
+            return
+
+        if self.action == REJECT:
+            raise ValidationError(errors)
+        for error in errors:
+            if self.action == WARN:
+                warnings.warn(str(error), QueryPlanWarning, stacklevel=2)
+            else:
+                logger.warning(str(error))
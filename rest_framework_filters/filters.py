@@ -8,6 +8,14 @@ from django_filters.rest_framework.filters import (
 
 ALL_LOOKUPS = '__all__'
 
+# Strategies for filtering a queryset by a related filterset.
+# See: :meth:`rest_framework_filters.filterset.FilterSet.filter_related_filterset`
+SUBQUERY = 'subquery'
+JOIN = 'join'
+EXISTS = 'exists'
+MATERIALIZE = 'materialize'
+RELATED_STRATEGIES = (SUBQUERY, JOIN, EXISTS, MATERIALIZE)
+
 
 class AutoFilter:
     """A placeholder class that enables generating multiple per-lookup filters.
@@ -45,13 +53,25 @@ class AutoFilter:
     the ``FilterSet.filters``. In the above example, ``title`` would not be
     filterable. However, an ``AutoFilter`` is typically replaced by a generated
     ``exact`` filter of the same name, which enables filtering by that param.
+
+    A ``dynamic`` ``AutoFilter`` is not expanded into its per-lookup filters when the
+    filterset class is created. Instead, the lookup is parsed from the param name,
+    and its filter is built on demand. This reduces the memory and class creation
+    overhead of filters with many lookups (e.g., ``'__all__'`` lookups for date
+    fields), while accepting the same params.
+
+    .. code-block:: python
+
+        class PostFilter(filters.FilterSet):
+            publish_date = AutoFilter(lookups='__all__', dynamic=True)
     """
 
     creation_counter = 0
 
-    def __init__(self, field_name=None, *, lookups=None):
+    def __init__(self, field_name=None, *, lookups=None, dynamic=False):
         self.field_name = field_name
         self.lookups = lookups or []
+        self.dynamic = dynamic
 
         self.creation_counter = AutoFilter.creation_counter
         AutoFilter.creation_counter += 1
@@ -59,10 +79,19 @@ class AutoFilter:
 
 class BaseRelatedFilter:
 
-    def __init__(self, filterset, *args, lookups=None, **kwargs):
+    def __init__(self, filterset, *args, lookups=None, strategy=None,
+                 materialize_threshold=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.filterset = filterset
         self.lookups = lookups or []
+        self.materialize_threshold = materialize_threshold
+
+        if strategy is not None and strategy not in RELATED_STRATEGIES:
+            raise ValueError(
+                "Invalid related filter strategy '%s'. Expected one of: %s."
+                % (strategy, ', '.join(RELATED_STRATEGIES)),
+            )
+        self.strategy = strategy
 
     def bind_filterset(self, filterset):
         """Bind a filterset class to the filter instance.
@@ -141,6 +170,12 @@ class RelatedFilter(BaseRelatedFilter, ModelChoiceFilter):
             located in the same module as the origin filterset.
         lookups: A list of lookups to generate per-lookup filters for. This
             functions similarly to the ``AutoFilter.lookups`` argument.
+        strategy: How the queryset is filtered by the related filterset, either
+            ``'subquery'``, ``'join'``, ``'exists'``, or ``'materialize'``. Defaults
+            to the ``FilterSet.related_strategy``.
+        materialize_threshold: The maximum number of related values that are inlined
+            by the ``'materialize'`` strategy. Defaults to the
+            ``FilterSet.materialize_threshold``.
     """
 
 
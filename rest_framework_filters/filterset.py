@@ -1,12 +1,33 @@
 import copy
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple
+from collections.abc import Mapping
 
+import django
+from django.core.exceptions import NON_FIELD_ERRORS
+from django.db.models import Exists, OuterRef, Q
 from django.db.models.constants import LOOKUP_SEP
+from django.utils.datastructures import MultiValueDict
 from django_filters import filterset, rest_framework
+from django_filters.conf import settings
+from django_filters.filters import FilterMethod
 from django_filters.utils import get_model_field
 
 from . import filters, utils
 
+# The resolved filters, exclusions, and related params for a set of request params.
+# See: :meth:`rest_framework_filters.filterset.FilterSet.get_filter_plan`
+FilterPlan = namedtuple('FilterPlan', ['filters', 'excluded', 'related'])
+
+# The size of the query for a set of request params, across all related filtersets.
+# See: :meth:`rest_framework_filters.filterset.FilterSet.get_query_complexity`
+QueryComplexity = namedtuple(
+    'QueryComplexity', ['depth', 'related_filtersets', 'filters'],
+)
+
+# The resolved model field and lookups for an auto filter.
+# See: :meth:`rest_framework_filters.filterset.FilterSetMetaclass.resolve_auto_filters`
+AutoFilterLookups = namedtuple('AutoFilterLookups', ['field', 'field_name', 'lookups'])
+
 
 def related(filterset, filter_name):
     # Return a related filter_name, using the filterset relationship if present.
@@ -15,6 +36,50 @@ def related(filterset, filter_name):
     return LOOKUP_SEP.join([filterset.relationship, filter_name])
 
 
+def warmup(filtersets=None, *, depth=1):
+    """Prepare filterset classes before serving requests.
+
+    This resolves the string references of related filtersets, which are otherwise
+    imported on first access, and prebuilds the subset-disabled classes used to
+    render forms (e.g., by the browsable API). This should be called once the
+    filterset modules have been imported, such as from ``AppConfig.ready()``.
+
+    Args:
+        filtersets: An iterable of filterset classes. Defaults to all subclasses of
+            ``FilterSet``.
+        depth (int, optional): The depth of the subset-disabled classes to prebuild.
+
+    Returns:
+        The list of filterset classes that were prepared.
+    """
+    if filtersets is None:
+        filtersets = OrderedDict.fromkeys(iter_filtersets(FilterSet))
+
+    prepared = []
+    for filterset_class in filtersets:
+        # subset-disabled classes are built from the other filtersets.
+        if issubclass(filterset_class, SubsetDisabledMixin):
+            continue
+
+        # accessing the filterset resolves its string reference
+        for f in filterset_class.related_filters.values():
+            f.filterset
+
+        if filterset_class._meta.model is not None:
+            filterset_class.disable_subset(depth=depth)
+
+        prepared.append(filterset_class)
+
+    return prepared
+
+
+def iter_filtersets(filterset_class):
+    # Recursively iterate over the subclasses of a filterset class.
+    for subclass in filterset_class.__subclasses__():
+        yield subclass
+        yield from iter_filtersets(subclass)
+
+
 class FilterSetMetaclass(filterset.FilterSetMetaclass):
     def __new__(cls, name, bases, attrs):
         attrs['auto_filters'] = cls.get_auto_filters(bases, attrs)
@@ -29,15 +94,39 @@ class FilterSetMetaclass(filterset.FilterSetMetaclass):
         for f in new_class.related_filters.values():
             f.bind_filterset(new_class)
 
+        # Dynamic auto filters are not expanded, and their filters are built on demand.
+        # See: :meth:`rest_framework_filters.filterset.FilterSet.get_dynamic_filter`
+        new_class.dynamic_lookups = OrderedDict()
+        new_class.dynamic_filters = {}
+
         # Only expand when model is defined. Model may be undefined for mixins.
         if new_class._meta.model is not None:
+            auto_filters, dynamic_filters = OrderedDict(), OrderedDict()
             for name, f in new_class.auto_filters.items():
-                expanded = cls.expand_auto_filter(new_class, name, f)
-                new_class.base_filters.update(expanded)
+                if f.dynamic:
+                    dynamic_filters[name] = f
+                else:
+                    auto_filters[name] = f
+            auto_filters.update(new_class.related_filters)
+
+            expanded = cls.expand_auto_filters(new_class, auto_filters)
+            new_class.base_filters.update(expanded)
+
+            if dynamic_filters:
+                resolved = cls.resolve_auto_filters(new_class, dynamic_filters)
+                new_class.dynamic_lookups.update(
+                    (name, r._replace(lookups=frozenset(r.lookups)))
+                    for name, r in resolved.items()
+                )
+
+        # See: :meth:`rest_framework_filters.filterset.FilterSet.get_param_filter_name`
+        new_class.param_filter_names = cls.get_param_filter_names(new_class)
 
-            for name, f in new_class.related_filters.items():
-                expanded = cls.expand_auto_filter(new_class, name, f)
-                new_class.base_filters.update(expanded)
+        # See: :meth:`rest_framework_filters.filterset.FilterSet.get_exclusion_filter`
+        new_class.exclusion_filters = {}
+
+        # See: :meth:`rest_framework_filters.filterset.FilterSet.disable_subset`
+        new_class.subset_disabled_classes = {}
 
         return new_class
 
@@ -70,6 +159,25 @@ class FilterSetMetaclass(filterset.FilterSetMetaclass):
 
         return OrderedDict(auto_filters)
 
+    @classmethod
+    def get_param_filter_names(cls, new_class):
+        """Compile the map of local param names to the filter names they resolve to.
+
+        This includes both the regular filter names and their exclusion (``!``) names,
+        allowing a param to be resolved with a single lookup instead of repeated string
+        manipulation. Regular names take precedence over exclusion names.
+
+        Args:
+            new_class: The ``FilterSet`` class to compile the param names for.
+
+        Returns:
+            A map of ``{param names: filter names}``.
+        """
+        param_filter_names = {'%s!' % name: name for name in new_class.base_filters}
+        param_filter_names.update((name, name) for name in new_class.base_filters)
+
+        return param_filter_names
+
     @classmethod
     def expand_auto_filter(cls, new_class, filter_name, f):
         """Resolve an ``AutoFilter`` into its per-lookup filters.
@@ -87,49 +195,235 @@ class FilterSetMetaclass(filterset.FilterSetMetaclass):
         Returns:
             A named map of generated filter objects.
         """
-        expanded = OrderedDict()
+        return cls.expand_auto_filters(new_class, OrderedDict([(filter_name, f)]))
 
-        # get reference to opts/declared filters so originals aren't modified
-        orig_meta, orig_declared = new_class._meta, new_class.declared_filters
-        new_class._meta = copy.deepcopy(new_class._meta)
-        new_class.declared_filters = {}
+    @classmethod
+    def expand_auto_filters(cls, new_class, auto_filters):
+        """Resolve multiple ``AutoFilter``s into their per-lookup filters in one pass.
 
-        # Use meta.fields to generate auto filters
-        new_class._meta.fields = {f.field_name: f.lookups or []}
-        for gen_name, gen_f in new_class.get_filters().items():
-            # get_filters() generates param names from the model field name, so
-            # replace the field name with the param name from the filerset
-            gen_name = gen_name.replace(f.field_name, filter_name, 1)
+        The lookups for all of the filters are resolved with a single ``get_fields()``
+        call, and each model field is only resolved once. Generated filters do not
+        overwrite the declared filters.
 
-            # do not overwrite declared filters
-            if gen_name not in orig_declared:
-                expanded[gen_name] = gen_f
+        Args:
+            new_class: The ``FilterSet`` class to generate filters for.
+            auto_filters: A map of ``{attribute names: filter instances}``.
 
-        # restore reference to opts/declared filters
-        new_class._meta, new_class.declared_filters = orig_meta, orig_declared
+        Returns:
+            A named map of generated filter objects.
+        """
+        expanded, generated = OrderedDict(), {}
+        resolved = cls.resolve_auto_filters(new_class, auto_filters)
+
+        for filter_name, (field, field_name, lookups) in resolved.items():
+            for lookup_expr in lookups:
+                # get_filter_name() generates param names from the model field name, so
+                # replace the field name with the param name from the filerset
+                gen_name = new_class.get_filter_name(field_name, lookup_expr)
+                gen_name = gen_name.replace(field_name, filter_name, 1)
+
+                # do not overwrite declared filters
+                if gen_name in new_class.declared_filters:
+                    continue
+
+                # filters generated for the same lookup by multiple aliases are copied
+                key = (field_name, lookup_expr)
+                if key in generated:
+                    expanded[gen_name] = copy.deepcopy(generated[key])
+                else:
+                    expanded[gen_name] = generated[key] = new_class.filter_for_field(
+                        field, field_name, lookup_expr,
+                    )
 
         return expanded
 
+    @classmethod
+    def resolve_auto_filters(cls, new_class, auto_filters):
+        """Resolve the model fields and lookups of the ``auto_filters``.
+
+        Filters for fields in ``Meta.exclude`` are omitted.
+
+        Args:
+            new_class: The ``FilterSet`` class to resolve the filters for.
+            auto_filters: A map of ``{attribute names: filter instances}``.
+
+        Returns:
+            A map of ``{attribute names: AutoFilterLookups}``.
+
+        Raises:
+            TypeError: If a filter's field name is not a model field.
+        """
+        resolved = OrderedDict()
+        fields = cls.get_auto_filter_fields(new_class, auto_filters.values())
+        model_fields, undefined = {}, []
+
+        for filter_name, f in auto_filters.items():
+            field_name = f.field_name
+
+            # Field is in 'Meta.exclude'
+            if field_name not in fields:
+                continue
+
+            if field_name not in model_fields:
+                model = new_class._meta.model
+                model_fields[field_name] = get_model_field(model, field_name)
+            field = model_fields[field_name]
+
+            if field is None:
+                undefined.append(field_name)
+                continue
+
+            lookups = f.lookups or []
+            if lookups == filters.ALL_LOOKUPS:
+                lookups = fields[field_name]
+
+            resolved[filter_name] = AutoFilterLookups(field, field_name, lookups)
+
+        if undefined:
+            raise TypeError(
+                "'Meta.fields' must not contain non-model field names: %s"
+                % ', '.join(undefined),
+            )
+
+        return resolved
+
+    @classmethod
+    def get_auto_filter_fields(cls, new_class, auto_filters):
+        """Resolve the combined lookups of the ``auto_filters`` with ``get_fields()``.
+
+        Args:
+            new_class: The ``FilterSet`` class to resolve the fields for.
+            auto_filters: An iterable of filter instances.
+
+        Returns:
+            A map of ``{model field names: lookups}``, sans the excluded fields.
+        """
+        fields = OrderedDict()
+        for f in auto_filters:
+            lookups = f.lookups or []
+
+            if filters.ALL_LOOKUPS in (lookups, fields.get(f.field_name)):
+                fields[f.field_name] = filters.ALL_LOOKUPS
+            else:
+                current = fields.setdefault(f.field_name, [])
+                current.extend(lookup for lookup in lookups if lookup not in current)
+
+        # swap in a shallow copy of the options so the originals aren't modified
+        orig_meta = new_class._meta
+        new_class._meta = copy.copy(orig_meta)
+        new_class._meta.fields = fields
+
+        try:
+            return new_class.get_fields()
+        finally:
+            new_class._meta = orig_meta
+
+
+class RelatedFiltersets(Mapping):
+    """A mapping of related filtersets that are lazily initialized on first access.
+
+    Args:
+        filterset: The parent filterset instance.
+        related_names: The names of the related filters to create filtersets for.
+    """
+
+    def __init__(self, filterset, related_names):
+        self.filterset = filterset
+        self.related_names = OrderedDict.fromkeys(related_names)
+        self.filtersets = {}
+
+    def __getitem__(self, related_name):
+        if related_name not in self.related_names:
+            raise KeyError(related_name)
+
+        try:
+            return self.filtersets[related_name]
+        except KeyError:
+            related_filterset = self.filterset.get_related_filterset(related_name)
+            return self.filtersets.setdefault(related_name, related_filterset)
+
+    def __iter__(self):
+        return iter(self.related_names)
+
+    def __len__(self):
+        return len(self.related_names)
+
+    def __repr__(self):
+        return '<%s: %s>' % (type(self).__name__, list(self.related_names))
+
 
 class SubsetDisabledMixin:
     """Disable filter subsetting (see: :meth:`FilterSet.disable_subset`)."""
 
     @classmethod
     def get_filter_subset(cls, params, rel=None):
-        return cls.base_filters
+        if not cls.dynamic_lookups:
+            return cls.base_filters
+
+        # dynamic filters can't be enumerated, so include those used by the params.
+        subset = cls.base_filters.copy()
+        subset.update(super().get_filter_subset(params, rel))
+        return subset
 
 
 class FilterSet(rest_framework.FilterSet, metaclass=FilterSetMetaclass):
+    # Deep copy the filters when binding them to a filterset instance, instead of
+    # creating lightweight copies. This may be necessary for custom filters that
+    # mutate nested state (other than ``extra``) during the request.
+    deepcopy_filters = False
+
+    # The default strategy for filtering by related filtersets, either 'subquery',
+    # 'join', 'exists', or 'materialize'. See: :meth:`.filter_related_filterset()`
+    related_strategy = filters.SUBQUERY
+
+    # The maximum number of related values that the 'materialize' strategy inlines
+    # into the query. See: :meth:`.materialize_related_filterset()`
+    materialize_threshold = 100
+
+    # Counter of the 'materialize' strategy's outcomes per relationship, or ``None`` to
+    # disable recording. See: :meth:`.materialize_related_filterset()`
+    materialize_stats = None
+
+    # Cache of filter plans, shared by all filterset classes. Replace the cache to
+    # change its size, or set to ``None`` to disable caching.
+    plan_cache = utils.LRUCache(maxsize=256)
+
+    # Policy that limits the cost of the request's filters, or ``None`` for no limits.
+    # See: :class:`rest_framework_filters.costs.LookupCostPolicy`
+    cost_policy = None
+
+    # Counter of the lookup paths used by requests, or ``None`` to disable recording.
+    # See: :class:`rest_framework_filters.indexes.IndexAdvisor`
+    usage = None
 
     def __init__(self, data=None, queryset=None, *, relationship=None, **kwargs):
-        self.base_filters = self.get_filter_subset(data or {}, relationship)
+        self.plan = self.get_filter_plan(data or {}, relationship)
+        base_filters = self.plan.filters
+        if self.usage is not None:
+            self.record_usage()
 
+        # Prevent django-filter from deep copying the filters, as they are bound below.
+        self.base_filters = OrderedDict()
         super().__init__(data, queryset, **kwargs)
+        self.base_filters = base_filters
+        self.filters = self.bind_filters(base_filters)
 
         self.relationship = relationship
         self.related_filtersets = self.get_related_filtersets()
         self.filters = self.get_request_filters()
 
+    def record_usage(self):
+        """Count the lookup paths of the request's filters in the ``usage`` counter.
+
+        Related filters and method filters are not counted, as their lookups are
+        recorded by the related filterset or are unknown.
+        """
+        model = self._meta.model
+        for f in self.plan.filters.values():
+            if f.method is None and not isinstance(f, filters.BaseRelatedFilter):
+                path = LOOKUP_SEP.join([f.field_name, f.lookup_expr])
+                self.usage[utils.get_usage_key(model, path)] += 1
+
     @classmethod
     def get_fields(cls):
         # Extend the 'Meta.fields' dict syntax to allow '__all__' field lookups.
@@ -152,7 +446,7 @@ class FilterSet(rest_framework.FilterSet, metaclass=FilterSetMetaclass):
 
         A filterset may have a large number of filters, and selecting the subset based on
         the request ``params`` minimizes the cost of initialization by reducing the total
-        number of expensive deepcopy operations. See :meth:`.get_param_filter_name()`
+        number of filters that need to be bound. See :meth:`.get_param_filter_name()`
         for a better understanding of how the filter names are resolved.
 
         Args:
@@ -168,16 +462,142 @@ class FilterSet(rest_framework.FilterSet, metaclass=FilterSetMetaclass):
         # removed, as they indicate an unknown field eg, author__foobar__isnull
         filter_names = {cls.get_param_filter_name(param, rel) for param in params}
         filter_names = {f for f in filter_names if f is not None}
-        return OrderedDict(
+        subset = OrderedDict(
             (k, v) for k, v in cls.base_filters.items() if k in filter_names
         )
 
+        # dynamic filters are not present in the base filters
+        if cls.dynamic_lookups:
+            for name in sorted(filter_names.difference(subset)):
+                f = cls.get_dynamic_filter(name)
+                if f is not None:
+                    subset[name] = f
+
+        return subset
+
+    @classmethod
+    def get_filter_plan(cls, params, rel=None):
+        """Get the filter plan for the request ``params``, using the ``plan_cache``.
+
+        Requests tend to reuse the same set of param names with varying values, so the
+        plan is cached by the filterset class, the param names, and the relationship.
+
+        Args:
+            params: The request's query params.
+            rel (str, optional): The relationship the ``params`` are resolved against.
+
+        Returns:
+            The ``FilterPlan`` for the ``params``.
+        """
+        if cls.plan_cache is None:
+            return cls.build_filter_plan(params, rel)
+
+        key = (cls, frozenset(params), rel)
+        plan = cls.plan_cache.get(key)
+        if plan is None:
+            plan = cls.build_filter_plan(params, rel)
+            cls.plan_cache.set(key, plan)
+
+        return plan
+
+    @classmethod
+    def build_filter_plan(cls, params, rel=None):
+        """Resolve the request ``params`` into a filter plan.
+
+        The plan consists of:
+
+        - ``filters``: The filter subset. See :meth:`.get_filter_subset()`.
+        - ``excluded``: The names of the subset filters that have exclusion params.
+        - ``related``: A map of the related filter names to the params that traverse
+          their relationship. Related filters without params are not included.
+
+        Args:
+            params: The request's query params.
+            rel (str, optional): The relationship the ``params`` are resolved against.
+
+        Returns:
+            The ``FilterPlan`` for the ``params``.
+        """
+        subset = cls.get_filter_subset(params, rel)
+        prefix = '%s%s' % (rel, LOOKUP_SEP) if rel else ''
+
+        excluded = set()
+        related_params = OrderedDict(
+            (name, []) for name in cls.related_filters if name in subset
+        )
+
+        # Partition the params in a single pass, grouping the params that traverse
+        # each related filter's relationship by their leading related filter names.
+        for param in params:
+            if not param.startswith(prefix):
+                continue
+
+            name = param[len(prefix):]
+            if name.endswith('!'):
+                excluded.add(name[:-1])
+
+            index = name.find(LOOKUP_SEP)
+            while index > 0:
+                if name[:index] in related_params:
+                    related_params[name[:index]].append(param)
+                index = name.find(LOOKUP_SEP, index + 1)
+
+        return FilterPlan(
+            subset,
+            frozenset(excluded.intersection(subset)),
+            OrderedDict((k, tuple(v)) for k, v in related_params.items() if v),
+        )
+
+    @classmethod
+    def get_query_complexity(cls, params, rel=None):
+        """Measure the size of the query for the request ``params``.
+
+        The complexity is computed from the filter plans of this filterset class and
+        its related filterset classes, without initializing any filtersets. This
+        allows clients' requests to be rejected before any filtering work is done.
+
+        The complexity consists of:
+
+        - ``depth``: The maximum number of relationships traversed by a param.
+        - ``related_filtersets``: The total number of related filtersets (and their
+          subqueries) needed to filter the queryset.
+        - ``filters``: The total number of params that are applied by filters,
+          including exclusion params.
+
+        Args:
+            params: The request's query params.
+            rel (str, optional): The relationship the ``params`` are resolved against.
+
+        Returns:
+            The ``QueryComplexity`` of the ``params``.
+        """
+        plan = cls.get_filter_plan(params, rel)
+        traversing = {param for related in plan.related.values() for param in related}
+
+        depth = related_filtersets = 0
+        filters = sum(
+            1 for param in params
+            if param not in traversing and cls.get_param_filter_name(param, rel)
+        )
+
+        for related_name, related_params in plan.related.items():
+            filterset_class = cls.related_filters[related_name].filterset
+            related_rel = LOOKUP_SEP.join([rel, related_name]) if rel else related_name
+            complexity = filterset_class.get_query_complexity(related_params, related_rel)
+
+            depth = max(depth, complexity.depth + 1)
+            related_filtersets += complexity.related_filtersets + 1
+            filters += complexity.filters
+
+        return QueryComplexity(depth, related_filtersets, filters)
+
     @classmethod
     def disable_subset(cls, *, depth=0):
         """Disable filter subsetting, allowing a form to render the complete filterset.
 
         Note that this decreases performance and should only be used when rendering a
-        form, such as with DRF's browsable API.
+        form, such as with DRF's browsable API. The subset-disabled classes are cached
+        per filterset class and ``depth``.
 
         Args:
             depth (int, optional): Disable related filterset subsetting to this depth.
@@ -186,22 +606,34 @@ class FilterSet(rest_framework.FilterSet, metaclass=FilterSetMetaclass):
         Returns:
             This filterset class with subset disabling mixed in.
         """
+        try:
+            return cls.subset_disabled_classes[depth]
+        except KeyError:
+            pass
+
         if not issubclass(cls, SubsetDisabledMixin):
-            cls = type('SubsetDisabled%s' % cls.__name__,
-                       (SubsetDisabledMixin, cls), {})
+            disabled = type('SubsetDisabled%s' % cls.__name__,
+                            (SubsetDisabledMixin, cls), {})
+        elif depth > 0:
+            # subclass to prevent modifying the related filters of an already
+            # subset-disabled class.
+            disabled = type(cls.__name__, (cls, ), {})
+        else:
+            disabled = cls
 
         # recursively disable subset for related filtersets
         if depth > 0:
             # shallow copy to prevent modifying original `base_filters`
-            cls.base_filters = cls.base_filters.copy()
+            disabled.base_filters = disabled.base_filters.copy()
+            disabled.exclusion_filters = {}
 
             # deepcopy RelateFilter to prevent modifying original `.filterset`
-            for name in cls.related_filters:
-                f = copy.deepcopy(cls.base_filters[name])
+            for name in disabled.related_filters:
+                f = copy.deepcopy(disabled.base_filters[name])
                 f.filterset = f.filterset.disable_subset(depth=depth - 1)
-                cls.base_filters[name] = f
+                disabled.base_filters[name] = f
 
-        return cls
+        return cls.subset_disabled_classes.setdefault(depth, disabled)
 
     @classmethod
     def get_param_filter_name(cls, param, rel=None):
@@ -248,21 +680,71 @@ class FilterSet(rest_framework.FilterSet, metaclass=FilterSetMetaclass):
         if rel and param.startswith(prefix):
             param = param[len(prefix):]
 
-        # Attempt to match against filters with lookups first. (username__endswith)
-        if param in cls.base_filters:
-            return param
+        # Attempt to match against filters with lookups first (username__endswith),
+        # then against exclusion filters (username__endswith!).
+        name = cls.param_filter_names.get(param)
+        if name is not None:
+            return name
 
-        # Attempt to match against exclusion filters
-        if param[-1] == '!' and param[:-1] in cls.base_filters:
-            return param[:-1]
+        # Match against dynamic filters, which are not present in the base filters.
+        if cls.dynamic_lookups:
+            for name in (param, param[:-1] if param.endswith('!') else None):
+                if name and cls.get_dynamic_filter(name) is not None:
+                    return name
 
         # Match against relationships. (author__username__endswith).
-        # Preference more specific filters. eg, `note__author` over `note`.
-        for name in sorted(cls.related_filters, reverse=True):
+        # Preference more specific filters. eg, `note__author` over `note`. Walking the
+        # separators from right to left guarantees that the longest match wins. Note that
+        # separators may overlap (e.g., `note___author`), so each position is checked.
+        index = param.rfind(LOOKUP_SEP)
+        while index > 0:
             # we need to match against '__' to prevent eager matching against
             # like names. eg, note vs note2. Exact matches are handled above.
-            if param.startswith("%s%s" % (name, LOOKUP_SEP)):
+            name = param[:index]
+            if name in cls.related_filters:
                 return name
+            index = param.rfind(LOOKUP_SEP, 0, index + 1)
+
+    def bind_filters(self, base_filters):
+        """Bind the ``base_filters`` to this filterset instance.
+
+        Args:
+            base_filters: Mapping of the class-level ``{filter names: filter instances}``.
+
+        Returns:
+            Mapping of the bound ``{filter names: filter instances}``.
+        """
+        return OrderedDict(
+            (name, self.bind_filter(f)) for name, f in base_filters.items()
+        )
+
+    def bind_filter(self, f):
+        """Create a copy of the class-level filter ``f`` that is bound to this filterset.
+
+        Unless ``deepcopy_filters`` is set, the bound filter is a shallow copy that shares
+        the filter definition with the class-level filter. Only the state that is
+        modified during the request (``parent``, ``model``, ``extra``, etc.) is
+        local to the bound filter.
+
+        Args:
+            f: The class-level filter instance.
+
+        Returns:
+            The bound filter instance.
+        """
+        if self.deepcopy_filters:
+            f = copy.deepcopy(f)
+        else:
+            f = copy.copy(f)
+            f.extra = f.extra.copy()
+
+            # rebind the method proxy, as it would otherwise reference the original.
+            if isinstance(f.__dict__.get('filter'), FilterMethod):
+                f.filter = FilterMethod(f)
+
+        f.model = self.queryset.model
+        f.parent = self
+        return f
 
     def get_request_filters(self):
         """Build a set of filters based on the request data.
@@ -272,52 +754,257 @@ class FilterSet(rest_framework.FilterSet, metaclass=FilterSetMetaclass):
         Returns:
             Mapping of expanded ``{filter names: filter instances}``.
         """
+        if not self.plan.excluded:
+            return self.filters
+
         # build the compiled set of all filters
         requested_filters = OrderedDict()
         for filter_name, f in self.filters.items():
             requested_filters[filter_name] = f
 
-            # exclusion params
-            exclude_name = '%s!' % filter_name
-            if related(self, exclude_name) in self.data:
-                # deepcopy the *base* filter to prevent copying of model & parent
-                f_copy = copy.deepcopy(self.base_filters[filter_name])
-                f_copy.parent = f.parent
-                f_copy.model = f.model
-                f_copy.exclude = not f.exclude
-
-                requested_filters[exclude_name] = f_copy
+            if filter_name in self.plan.excluded:
+                exclude_name = '%s!' % filter_name
+                exclude_filter = self.get_exclusion_filter(filter_name)
+                requested_filters[exclude_name] = self.bind_filter(exclude_filter)
 
         return requested_filters
 
+    @classmethod
+    def get_exclusion_filter(cls, filter_name):
+        """Get the exclusion filter prototype for a base filter.
+
+        The prototype is a negated copy of the base filter, and is created once per
+        filterset class. The prototype should be bound to the filterset instance
+        before use. See :meth:`.bind_filter()`.
+
+        Args:
+            filter_name (str): The name of the base filter.
+
+        Returns:
+            The negated filter instance.
+        """
+        try:
+            return cls.exclusion_filters[filter_name]
+        except KeyError:
+            f = cls.base_filters.get(filter_name)
+            if f is None:
+                f = cls.get_dynamic_filter(filter_name)
+
+            f = copy.deepcopy(f)
+            f.exclude = not f.exclude
+
+            return cls.exclusion_filters.setdefault(filter_name, f)
+
+    @classmethod
+    def get_dynamic_filter(cls, filter_name):
+        """Get the filter for a dynamic ``AutoFilter`` lookup, building it on demand.
+
+        The ``filter_name`` is parsed into the ``AutoFilter``'s name and a lookup, which
+        is validated against the filter's lookups. The accepted names are identical to
+        those of an expanded ``AutoFilter``. Built filters are cached per filterset
+        class, and should be bound to the filterset instance before use.
+
+        Args:
+            filter_name (str): The name of the filter (e.g., ``joined__year__gte``).
+
+        Returns:
+            The filter instance, or ``None`` if the name is not a dynamic filter.
+        """
+        try:
+            return cls.dynamic_filters[filter_name]
+        except KeyError:
+            pass
+
+        # Check the name and each prefix ending before a separator, from right to left.
+        index = len(filter_name)
+        while index > 0:
+            name = filter_name[:index]
+            if name in cls.dynamic_lookups:
+                f = cls.build_dynamic_filter(name, filter_name)
+                if f is not None:
+                    return cls.dynamic_filters.setdefault(filter_name, f)
+
+            index = filter_name.rfind(LOOKUP_SEP, 0, index + 1)
+
+    @classmethod
+    def build_dynamic_filter(cls, name, filter_name):
+        """Build the filter for a dynamic ``AutoFilter`` lookup.
+
+        Generated filter names omit the default lookup (e.g., ``date__exact`` is named
+        ``date``), so the lookup may or may not be present in the ``filter_name``.
+
+        Args:
+            name (str): The attribute name of the ``AutoFilter``.
+            filter_name (str): The name of the filter, prefixed by the ``name``.
+
+        Returns:
+            The filter instance, or ``None`` if the lookup is not valid.
+        """
+        field, field_name, lookups = cls.dynamic_lookups[name]
+        suffix = filter_name[len(name) + len(LOOKUP_SEP):]
+        default = settings.DEFAULT_LOOKUP_EXPR
+        default = LOOKUP_SEP.join([suffix, default]) if suffix else default
+
+        for lookup_expr in (suffix, default):
+            if lookup_expr not in lookups:
+                continue
+
+            gen_name = cls.get_filter_name(field_name, lookup_expr)
+            gen_name = gen_name.replace(field_name, name, 1)
+
+            if gen_name == filter_name:
+                return cls.filter_for_field(field, field_name, lookup_expr)
+
     def get_related_filtersets(self):
         """Get the related filterset instances for all related filters.
 
+        The related filtersets are not initialized until they are accessed, as they
+        may not be needed (e.g., the request was only validated, or the related filter
+        was used without traversing the relationship).
+
         Returns:
-            Mapping of related ``{filter names: filterset instances}``.
+            Lazy mapping of related ``{filter names: filterset instances}``.
         """
-        related_filtersets = OrderedDict()
+        related_names = [name for name in self.related_filters if name in self.filters]
 
-        for related_name in self.related_filters:
-            if related_name not in self.filters:
-                continue
+        return RelatedFiltersets(self, related_names)
 
-            f = self.filters[related_name]
-            related_filtersets[related_name] = f.filterset(
-                data=self.data,
-                queryset=f.get_queryset(self.request),
-                relationship=related(self, related_name),
-                request=self.request,
-                prefix=self.form_prefix,
-            )
+    def get_related_filterset(self, related_name):
+        """Initialize the related filterset for a related filter.
+
+        Args:
+            related_name (str): The name of the related filter.
+
+        Returns:
+            The related filterset instance.
+        """
+        f = self.filters[related_name]
+
+        return f.filterset(
+            data=self.get_related_data(related_name),
+            queryset=f.get_queryset(self.request),
+            relationship=related(self, related_name),
+            request=self.request,
+            prefix=self.form_prefix,
+        )
+
+    def get_related_data(self, related_name):
+        """Get the request data that traverses a related filter's relationship.
+
+        The related filterset only receives the params that are addressed to it, so
+        that its initialization scales with its own params instead of the entire
+        request data. The params retain their full names (e.g., ``author__username``).
 
-        return related_filtersets
+        Args:
+            related_name (str): The name of the related filter.
+
+        Returns:
+            The related ``{params: values}``, as a ``MultiValueDict`` if the request
+            data supports multiple values.
+        """
+        params = self.plan.related.get(related_name, ())
+
+        if hasattr(self.data, 'getlist'):
+            return MultiValueDict({param: self.data.getlist(param) for param in params})
+        return {param: self.data[param] for param in params}
+
+    def has_related_data(self, related_name):
+        """Determine whether the request data traverses a related filter's relationship.
+
+        Args:
+            related_name (str): The name of the related filter.
+
+        Returns:
+            ``True`` if the related filterset has any params.
+        """
+        return related_name in self.plan.related
 
     def filter_queryset(self, queryset):
         queryset = super(FilterSet, self).filter_queryset(queryset)
         queryset = self.filter_related_filtersets(queryset)
         return queryset
 
+    def get_filter_q(self):
+        """Get the filterset's filtering as a single ``Q`` object.
+
+        The filters are applied to a ``utils.QueryRecorder`` instead of the queryset,
+        and related filtersets are applied as ``__in`` subqueries. This is only
+        possible when the filterset's filtering is equivalent to the ``Q`` object.
+        That is, the filterset must be valid and neither it nor its related filtersets
+        may override their filtering methods, its filters must not be ``method``
+        filters or call other queryset methods, and the filtered fields must not
+        traverse multi-valued relationships (as chained filters would create separate
+        joins).
+
+        Returns:
+            A ``(Q, distinct)`` tuple, or ``None`` if the filtering can't be expressed
+            as a ``Q`` object.
+        """
+        if self.overrides_filtering() or not self.is_valid():
+            return None
+
+        model = self._meta.model
+        recorder = utils.QueryRecorder()
+        for name, value in self.form.cleaned_data.items():
+            f = self.filters[name]
+            if f.method is not None or utils.is_multi_valued_path(model, f.field_name):
+                return None
+
+            try:
+                result = f.filter(recorder, value)
+            except (AttributeError, TypeError):
+                return None
+            if result is not recorder:
+                return None
+
+        q, distinct = recorder.q, recorder.is_distinct
+        for related_name in self.related_filtersets:
+            if not self.has_related_data(related_name):
+                continue
+
+            related_q = self.get_related_q(related_name)
+            if related_q is None:
+                return None
+
+            q &= related_q
+            distinct = distinct or self.related_filters[related_name].distinct
+
+        return q, distinct
+
+    @classmethod
+    def overrides_filtering(cls):
+        """Check if the filterset overrides how its queryset is filtered.
+
+        Returns:
+            ``True`` if the ``qs`` property or the filtering methods are overridden.
+        """
+        return (
+            cls.qs is not FilterSet.qs
+            or cls.filter_queryset is not FilterSet.filter_queryset
+            or cls.filter_related_filtersets is not FilterSet.filter_related_filtersets
+        )
+
+    def get_related_q(self, related_name):
+        """Get the ``__in`` subquery of a related filterset as a ``Q`` object.
+
+        Args:
+            related_name (str): The name of the related filter.
+
+        Returns:
+            The ``Q`` object, or ``None`` if the relationship is multi-valued or the
+            related filterset overrides its filtering.
+        """
+        f = self.filters[related_name]
+        related_filterset = self.related_filtersets[related_name]
+        if utils.is_multi_valued_path(self._meta.model, f.field_name):
+            return None
+        if related_filterset.overrides_filtering():
+            return None
+
+        to_field_name = getattr(f.field, 'to_field_name', 'pk') or 'pk'
+        subquery = related_filterset.qs.values(to_field_name)
+        return Q(**{LOOKUP_SEP.join([f.field_name, 'in']): subquery})
+
     def filter_related_filtersets(self, queryset):
         """Filter the provided ``queryset`` by the ``related_filtersets``.
 
@@ -329,27 +1016,271 @@ class FilterSet(rest_framework.FilterSet, metaclass=FilterSetMetaclass):
         Returns:
             The ``queryset`` filtered by its related filtersets' querysets.
         """
-        for related_name, related_filterset in self.related_filtersets.items():
+        for related_name in self.related_filtersets:
             # Related filtersets should only be applied if they had data.
-            prefix = '%s%s' % (related(self, related_name), LOOKUP_SEP)
-            if not any(value.startswith(prefix) for value in self.data):
+            if not self.has_related_data(related_name):
                 continue
 
-            field = self.filters[related_name].field
-            to_field_name = getattr(field, 'to_field_name', 'pk') or 'pk'
+            queryset = self.filter_related_filterset(queryset, related_name)
+
+        return queryset
+
+    def filter_related_filterset(self, queryset, related_name):
+        """Filter the ``queryset`` by a related filterset, using its filter's strategy.
 
-            field_name = self.filters[related_name].field_name
-            lookup_expr = LOOKUP_SEP.join([field_name, 'in'])
+        The ``'join'`` and ``'exists'`` strategies are only used when they are
+        equivalent to the subquery, and otherwise fall back to the ``'subquery'``
+        strategy.
 
-            subquery = related_filterset.qs.values(to_field_name)
-            queryset = queryset.filter(**{lookup_expr: subquery})
+        Args:
+            queryset: The filterset's filtered queryset.
+            related_name (str): The name of the related filter.
+
+        Returns:
+            The ``queryset`` filtered by the related filterset.
+        """
+        strategy = self.related_filters[related_name].strategy or self.related_strategy
+
+        if strategy == filters.JOIN and self.can_join_related(queryset, related_name):
+            return self.join_related_filterset(queryset, related_name)
+        if strategy == filters.EXISTS \
+                and self.can_correlate_related(queryset, related_name):
+            return self.exists_related_filterset(queryset, related_name)
+        if strategy == filters.MATERIALIZE:
+            return self.materialize_related_filterset(queryset, related_name)
+        return self.subquery_related_filterset(queryset, related_name)
+
+    def subquery_related_filterset(self, queryset, related_name):
+        """Filter the ``queryset`` by an ``__in`` subquery of the related filterset.
+
+        Args:
+            queryset: The filterset's filtered queryset.
+            related_name (str): The name of the related filter.
+
+        Returns:
+            The ``queryset`` filtered by the related filterset's queryset.
+        """
+        related_filterset = self.related_filtersets[related_name]
+        field = self.filters[related_name].field
+        to_field_name = getattr(field, 'to_field_name', 'pk') or 'pk'
+
+        field_name = self.filters[related_name].field_name
+        lookup_expr = LOOKUP_SEP.join([field_name, 'in'])
+
+        subquery = related_filterset.qs.values(to_field_name)
+        queryset = queryset.filter(**{lookup_expr: subquery})
+
+        # handle disinct
+        if self.related_filters[related_name].distinct:
+            queryset = queryset.distinct()
+
+        return queryset
+
+    def materialize_related_filterset(self, queryset, related_name):
+        """Filter the ``queryset`` by the literal values of the related filterset.
+
+        The related filterset's values are fetched with a limit of one more than the
+        ``materialize_threshold``. If there are no more values than the threshold, they
+        are inlined into the query as an ``__in`` list of literals, and otherwise the
+        ``__in`` subquery is used. The outcome is counted in ``materialize_stats`` as
+        ``(related path, 'materialized' or 'subquery')``.
 
-            # handle disinct
-            if self.related_filters[related_name].distinct:
-                queryset = queryset.distinct()
+        Args:
+            queryset: The filterset's filtered queryset.
+            related_name (str): The name of the related filter.
+
+        Returns:
+            The ``queryset`` filtered by the related filterset's values.
+        """
+        related_filterset = self.related_filtersets[related_name]
+        field = self.filters[related_name].field
+        to_field_name = getattr(field, 'to_field_name', 'pk') or 'pk'
+
+        threshold = self.related_filters[related_name].materialize_threshold
+        if threshold is None:
+            threshold = self.materialize_threshold
+
+        values = related_filterset.qs.values_list(to_field_name, flat=True)
+        values = list(values[:threshold + 1])
+        materialized = len(values) <= threshold
+
+        if self.materialize_stats is not None:
+            path = utils.get_usage_key(self._meta.model, related_name)
+            outcome = 'materialized' if materialized else 'subquery'
+            self.materialize_stats[path, outcome] += 1
+
+        if not materialized:
+            return self.subquery_related_filterset(queryset, related_name)
+
+        field_name = self.filters[related_name].field_name
+        lookup_expr = LOOKUP_SEP.join([field_name, 'in'])
+        queryset = queryset.filter(**{lookup_expr: values})
+
+        # handle disinct
+        if self.related_filters[related_name].distinct:
+            queryset = queryset.distinct()
+
+        return queryset
+
+    def join_related_filterset(self, queryset, related_name, prefix=None):
+        """Filter the ``queryset`` by the related filterset's filters as joined lookups.
+
+        The related filterset's filters are applied to the ``queryset`` with their field
+        names prefixed by the relationship. Nested related filtersets are flattened into
+        the same joins, so that a chain of relationships is applied as a single query.
+        See :meth:`.can_join_related()`.
+
+        Args:
+            queryset: The filterset's filtered queryset.
+            related_name (str): The name of the related filter.
+            prefix (str, optional): The relationship path from the ``queryset``'s model
+                to this filterset's model, when flattening a nested filterset.
+
+        Returns:
+            The ``queryset`` filtered by the related filterset's filters.
+        """
+        related_filterset = self.related_filtersets[related_name]
+        field_name = self.filters[related_name].field_name
+        if prefix:
+            field_name = LOOKUP_SEP.join([prefix, field_name])
+
+        fields = utils.get_relation_path(queryset.model, field_name)
+
+        # The subquery never matches a missing related object, while lookups
+        # like `isnull` or exclusions across a join might.
+        if utils.is_nullable(fields):
+            queryset = queryset.filter(**{LOOKUP_SEP.join([field_name, 'isnull']): False})
+
+        for name, value in related_filterset.form.cleaned_data.items():
+            f = copy.copy(related_filterset.filters[name])
+            f.field_name = LOOKUP_SEP.join([field_name, f.field_name])
+            queryset = f.filter(queryset, value)
+
+        # nested related filtersets are flattened into the same joins
+        for name in related_filterset.plan.related:
+            queryset = related_filterset.join_related_filterset(
+                queryset, name, prefix=field_name,
+            )
 
         return queryset
 
+    def exists_related_filterset(self, queryset, related_name):
+        """Filter the ``queryset`` by an ``EXISTS`` semi-join on the related filterset.
+
+        The related filterset's queryset is correlated with the outer queryset, so
+        multi-valued relationships don't duplicate rows, and ``distinct`` is not
+        necessary. See :meth:`.can_correlate_related()`.
+
+        Args:
+            queryset: The filterset's filtered queryset.
+            related_name (str): The name of the related filter.
+
+        Returns:
+            The ``queryset`` filtered by the related filterset's queryset.
+        """
+        related_filterset = self.related_filtersets[related_name]
+        field_name = self.filters[related_name].field_name
+        fields = utils.get_relation_path(queryset.model, field_name)
+
+        # Forward relationships are correlated by their column, which avoids a join.
+        if len(fields) == 1 and utils.is_single_valued(fields) and fields[0].concrete:
+            correlation = {fields[0].target_field.name: OuterRef(field_name)}
+        else:
+            # The reverse path ends with the relationship back to the outer model. A
+            # foreign key may target a field other than its primary key (``to_field``).
+            outer = 'pk'
+            if fields[0].auto_created and not fields[0].concrete:
+                outer = fields[0].field.target_field.attname
+            correlation = {utils.get_reverse_path(fields): OuterRef(outer)}
+
+        exists = Exists(related_filterset.qs.filter(**correlation))
+
+        # Filtering on a boolean expression requires Django 3.0
+        if django.VERSION >= (3, 0):
+            return queryset.filter(exists)
+
+        alias = '_%s_exists' % related_name
+        return queryset.annotate(**{alias: exists}).filter(**{alias: True})
+
+    def can_correlate_related(self, queryset, related_name):
+        """Determine if the related filterset can be applied as an ``EXISTS`` semi-join.
+
+        The semi-join is equivalent to the subquery when the related filter targets the
+        relationship's target field, and the related queryset is not sliced.
+
+        Args:
+            queryset: The filterset's filtered queryset.
+            related_name (str): The name of the related filter.
+
+        Returns:
+            ``True`` if the ``'exists'`` strategy can be used.
+        """
+        f = self.filters[related_name]
+        fields = utils.get_relation_path(queryset.model, f.field_name)
+        if not fields or utils.get_reverse_path(fields) is None:
+            return False
+
+        # the subquery selects the relationship's target field
+        if not utils.is_target_field(fields, f.extra.get('to_field_name')):
+            return False
+
+        query = self.related_filtersets[related_name].queryset.query
+        return query.low_mark == 0 and query.high_mark is None
+
+    def can_join_related(self, queryset, related_name):
+        """Determine if the related filterset can be applied as joined lookups.
+
+        Joined lookups are equivalent to the subquery when the relationship is
+        single-valued and the related filterset's queryset is unrestricted, and when
+        the related filterset only uses plain filters (no ``method`` filters, and none
+        that traverse a multi-valued relationship) and does not override its filtering
+        (see ``overrides_filtering()``). Nested
+        related filtersets must also be joinable, and are flattened into the join
+        unless their related filter sets a different ``strategy``.
+
+        Args:
+            queryset: The filterset's filtered queryset.
+            related_name (str): The name of the related filter.
+
+        Returns:
+            ``True`` if the ``'join'`` strategy can be used.
+        """
+        f = self.filters[related_name]
+        fields = utils.get_relation_path(queryset.model, f.field_name)
+        if not fields or not utils.is_single_valued(fields):
+            return False
+
+        # the subquery selects the relationship's target field
+        if not utils.is_target_field(fields, f.extra.get('to_field_name')):
+            return False
+
+        related_filterset = self.related_filtersets[related_name]
+        related_model = fields[-1].related_model
+        if not utils.is_unrestricted(related_filterset.queryset, related_model):
+            return False
+
+        # custom filtering may not be expressible as joined lookups
+        if related_filterset.overrides_filtering():
+            return False
+
+        if not related_filterset.is_valid():
+            return False
+
+        # method filters are opaque, and multi-valued lookups would duplicate rows
+        if any(related_f.method is not None
+               or utils.is_multi_valued_path(related_model, related_f.field_name)
+               for related_f in related_filterset.filters.values()):
+            return False
+
+        # A nested filterset that can't be flattened would be applied as a subquery
+        # of the related filterset, so the related filterset can't be joined either.
+        queryset = related_filterset.queryset
+        return all(
+            related_filterset.related_filters[name].strategy in (None, filters.JOIN)
+            and related_filterset.can_join_related(queryset, name)
+            for name in related_filterset.plan.related
+        )
+
     def get_form_class(self):
         class Form(super(FilterSet, self).get_form_class()):
             def add_prefix(form, field_name):
@@ -361,13 +1292,40 @@ class FilterSet(rest_framework.FilterSet, metaclass=FilterSetMetaclass):
 
                 # when prefixing the errors, use the related filter name,
                 # which is relative to the parent filterset, not the root.
-                for related_filterset in self.related_filtersets.values():
+                for related_name in self.related_filtersets:
+                    # Related filtersets without data can't have errors.
+                    if not self.has_related_data(related_name):
+                        continue
+
+                    related_filterset = self.related_filtersets[related_name]
                     for key, error in related_filterset.form.errors.items():
-                        self.form.errors[related(related_filterset, key)] = error
+                        if key == NON_FIELD_ERRORS:
+                            form.add_error(None, error)
+                        else:
+                            self.form.errors[related(related_filterset, key)] = error
+
+                if self.cost_policy is not None:
+                    self.add_cost_errors(form, cleaned_data)
 
                 return cleaned_data
         return Form
 
+    def add_cost_errors(self, form, cleaned_data):
+        """Add the errors of the ``cost_policy`` to the filterset's form.
+
+        The policy also checks the filters of the related filtersets, whose errors are
+        keyed by their prefixed names (e.g., ``author__username__regex``).
+
+        Args:
+            form: The filterset's form, which is being cleaned.
+            cleaned_data: The form's cleaned data.
+        """
+        for name, error in self.cost_policy.get_errors(self, cleaned_data):
+            if name is None or name in form.fields:
+                form.add_error(name, error)
+            elif error not in form.errors.get(name, []):
+                form.errors.setdefault(name, form.error_class()).append(error)
+
     @property
     def form(self):
         from django_filters import compat
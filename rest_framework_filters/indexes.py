@@ -0,0 +1,437 @@
+import hashlib
+import os
+from collections import Counter, OrderedDict, namedtuple
+
+import django
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections, router
+from django.db.models import functions
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.expressions import Expression
+from django.db.models.sql import Query
+
+from . import filters, utils
+from .filterset import FilterSet, SubsetDisabledMixin, iter_filtersets
+
+# The model field filtered by a lookup path, and the transforms and lookup applied to it.
+# See: :func:`rest_framework_filters.indexes.resolve_lookup_path`
+LookupTarget = namedtuple('LookupTarget', [
+    'model', 'field', 'lookup_expr', 'transforms', 'output_field', 'lookup',
+])
+
+# Functional indexes (``models.Index(*expressions)``) were added in Django 3.2.
+SUPPORTS_FUNCTIONAL_INDEXES = django.VERSION >= (3, 2)
+
+# Installation directories of third-party packages, whose apps aren't migrated.
+PACKAGE_DIRS = frozenset(['site-packages', 'dist-packages'])
+
+# A filtered column (or expression) without a supporting index. The ``expression``
+# is ``None`` when no B-tree index can support the lookups (e.g., ``icontains``).
+IndexSuggestion = namedtuple('IndexSuggestion', [
+    'model', 'field', 'expression', 'lookups', 'usage', 'filtersets',
+])
+
+
+def resolve_field(model, parts):
+    # Resolve the field (and its model) from the leading parts of a lookup path, following
+    # relationships. The parts of the field path are removed from `parts`.
+    field = None
+    while parts:
+        try:
+            field = model._meta.get_field(parts[0])
+        except FieldDoesNotExist:
+            break
+
+        parts.pop(0)
+        if not field.is_relation or not parts:
+            break
+
+        # follow the relationship if the next part is a field of the related model
+        try:
+            field.related_model._meta.get_field(parts[0])
+        except FieldDoesNotExist:
+            break
+        model = field.related_model
+
+    return model, field
+
+
+def resolve_lookup_path(model, path):
+    """Resolve a lookup path into the filtered model field and its lookups.
+
+    .. code-block:: python
+
+        >>> resolve_lookup_path(Post, 'author__username__iexact')
+        LookupTarget(model=User, field=<username>, lookup_expr='iexact',
+                     transforms=[], output_field=<username>, lookup='iexact')
+
+    Args:
+        model: The model class the ``path`` is relative to.
+        path (str): The lookup path, including the field name and the lookup expression.
+
+    Returns:
+        The ``LookupTarget``, or ``None`` if the path does not filter a model column.
+    """
+    parts = path.split(LOOKUP_SEP)
+    model, field = resolve_field(model, parts)
+    if field is None or not field.concrete or field.many_to_many:
+        return None
+
+    lookup_expr = LOOKUP_SEP.join(parts) or 'exact'
+    transforms, output_field = [], field
+    for index, part in enumerate(parts):
+        last = index == len(parts) - 1
+        if last and output_field.get_lookup(part) is not None:
+            return LookupTarget(
+                model, field, lookup_expr, transforms, output_field, part,
+            )
+
+        transform = output_field.get_transform(part)
+        if transform is None:
+            return None
+
+        transforms.append(transform)
+        output_field = transform(Expression(output_field)).output_field
+
+    return LookupTarget(model, field, lookup_expr, transforms, output_field, 'exact')
+
+
+class ColumnRef(Expression):
+    # The unqualified column of a field, as referenced by an index expression.
+
+    def as_sql(self, compiler, connection):
+        return compiler.quote_name_unless_alias(self.output_field.column), []
+
+
+def is_project_app(app_config):
+    # Determine if the app belongs to the project, rather than to an installed package
+    # (e.g., ``django.contrib.auth``).
+    if app_config.name.startswith('django.'):
+        return False
+    parts = os.path.normpath(app_config.path).split(os.sep)
+    return not PACKAGE_DIRS.intersection(parts)
+
+
+def get_class_path(cls):
+    # Return the import path of the class, preferring `django.db.models.functions`.
+    if getattr(functions, cls.__name__, None) is cls:
+        return 'django.db.models.functions', cls.__name__
+    return cls.__module__, cls.__name__
+
+
+class IndexAdvisor:
+    """Suggest indexes for the lookups of filterset classes.
+
+    The lookups of each filterset's filters (and the recorded usage of lookups, see
+    ``FilterSet.usage``) are resolved to the filtered model columns. Lookups that are
+    not supported by an existing index are grouped by the column, or by the functional
+    expression for transformed and case-insensitive lookups (e.g., ``__year`` or
+    ``iexact``).
+
+    Args:
+        filtersets: An iterable of filterset classes. Defaults to all subclasses of
+            ``FilterSet``.
+        usage: A mapping of the recorded ``{usage keys: counts}``.
+    """
+
+    # Lookups that can be supported by a B-tree index on the filtered expression.
+    indexed_lookups = frozenset([
+        'exact', 'in', 'gt', 'gte', 'lt', 'lte', 'range', 'isnull',
+    ])
+    # Lookups on text that can be supported by an index on the (uppercased) expression.
+    text_lookups = frozenset(['startswith'])
+    case_insensitive_lookups = frozenset(['iexact'])
+    text_fields = frozenset(['CharField', 'TextField'])
+
+    def __init__(self, filtersets=None, usage=None):
+        if filtersets is None:
+            filtersets = OrderedDict.fromkeys(iter_filtersets(FilterSet))
+        self.filtersets = [
+            f for f in filtersets
+            if f._meta.model is not None and not issubclass(f, SubsetDisabledMixin)
+        ]
+        self.usage = Counter(usage or {})
+
+    def get_lookup_paths(self):
+        """Get the lookup paths of the filtersets' filters and the recorded usage.
+
+        Returns:
+            A mapping of ``{(model, lookup path): filterset names}``.
+        """
+        paths = OrderedDict()
+        for filterset in self.filtersets:
+            model = filterset._meta.model
+            for path in self.get_filter_paths(filterset):
+                names = paths.setdefault((model, path), [])
+                if filterset.__name__ not in names:
+                    names.append(filterset.__name__)
+
+        for key in self.usage:
+            label, path = key.rsplit('.', 1)
+            try:
+                model = apps.get_model(label)
+            except LookupError:
+                continue
+            paths.setdefault((model, path), [])
+
+        return paths
+
+    def get_filter_paths(self, filterset):
+        """Get the lookup paths of a filterset's filters.
+
+        Related filters and method filters are omitted, as their lookups belong to the
+        related filterset or are unknown. The lookups of dynamic ``AutoFilter``s, which
+        are only built on demand, are included.
+
+        Args:
+            filterset: The filterset class.
+
+        Returns:
+            A list of the lookup paths, relative to the filterset's model.
+        """
+        paths = [
+            LOOKUP_SEP.join([f.field_name, f.lookup_expr])
+            for f in filterset.base_filters.values()
+            if f.method is None and not isinstance(f, filters.BaseRelatedFilter)
+        ]
+        for dynamic in filterset.dynamic_lookups.values():
+            paths += [
+                LOOKUP_SEP.join([dynamic.field_name, lookup])
+                for lookup in sorted(dynamic.lookups)
+            ]
+        return paths
+
+    def get_expression(self, target):
+        """Get the indexed expression that supports a lookup.
+
+        Args:
+            target: The ``LookupTarget`` of the lookup.
+
+        Returns:
+            A tuple of the transform classes applied to the field, which is empty for a
+            plain column index, or ``None`` if no B-tree index can support the lookup.
+        """
+        if target.lookup in self.indexed_lookups:
+            return tuple(target.transforms)
+
+        if target.output_field.get_internal_type() not in self.text_fields:
+            return None
+        if target.lookup in self.text_lookups:
+            return tuple(target.transforms)
+        if target.lookup in self.case_insensitive_lookups:
+            return tuple(target.transforms) + (functions.Upper, )
+        return None
+
+    def get_index_name(self, model, field, expression):
+        """Get a deterministic name for the suggested index.
+
+        Args:
+            model: The model class.
+            field: The indexed model field.
+            expression: The transform classes applied to the field.
+
+        Returns:
+            The index name, which is at most 30 characters.
+        """
+        parts = [model._meta.db_table, field.column] + [t.__name__ for t in expression]
+        digest = hashlib.md5('.'.join(parts).encode()).hexdigest()[:6]
+        suffix = ''.join(t.__name__[:3].lower() for t in expression) or field.column
+
+        return '%s_%s_%s_idx' % (model._meta.model_name[:8], suffix[:8], digest)
+
+    def has_index(self, model, field, expression):
+        """Determine if the model has an index that supports the expression.
+
+        Plain column indexes are detected by the field's ``primary_key``, ``unique``,
+        and ``db_index`` options, and by the leading column of the model's indexes and
+        constraints. Functional indexes are detected by their suggested name.
+
+        Args:
+            model: The model class.
+            field: The indexed model field.
+            expression: The transform classes applied to the field.
+
+        Returns:
+            ``True`` if the expression is supported by an index.
+        """
+        opts = model._meta
+        name = self.get_index_name(model, field, expression)
+        if any(index.name == name for index in opts.indexes):
+            return True
+        if expression:
+            return False
+
+        if field.primary_key or field.unique or field.db_index:
+            return True
+
+        leading = [list(i.fields)[:1] for i in opts.indexes]
+        leading += [list(fields)[:1] for fields in opts.unique_together]
+        leading += [list(fields)[:1] for fields in opts.index_together]
+        leading += [list(getattr(c, 'fields', ()))[:1] for c in opts.constraints]
+        return [field.name] in leading
+
+    def get_suggestions(self, min_usage=0):
+        """Get the index suggestions for the filtered lookups without an index.
+
+        Args:
+            min_usage (int, optional): Omit suggestions used fewer times than this.
+
+        Returns:
+            A list of ``IndexSuggestion`` tuples, ordered by their usage.
+        """
+        suggestions = OrderedDict()
+        for (model, path), filterset_names in self.get_lookup_paths().items():
+            target = resolve_lookup_path(model, path)
+            if target is None:
+                continue
+
+            expression = self.get_expression(target)
+            if expression is not None \
+                    and self.has_index(target.model, target.field, expression):
+                continue
+
+            key = (target.model, target.field, expression)
+            lookups, usage, names = suggestions.setdefault(key, ([], [0], []))
+
+            if target.lookup_expr not in lookups:
+                lookups.append(target.lookup_expr)
+            usage[0] += self.usage[utils.get_usage_key(model, path)]
+            names.extend(name for name in filterset_names if name not in names)
+
+        results = [
+            IndexSuggestion(model, field, expression, lookups, usage, names)
+            for (model, field, expression), (lookups, [usage], names)
+            in suggestions.items() if usage >= min_usage
+        ]
+        return sorted(results, key=lambda s: -s.usage)
+
+    def get_index_source(self, suggestion):
+        """Get the source code of the ``models.Index`` for a suggestion.
+
+        Args:
+            suggestion: The ``IndexSuggestion``.
+
+        Returns:
+            The source code of the index.
+        """
+        field, expression = suggestion.field, suggestion.expression
+        name = self.get_index_name(suggestion.model, field, expression)
+
+        if not expression:
+            return "models.Index(fields=['%s'], name='%s')" % (field.name, name)
+
+        source = "'%s'" % field.name
+        for transform in expression:
+            source = '%s(%s)' % (get_class_path(transform)[1], source)
+        return "models.Index(%s, name='%s')" % (source, name)
+
+    def get_index_sql(self, suggestion):
+        """Get the ``CREATE INDEX`` statement for a suggestion.
+
+        Functional indexes can't be declared with ``models.Index`` before Django 3.2,
+        but may still be created with SQL (e.g., with ``migrations.RunSQL``).
+
+        Args:
+            suggestion: The ``IndexSuggestion``.
+
+        Returns:
+            The SQL statement, for the database that the model is written to.
+        """
+        model, field = suggestion.model, suggestion.field
+        connection = connections[router.db_for_write(model)]
+        compiler = Query(model).get_compiler(connection=connection)
+
+        expression = ColumnRef(output_field=field)
+        for transform in suggestion.expression:
+            expression = transform(expression)
+        sql, params = compiler.compile(expression)
+
+        editor = connection.schema_editor(collect_sql=True)
+        sql = sql % tuple(editor.quote_value(param) for param in params)
+        name = self.get_index_name(model, field, suggestion.expression)
+
+        return 'CREATE INDEX %s ON %s (%s);' % (
+            editor.quote_name(name), editor.quote_name(model._meta.db_table), sql,
+        )
+
+    def get_migrations(self, suggestions):
+        """Get the source code of draft migrations that add the suggested indexes.
+
+        Migrations are only drafted for the project's apps, as the models of installed
+        packages (e.g., ``django.contrib.auth``) can't be migrated by the project. Before
+        Django 3.2, functional indexes are included as commented SQL.
+
+        Args:
+            suggestions: A list of ``IndexSuggestion`` tuples.
+
+        Returns:
+            A mapping of ``{app labels: migration source code}``.
+        """
+        from django.db.migrations.loader import MigrationLoader
+
+        loader = MigrationLoader(None, ignore_no_migrations=True)
+
+        operations = OrderedDict()
+        for suggestion in suggestions:
+            if suggestion.expression is None:
+                continue
+
+            opts = suggestion.model._meta
+            if not is_project_app(opts.app_config):
+                continue
+            operations.setdefault(opts.app_label, []).append(suggestion)
+
+        migrations = OrderedDict()
+        for app_label, app_suggestions in operations.items():
+            migrations[app_label] = self.render_migration(
+                app_label, loader.graph.leaf_nodes(app_label), app_suggestions,
+            )
+        return migrations
+
+    def render_migration(self, app_label, dependencies, suggestions):
+        """Render the source code of a draft migration.
+
+        Args:
+            app_label (str): The label of the migrated app.
+            dependencies: The ``(app label, migration name)`` dependencies.
+            suggestions: The app's ``IndexSuggestion`` tuples.
+
+        Returns:
+            The source code of the migration.
+        """
+        functional = [s for s in suggestions if s.expression]
+        if not SUPPORTS_FUNCTIONAL_INDEXES:
+            suggestions = [s for s in suggestions if not s.expression]
+
+        imports = {}
+        for suggestion in suggestions:
+            for transform in suggestion.expression:
+                module, name = get_class_path(transform)
+                imports.setdefault(module, set()).add(name)
+
+        lines = ['from django.db import migrations, models']
+        lines += [
+            'from %s import %s' % (module, ', '.join(sorted(names)))
+            for module, names in sorted(imports.items())
+        ]
+
+        lines += ['', '', 'class Migration(migrations.Migration):', '']
+        lines += ['    dependencies = [']
+        lines += ["        ('%s', '%s')," % dependency for dependency in dependencies]
+        lines += ['    ]', '', '    operations = [']
+
+        for suggestion in suggestions:
+            lines += [
+                '        migrations.AddIndex(',
+                "            model_name='%s'," % suggestion.model._meta.model_name,
+                '            index=%s,' % self.get_index_source(suggestion),
+                '        ),',
+            ]
+
+        if functional and not SUPPORTS_FUNCTIONAL_INDEXES:
+            lines += ['        # Functional indexes require Django 3.2 or later:']
+            lines += ['        # %s' % self.get_index_sql(s) for s in functional]
+
+        lines += ['    ]', '']
+        return '\n'.join(lines)
@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from rest_framework_filters import indexes
+
+
+class Command(BaseCommand):
+    help = (
+        "Report the filtered columns and lookups that aren't supported by an index, "
+        "and suggest the indexes to add."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'filtersets', nargs='*', metavar='filterset',
+            help='Import paths of the filterset classes. Defaults to all filtersets.',
+        )
+        parser.add_argument(
+            '--usage', action='append', default=[],
+            help='A JSON file of recorded usage counts (see FilterSet.usage). '
+                 'May be given multiple times.',
+        )
+        parser.add_argument(
+            '--min-usage', type=int, default=0,
+            help='Omit lookups used fewer times than this.',
+        )
+        parser.add_argument(
+            '--migration', action='store_true',
+            help='Print draft migrations that add the suggested indexes.',
+        )
+
+    def handle(self, *args, **options):
+        filtersets = [import_string(path) for path in options['filtersets']] or None
+
+        usage = {}
+        for path in options['usage']:
+            with open(path) as f:
+                for key, count in json.load(f).items():
+                    usage[key] = usage.get(key, 0) + count
+
+        advisor = indexes.IndexAdvisor(filtersets, usage)
+        suggestions = advisor.get_suggestions(min_usage=options['min_usage'])
+
+        if options['migration']:
+            for app_label, source in advisor.get_migrations(suggestions).items():
+                self.stdout.write('# %s\n%s' % (app_label, source))
+            return
+
+        if not suggestions:
+            self.stdout.write('All filtered lookups are supported by an index.')
+
+        for suggestion in suggestions:
+            self.stdout.write(self.format_suggestion(advisor, suggestion))
+
+    def format_suggestion(self, advisor, suggestion):
+        field = '%s.%s' % (suggestion.model._meta.label, suggestion.field.name)
+        line = '%s: %s' % (field, ', '.join(suggestion.lookups))
+        if suggestion.usage:
+            line += ' (used %d times)' % suggestion.usage
+
+        if suggestion.expression is None:
+            index = 'not supported by a B-tree index'
+        elif suggestion.expression and not indexes.SUPPORTS_FUNCTIONAL_INDEXES:
+            index = advisor.get_index_sql(suggestion)
+        else:
+            index = advisor.get_index_source(suggestion)
+
+        return '%s\n    %s\n    filtersets: %s' % (
+            line, index, ', '.join(suggestion.filtersets) or '-',
+        )
@@ -1,25 +1,48 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+from django.apps import apps
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Field, Q
 from django.db.models.constants import LOOKUP_SEP
 from django.db.models.expressions import Expression
 from django.db.models.lookups import Transform
 
+# Cache of ``{key: (lookups, registered)}``, where ``registered`` pairs each field class
+# visited while walking the transforms with the lookups it had registered at the time.
+_lookups_cache = {}
 
-def lookups_for_field(model_field):
-    """Generate a list of all possible lookup expressions for a model field.
 
-    Args:
-        model_field: The model field to inspect.
+def _cached_lookups(key, compute):
+    # ``get_lookups()`` is memoized by Django, and its cache is cleared when lookups are
+    # (un)registered. An identity check on the returned dicts detects stale entries.
+    entry = _lookups_cache.get(key)
+    if entry is not None:
+        lookups, registered = entry
+        if all(cls.get_lookups() is class_lookups for cls, class_lookups in registered):
+            return list(lookups)
 
-    Returns:
-        A list of lookups for the given ``model_field``.
-    """
+    registered = {}
+    lookups = compute(registered)
+    _lookups_cache[key] = (tuple(lookups), tuple(registered.items()))
+    return lookups
+
+
+def _get_lookups(field, registered):
+    lookups = field.get_lookups()
+    registered[type(field)] = lookups
+    return lookups
+
+
+def _lookups_for_field(model_field, registered):
     lookups = []
 
-    for expr, lookup in model_field.get_lookups().items():
+    for expr, lookup in _get_lookups(model_field, registered).items():
         if issubclass(lookup, Transform):
             transform = lookup(Expression(model_field))
             lookups += [
                 LOOKUP_SEP.join([expr, sub_expr]) for sub_expr
-                in lookups_for_transform(transform)
+                in _lookups_for_transform(transform, registered)
             ]
 
         else:
@@ -28,9 +51,52 @@ def lookups_for_field(model_field):
     return lookups
 
 
+def _lookups_for_transform(transform, registered):
+    lookups = []
+
+    for expr, lookup in _get_lookups(transform.output_field, registered).items():
+        if issubclass(lookup, Transform):
+
+            # type match indicates recursion.
+            if type(transform) == lookup:
+                continue
+
+            sub_transform = lookup(transform)
+            lookups += [
+                LOOKUP_SEP.join([expr, sub_expr]) for sub_expr
+                in _lookups_for_transform(sub_transform, registered)
+            ]
+
+        else:
+            lookups.append(expr)
+
+    return lookups
+
+
+def lookups_for_field(model_field):
+    """Generate a list of all possible lookup expressions for a model field.
+
+    Results are cached per field class, and are recomputed when lookups are registered
+    or unregistered for any of the field classes involved.
+
+    Args:
+        model_field: The model field to inspect.
+
+    Returns:
+        A list of lookups for the given ``model_field``.
+    """
+    return _cached_lookups(
+        ('field', type(model_field)),
+        lambda registered: _lookups_for_field(model_field, registered),
+    )
+
+
 def lookups_for_transform(transform):
     """Generate a list of subsequent lookup expressions for a transform.
 
+    Results are cached per transform and output field class, and are recomputed when
+    lookups are registered or unregistered for any of the field classes involved.
+
     Note:
     Infinite transform recursion is only prevented when the subsequent and passed in
     transforms are the same class. For example, the ``Unaccent`` transform from
@@ -45,25 +111,186 @@ def lookups_for_transform(transform):
     Returns:
         A list of lookups for the given ``transform``.
     """
-    lookups = []
+    return _cached_lookups(
+        ('transform', type(transform), type(transform.output_field)),
+        lambda registered: _lookups_for_transform(transform, registered),
+    )
 
-    for expr, lookup in transform.output_field.get_lookups().items():
-        if issubclass(lookup, Transform):
 
-            # type match indicates recursion.
-            if type(transform) == lookup:
-                continue
+def precompute_lookups(models=None):
+    """Populate the lookups cache for the concrete fields of the given models.
 
-            sub_transform = lookup(transform)
-            lookups += [
-                LOOKUP_SEP.join([expr, sub_expr]) for sub_expr
-                in lookups_for_transform(sub_transform)
-            ]
+    This moves the cost of walking the lookup transforms to startup (e.g., in an
+    ``AppConfig.ready()`` method), instead of the first filterset class creation.
+
+    Args:
+        models: An iterable of model classes. Defaults to all installed models.
+
+    Returns:
+        The number of entries in the lookups cache.
+    """
+    if models is None:
+        models = apps.get_models()
+
+    for model in models:
+        for model_field in model._meta.get_fields():
+            if isinstance(model_field, Field):
+                lookups_for_field(model_field)
+
+    return len(_lookups_cache)
+
+
+def clear_lookups_cache():
+    """Remove all entries from the lookups cache."""
+    _lookups_cache.clear()
+
+
+def get_relation_path(model, path):
+    """Resolve the relationship fields along a model field path.
+
+    Args:
+        model: The model class the ``path`` starts from.
+        path (str): The field path, e.g. ``'author__profile'``.
 
+    Returns:
+        A list of the relationship fields, or ``None`` if the ``path`` does not
+        resolve to a relationship.
+    """
+    fields = []
+    for name in path.split(LOOKUP_SEP):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return None
+
+        if not field.is_relation or field.related_model is None:
+            return None
+
+        fields.append(field)
+        model = field.related_model
+
+    return fields
+
+
+def get_reverse_path(fields):
+    """Build the field path from the end of a relationship path back to its start.
+
+    Args:
+        fields: The relationship fields (see :func:`get_relation_path`).
+
+    Returns:
+        The reversed field path, or ``None`` if a relationship has no reverse
+        accessor (e.g., ``related_name='+'``).
+    """
+    names = []
+    for field in reversed(fields):
+        if field.auto_created and not field.concrete:
+            # reverse relationship, which is reversed by its forward field
+            names.append(field.field.name)
+        elif field.remote_field.is_hidden():
+            return None
         else:
-            lookups.append(expr)
+            names.append(field.related_query_name())
+
+    return LOOKUP_SEP.join(names)
+
+
+def is_target_field(fields, to_field_name):
+    """Determine if a field name refers to the target field of a relationship path.
+
+    Args:
+        fields: The relationship fields (see :func:`get_relation_path`).
+        to_field_name (str): The field name, where ``None`` or ``'pk'`` refers to
+            the primary key.
+
+    Returns:
+        ``True`` if ``to_field_name`` is the target field of the last relationship.
+    """
+    target_field = fields[-1].target_field
+
+    if to_field_name in (None, 'pk'):
+        return target_field.primary_key
+    return to_field_name == target_field.name
+
+
+def is_single_valued(fields):
+    """Determine if a relationship path yields at most one related object.
+
+    Args:
+        fields: The relationship fields (see :func:`get_relation_path`).
+
+    Returns:
+        ``True`` if every relationship is a forward or one-to-one relationship.
+    """
+    return all(f.many_to_one or f.one_to_one for f in fields)
+
+
+def is_multi_valued_path(model, path):
+    """Determine if a field path traverses a multi-valued relationship.
+
+    Args:
+        model: The model class the ``path`` starts from.
+        path (str): The field path, which may end with lookups and transforms.
+
+    Returns:
+        ``True`` if any relationship along the ``path`` is a reverse foreign key or a
+        many-to-many relationship.
+    """
+    for name in path.split(LOOKUP_SEP):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+
+        if not field.is_relation or field.related_model is None:
+            return False
+        if field.one_to_many or field.many_to_many:
+            return True
+
+        model = field.related_model
+
+    return False
+
+
+def is_nullable(fields):
+    """Determine if a relationship path may not have a related object.
+
+    Args:
+        fields: The relationship fields (see :func:`get_relation_path`).
+
+    Returns:
+        ``True`` if any relationship is nullable or a reverse relationship.
+    """
+    return any(f.null for f in fields)
 
-    return lookups
+
+def is_unrestricted(queryset, model):
+    """Determine if a queryset selects all rows of a model, without modification.
+
+    Args:
+        queryset: The queryset to inspect.
+        model: The expected model class of the ``queryset``.
+
+    Returns:
+        ``True`` if the ``queryset`` is equivalent to a plain join on the ``model``.
+    """
+    query = queryset.query
+
+    return (
+        queryset.model is model
+        and not query.where
+        and not query.distinct
+        and not query.annotations
+        and not query.extra
+        and not query.combinator
+        and query.low_mark == 0
+        and query.high_mark is None
+    )
+
+
+def get_usage_key(model, path):
+    # Return the usage key for a model's lookup path (e.g., 'testapp.Note.title__exact').
+    return '%s.%s' % (model._meta.label, path)
 
 
 def lookahead(iterable):
@@ -77,3 +304,106 @@ def lookahead(iterable):
         yield current, True
         current = value
     yield current, False
+
+
+class QueryRecorder:
+    """A stand-in for a queryset that records its filtering as a ``Q`` object.
+
+    Filters may be applied to the recorder in place of a queryset, so that their
+    ``filter()`` and ``exclude()`` calls can be combined with other conditions. Any
+    other queryset method raises an ``AttributeError``.
+    """
+
+    def __init__(self):
+        self.q = Q()
+        self.is_distinct = False
+
+    def filter(self, *args, **kwargs):
+        self.q &= Q(*args, **kwargs)
+        return self
+
+    def exclude(self, *args, **kwargs):
+        self.q &= ~Q(*args, **kwargs)
+        return self
+
+    def distinct(self):
+        self.is_distinct = True
+        return self
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRUCache:
+    """A bounded mapping that evicts its least recently used entries.
+
+    Similar to ``functools.lru_cache``, but usable as an explicit cache object that
+    can be shared, resized, and inspected at runtime. The cache is thread-safe.
+
+    Args:
+        maxsize (int): The maximum number of entries. ``None`` disables eviction.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get the value for ``key``, marking it as recently used.
+
+        Args:
+            key: The cache key.
+            default: The value to return when ``key`` is not cached.
+
+        Returns:
+            The cached value, or the ``default``.
+        """
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """Cache the ``value`` for ``key``, evicting the oldest entries if necessary.
+
+        Args:
+            key: The cache key.
+            value: The value to cache.
+        """
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+
+            if self.maxsize is not None:
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all entries and reset the hit/miss counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """Report the cache statistics.
+
+        Returns:
+            A ``CacheInfo`` of the ``(hits, misses, maxsize, currsize)``.
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
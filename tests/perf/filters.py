@@ -4,7 +4,8 @@ from django_filters import FilterSet as DFFilterSet
 from rest_framework_filters import filters
 from rest_framework_filters.filterset import FilterSet as DRFFilterSet
 
-from ..testapp.models import Note, User
+from ..testapp.filters import AFilter
+from ..testapp.models import A, Note, Post, Tag, User
 
 
 # df-filters
@@ -20,6 +21,26 @@ class NoteFilterWithExplicitRelated(DFFilterSet):
         }
 
 
+class AFilterWithExplicitRelated(DFFilterSet):
+    class Meta:
+        model = A
+        fields = {
+            'title': ['exact'],
+            'b__name': ['exact'],
+            'b__c__title': ['exact'],
+        }
+
+
+class PostFilterWithExplicitRelated(DFFilterSet):
+    tags__name__contains = filters.CharFilter(
+        field_name='tags__name', lookup_expr='contains', distinct=True,
+    )
+
+    class Meta:
+        model = Post
+        fields = []
+
+
 # drf-filters
 class UserFilterWithAll(DRFFilterSet):
     username = filters.AutoFilter(lookups='__all__')
@@ -36,3 +57,51 @@ class NoteFilterWithRelatedAll(DRFFilterSet):
     class Meta:
         model = Note
         fields = []
+
+
+class PostFilterWithJoins(DRFFilterSet):
+    author__username = filters.CharFilter()
+    note__title = filters.CharFilter()
+
+    class Meta:
+        model = Post
+        fields = ['title']
+
+
+# drf-filters w/ deep copied filters
+class UserFilterWithAllDeepcopy(UserFilterWithAll):
+    deepcopy_filters = True
+
+
+class NoteFilterWithRelatedAllDeepcopy(NoteFilterWithRelatedAll):
+    author = filters.RelatedFilter(UserFilterWithAllDeepcopy, queryset=User.objects.all())
+    deepcopy_filters = True
+
+
+# drf-filters w/ related filtering strategies
+class TagFilter(DRFFilterSet):
+    name = filters.AutoFilter(lookups=['contains'])
+
+    class Meta:
+        model = Tag
+        fields = []
+
+
+class PostFilterWithSubquery(DRFFilterSet):
+    tags = filters.RelatedFilter(
+        TagFilter, queryset=Tag.objects.all(), distinct=True, strategy=filters.SUBQUERY,
+    )
+
+    class Meta:
+        model = Post
+        fields = []
+
+
+class PostFilterWithExists(PostFilterWithSubquery):
+    tags = filters.RelatedFilter(
+        TagFilter, queryset=Tag.objects.all(), distinct=True, strategy=filters.EXISTS,
+    )
+
+
+class AFilterWithJoin(AFilter):
+    related_strategy = filters.JOIN
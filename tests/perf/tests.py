@@ -1,11 +1,22 @@
 import argparse
+import tracemalloc
+from collections import OrderedDict
+from functools import partial
 from timeit import repeat
+from unittest import mock
+from urllib.parse import quote
 
+from django.http import QueryDict
 from django.test import TestCase, override_settings, tag
+from django_filters.rest_framework import backends as df_backends
+from rest_framework.request import Request
 from rest_framework.test import APIRequestFactory
 
-from tests.perf import views
+from rest_framework_filters import backends as drf_backends
+from rest_framework_filters import filters as drf_filters
+from tests.perf import filters, views
 from tests.testapp import models
+from tests.testapp.filters import AFilter
 
 factory = APIRequestFactory()
 
@@ -23,8 +34,9 @@ verbosity = args.verbosity
 @tag('perf')
 class PerfTestMixin(object):
     # This mixin provides common setup for testing the performance differences between
-    # django-filter and django-rest-framework-filters. A callable for each implementation
-    # should be generated that will return semantically equivalent results.
+    # semantically equivalent calls. By default, a callable is generated for each of
+    # django-filter and django-rest-framework-filters, although tests may compare any
+    # number of labelled calls by overriding `get_calls()`.
     iterations = 1000
     repeat = 5
     threshold = 1.0
@@ -45,6 +57,13 @@ class PerfTestMixin(object):
         # iteration. The performance of the callable is what is under test.
         raise NotImplementedError
 
+    def get_calls(self):
+        # Returns the label and `get_callable()` arguments for each compared call.
+        return [
+            ('django-filter', self.django_filter_args()),
+            ('drf-filters', self.rest_framework_filters_args()),
+        ]
+
     def django_filter_args(self):
         # Arguments passed to `get_callable()` in order to create
         # django-filter test iterations.
@@ -63,40 +82,56 @@ class PerfTestMixin(object):
         # semantically equivalent, this method should validate both results.
         raise NotImplementedError
 
+    def validate_results(self, results):
+        # Validates the call results, keyed by label. Override this to check that the
+        # results are equivalent to each other.
+        for result in results.values():
+            self.validate_result(result)
+
+    def check_times(self, times):
+        # Asserts the expected performance difference between the call times.
+        df_time, drf_time = times['django-filter'], times['drf-filters']
+        self.assertLess(drf_time, df_time * self.threshold)
+
     def test_sanity(self):
         # sanity check to ensure the call results are valid
-        call, args = self.get_callable(*self.django_filter_args())
-        self.validate_result(call(*args))
+        results = OrderedDict()
+        for label, args in self.get_calls():
+            call, args = self.get_callable(*args)
+            results[label] = call(*args)
 
-        call, args = self.get_callable(*self.rest_framework_filters_args())
-        self.validate_result(call(*args))
+        self.validate_results(results)
 
     def test_performance(self):
-        call, args = self.get_callable(*self.django_filter_args())
-        df_time = min(repeat(
-            lambda: call(*args),
-            number=self.iterations,
-            repeat=self.repeat,
-        ))
+        calls = OrderedDict()
+        for label, args in self.get_calls():
+            call, args = self.get_callable(*args)
+            calls[label] = partial(call, *args)
+
+        # alternate the measurements, so that any drift between runs affects each call
+        timings = OrderedDict((label, []) for label in calls)
+        for _ in range(self.repeat):
+            for label, call in calls.items():
+                timings[label] += repeat(call, number=self.iterations, repeat=1)
+        times = OrderedDict((label, min(t)) for label, t in timings.items())
 
-        call, args = self.get_callable(*self.rest_framework_filters_args())
-        drf_time = min(repeat(
-            lambda: call(*args),
-            number=self.iterations,
-            repeat=self.repeat,
-        ))
+        if verbosity >= 2:
+            self.report(times)
 
-        diff = (drf_time - df_time) / df_time * 100.0
+        self.check_times(times)
 
-        if verbosity >= 2:
-            print('\n' + '-' * 32)
-            print('%s performance' % self.label)
-            print('django-filter time:\t%.4fs' % df_time)
-            print('drf-filters time:\t%.4fs' % drf_time)
-            print('performance diff:\t%+.2f%% ' % diff)
-            print('-' * 32)
+    def report(self, times):
+        labels = list(times)
+        baseline = times[labels[0]]
 
-        self.assertLess(drf_time, df_time * self.threshold)
+        print('\n' + '-' * 32)
+        print('%s performance' % self.label)
+        for label in labels:
+            print('%s time:\t%.4fs' % (label, times[label]))
+        for label in labels[1:]:
+            diff = (times[label] - baseline) / baseline * 100.0
+            print('%s diff:\t%+.2f%% ' % (label, diff))
+        print('-' * 32)
 
 
 class FilterBackendTests(PerfTestMixin, TestCase):
@@ -128,6 +163,41 @@ class FilterBackendTests(PerfTestMixin, TestCase):
         self.assertEqual(qs.count(), 2)
 
 
+class RelatedChainTests(PerfTestMixin, TestCase):
+    # How does filtering across a chain of relationships (A -> B -> C) compare? Note
+    # that drf-filters initializes a filterset per relationship, while django-filter
+    # initializes a single filterset.
+    threshold = 4.0
+    label = 'Related Chain'
+
+    @classmethod
+    def setUpTestData(cls):
+        c = models.C.objects.create(title='c')
+        b = models.B.objects.create(name='b', c=c)
+        models.A.objects.create(title='a1', b=b)
+        models.A.objects.create(title='a2', b=b)
+        models.A.objects.create(title='a3')
+
+    def get_callable(self, filterset_class):
+        def call(data, queryset):
+            return filterset_class(data, queryset=queryset).qs
+
+        args = [
+            {'b__name': 'b', 'b__c__title': 'c'}, models.A.objects.all(),
+        ]
+
+        return call, args
+
+    def django_filter_args(self):
+        return [filters.AFilterWithExplicitRelated]
+
+    def rest_framework_filters_args(self):
+        return [AFilter]
+
+    def validate_result(self, qs):
+        self.assertEqual(qs.count(), 2)
+
+
 @override_settings(ROOT_URLCONF='tests.perf.urls')
 class WSGIResponseTests(PerfTestMixin, TestCase):
     # How much does drf-filters affect the request/response cycle? This includes
@@ -153,3 +223,375 @@ class WSGIResponseTests(PerfTestMixin, TestCase):
     def validate_result(self, response):
         self.assertEqual(response.status_code, 200, response.content)
         self.assertEqual(len(response.data), 2)
+
+
+@tag('perf')
+class FilterBindingTests(TestCase):
+    # How much memory is allocated per request when binding filters to a filterset,
+    # compared to deep copying them?
+    label = 'Filter Binding'
+
+    def get_allocated(self, filterset_class):
+        # Returns the peak and retained memory allocated by initializing the filterset.
+        data = {'author__username': 'bob', 'title__contains': 'Note'}
+        queryset = models.Note.objects.all()
+
+        tracemalloc.start()
+        try:
+            filterset = filterset_class(data, queryset=queryset)
+            filterset.related_filtersets['author'].filters
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return peak, retained
+
+    def test_allocations(self):
+        deepcopy_peak, deepcopy_retained = self.get_allocated(
+            filters.NoteFilterWithRelatedAllDeepcopy,
+        )
+        bound_peak, bound_retained = self.get_allocated(filters.NoteFilterWithRelatedAll)
+
+        if verbosity >= 2:
+            print('\n' + '-' * 32)
+            print('%s allocations (peak/retained)' % self.label)
+            print('deepcopy:\t%d / %d bytes' % (deepcopy_peak, deepcopy_retained))
+            print('bound:\t\t%d / %d bytes' % (bound_peak, bound_retained))
+            print('saved:\t\t%d / %d bytes' % (
+                deepcopy_peak - bound_peak, deepcopy_retained - bound_retained))
+            print('-' * 32)
+
+        self.assertLess(bound_peak, deepcopy_peak)
+        self.assertLess(bound_retained, deepcopy_retained)
+
+
+class FilterSetCreationTests(PerfTestMixin, TestCase):
+    # How long does it take to create a large filterset class with many auto filters,
+    # compared to a django-filter class with the equivalent explicit 'Meta.fields'?
+    label = 'FilterSet Creation'
+    iterations = 10
+    threshold = 1.25
+
+    lookups = ['exact', 'in', 'gt', 'lt', 'isnull']
+
+    @property
+    def field_names(self):
+        # e.g., 'name', 'best_friend__name', 'best_friend__best_friend__name', ...
+        names = ['name', 'best_friend', 'date_joined', 'time_joined', 'datetime_joined']
+        return [
+            'best_friend__' * depth + name
+            for depth in range(10) for name in names
+        ]
+
+    def get_callable(self, base, attrs):
+        def call():
+            return type('F', (base, ), attrs())
+        return call, []
+
+    def django_filter_args(self):
+        def attrs():
+            class Meta:
+                model = models.Person
+                fields = {name: self.lookups for name in self.field_names}
+
+            return {'Meta': Meta}
+        return filters.DFFilterSet, attrs
+
+    def rest_framework_filters_args(self):
+        def attrs():
+            class Meta:
+                model = models.Person
+                fields = []
+
+            auto_filters = {
+                name: drf_filters.AutoFilter(lookups=self.lookups)
+                for name in self.field_names
+            }
+            return dict(auto_filters, Meta=Meta)
+        return filters.DRFFilterSet, attrs
+
+    def validate_result(self, filterset_class):
+        self.assertEqual(len(filterset_class.base_filters), 250)
+
+
+class RelatedStrategyTests(PerfTestMixin, TestCase):
+    # How do the related filtering strategies compare when filtering across a
+    # many-to-many relationship, which requires DISTINCT for the subquery and join?
+    label = 'Related Strategy'
+    iterations = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        models.Tag.objects.bulk_create(
+            models.Tag(name='Tag %d' % i) for i in range(100)
+        )
+        # DISTINCT compares full rows, so the post content should be of realistic size
+        models.Post.objects.bulk_create(
+            models.Post(title='Post %d' % i, content='content ' * 250)
+            for i in range(5000)
+        )
+
+        # bulk created pks aren't set for all backends
+        tags = list(models.Tag.objects.values_list('pk', flat=True))
+        posts = list(models.Post.objects.values_list('pk', flat=True))
+
+        # each post has 5 tags, and most matching posts have multiple matching tags
+        Through = models.Post.tags.through
+        Through.objects.bulk_create(
+            Through(post_id=post, tag_id=tags[(i + j * 7) % len(tags)])
+            for i, post in enumerate(posts) for j in range(5)
+        )
+
+    def get_callable(self, filterset_class):
+        def call(data, queryset):
+            return list(filterset_class(data, queryset=queryset).qs)
+
+        args = [
+            {'tags__name__contains': '1'}, models.Post.objects.all(),
+        ]
+
+        return call, args
+
+    def get_calls(self):
+        return [
+            ('join + distinct', [filters.PostFilterWithExplicitRelated]),
+            ('subquery + distinct', [filters.PostFilterWithSubquery]),
+            ('exists', [filters.PostFilterWithExists]),
+        ]
+
+    def validate_results(self, results):
+        for label, result in results.items():
+            self.assertEqual(len(result), len(set(result)), label)
+            self.assertCountEqual(result, results['join + distinct'], label)
+
+    def check_times(self, times):
+        self.assertLess(times['exists'], times['subquery + distinct'])
+        self.assertLess(times['exists'], times['join + distinct'])
+
+
+class RelatedFlatteningTests(PerfTestMixin, TestCase):
+    # How does a flattened join compare to nested subqueries when filtering across a
+    # deep chain of relationships (A -> B -> C -> A -> B -> C)?
+    label = 'Related Flattening'
+    iterations = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        models.C.objects.bulk_create(models.C(title='c %d' % i) for i in range(2000))
+        cs = list(models.C.objects.values_list('pk', flat=True))
+        models.B.objects.bulk_create(
+            models.B(name='b %d' % i, c_id=c) for i, c in enumerate(cs)
+        )
+        bs = list(models.B.objects.values_list('pk', flat=True))
+        models.A.objects.bulk_create(
+            models.A(title='a %d' % i, b_id=b) for i, b in enumerate(bs)
+        )
+
+        # close the cycle, so that each C refers back to an A
+        for c, a in zip(cs, models.A.objects.values_list('pk', flat=True)):
+            models.C.objects.filter(pk=c).update(a_id=a)
+
+    def get_callable(self, filterset_class):
+        def call(data, queryset):
+            return list(filterset_class(data, queryset=queryset).qs)
+
+        args = [
+            {'b__c__a__b__c__title!': 'c 1', 'b__c__a__title!': 'a 10'},
+            models.A.objects.all(),
+        ]
+
+        return call, args
+
+    def get_calls(self):
+        return [
+            ('nested subquery', [AFilter]),
+            ('flattened join', [filters.AFilterWithJoin]),
+        ]
+
+    def validate_results(self, results):
+        self.assertCountEqual(results['flattened join'], results['nested subquery'])
+        self.assertEqual(len(results['flattened join']), 1998)
+
+    def check_times(self, times):
+        self.assertLess(times['flattened join'], times['nested subquery'])
+
+
+class ComplexFilterModeTests(PerfTestMixin, TestCase):
+    # How does compiling a complex query into a single Q object compare to filtering
+    # and combining a queryset for each querystring?
+    label = 'Complex Filter Mode'
+    iterations = 100
+
+    @classmethod
+    def setUpTestData(cls):
+        models.User.objects.bulk_create(
+            models.User(username='user %d' % i) for i in range(50)
+        )
+        users = list(models.User.objects.values_list('pk', flat=True))
+        models.Note.objects.bulk_create(
+            models.Note(title='Note %d' % i, author_id=users[i % len(users)])
+            for i in range(2000)
+        )
+
+    def get_callable(self, mode):
+        backend = type('Backend', (drf_backends.ComplexFilterBackend, ), {
+            'complex_filter_mode': mode,
+        })()
+        view = views.DRFFNoteViewSet()
+        querystring = quote(
+            '(author__username%3Duser 1) | (author__username%3Duser 2) '
+            '| (title__startswith%3DNote 1%26author__username%3Duser 3) '
+            '& ~(title__endswith%3D1)',
+        )
+        request = Request(factory.get('/', {'filters': querystring}))
+
+        def call(queryset):
+            return list(backend.filter_queryset(request, queryset, view))
+
+        return call, [models.Note.objects.all()]
+
+    def get_calls(self):
+        return [
+            ('combined querysets', ['combine']),
+            ('compiled Q', ['compile']),
+        ]
+
+    def validate_results(self, results):
+        self.assertCountEqual(results['compiled Q'], results['combined querysets'])
+        self.assertEqual(len(results['compiled Q']), 102)
+
+    def check_times(self, times):
+        self.assertLess(times['compiled Q'], times['combined querysets'])
+
+
+class GETSwappingComplexFilterBackend(drf_backends.ComplexFilterBackend):
+    # The previous implementation, which filtered each querystring through the full
+    # backend pipeline by temporarily replacing the request's query params.
+
+    def get_complex_tree(self, request, queryset, view):
+        # the querystrings were validated while they were filtered
+        return self.parse_complex_ops(request.query_params[self.complex_filter_param])
+
+    def get_filtered_querysets(self, querystrings, request, queryset, view):
+        original_GET = request._request.GET
+
+        querysets = []
+        for qs in querystrings:
+            request._request.GET = QueryDict(qs)
+            try:
+                querysets.append(df_backends.DjangoFilterBackend.filter_queryset(
+                    self, request, queryset, view,
+                ))
+            finally:
+                request._request.GET = original_GET
+
+        return querysets
+
+
+class ComplexFilterSubquerysetTests(PerfTestMixin, TestCase):
+    # How does building each querystring's filterset directly compare to running the
+    # full backend pipeline for each querystring, for a 10-way OR expression? Both
+    # paths are dominated by constructing and validating the filtersets, so the direct
+    # path isn't expected to be faster. It avoids modifying the request, and resolves
+    # the filterset class once instead of once per querystring.
+    label = 'Complex Filter Subquerysets'
+    iterations = 200
+
+    @classmethod
+    def setUpTestData(cls):
+        models.User.objects.bulk_create(
+            models.User(username='user %d' % i) for i in range(20)
+        )
+
+    def get_callable(self, backend):
+        view = views.DRFFNoteViewSet()
+        querystring = quote(' | '.join(
+            '(author__username%%3Duser %d%%26title__startswith%%3DNote %d)' % (i, i)
+            for i in range(10)
+        ))
+        request = Request(factory.get('/', {'filters': querystring}))
+
+        return backend.filter_queryset, [request, models.Note.objects.all(), view]
+
+    def get_calls(self):
+        return [
+            ('swapped request GET', [GETSwappingComplexFilterBackend()]),
+            ('direct filtersets', [drf_backends.ComplexFilterBackend()]),
+        ]
+
+    def validate_results(self, results):
+        swapping_qs, direct_qs = results.values()
+        self.assertEqual(str(direct_qs.query), str(swapping_qs.query))
+
+    def check_times(self, times):
+        # The timings are only reported, as neither path is consistently faster.
+        # Instead, `test_resolutions` asserts the filterset class resolution count.
+        pass
+
+    def count_resolutions(self, backend):
+        # Count how many times the filterset class is resolved for a single request.
+        call, args = self.get_callable(backend)
+
+        with mock.patch.object(backend, 'get_filterset_class',
+                               wraps=backend.get_filterset_class) as m:
+            call(*args)
+
+        return m.call_count
+
+    def test_resolutions(self):
+        self.assertEqual(self.count_resolutions(GETSwappingComplexFilterBackend()), 10)
+        self.assertEqual(self.count_resolutions(drf_backends.ComplexFilterBackend()), 1)
+
+
+class ComplexFilterSetsTests(PerfTestMixin, TestCase):
+    # How does combining the operands' primary keys with SQL set operations compare to
+    # combining the querysets into a single WHERE clause, when the operands join
+    # different relationships? (The OR'd joins are promoted to LEFT OUTER joins.)
+    label = 'Complex Filter Sets'
+    iterations = 50
+
+    @classmethod
+    def setUpTestData(cls):
+        models.User.objects.bulk_create(
+            models.User(username='user %d' % i) for i in range(1000)
+        )
+        users = list(models.User.objects.values_list('pk', flat=True))
+        models.Note.objects.bulk_create(
+            models.Note(title='Note %d' % i, author_id=users[i % len(users)])
+            for i in range(5000)
+        )
+        notes = list(models.Note.objects.values_list('pk', flat=True))
+        models.Post.objects.bulk_create(
+            models.Post(title='Post %d' % i, author_id=users[i % len(users)],
+                        note_id=notes[i % len(notes)])
+            for i in range(20000)
+        )
+
+    def get_callable(self, mode):
+        backend = type('Backend', (drf_backends.ComplexFilterBackend, ), {
+            'complex_filter_mode': mode,
+        })()
+        # the filters join the 'author' and 'note' relationships
+        view = views.DRFFNoteViewSet(filterset_class=filters.PostFilterWithJoins)
+        querystring = quote(
+            '(author__username%3Duser 1) | (note__title%3DNote 42) '
+            '| (title%3DPost 7)',
+        )
+        request = Request(factory.get('/', {'filters': querystring}))
+
+        def call(queryset):
+            return list(backend.filter_queryset(request, queryset, view))
+
+        return call, [models.Post.objects.all()]
+
+    def get_calls(self):
+        return [
+            ('combined querysets', ['combine']),
+            ('set operations', ['sets']),
+        ]
+
+    def validate_results(self, results):
+        self.assertCountEqual(results['set operations'], results['combined querysets'])
+
+    def check_times(self, times):
+        self.assertLess(times['set operations'], times['combined querysets'])
@@ -0,0 +1,436 @@
+from collections import Counter
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.test import TestCase
+
+from rest_framework_filters import FilterSet, filters, utils
+from tests.testapp.filters import (
+    AccountFilter, AFilter, BFilter, CustomerFilter, NoteFilter, PostFilter, TagFilter,
+    UserFilter,
+)
+from tests.testapp.models import A, Account, B, C, Customer, Note, Post, Tag
+
+
+class JoinNoteFilter(NoteFilter):
+    author = filters.RelatedFilter(
+        UserFilter, queryset=User.objects.all(), strategy=filters.JOIN,
+    )
+
+
+class JoinPostFilter(PostFilter):
+    related_strategy = filters.JOIN
+
+
+class JoinAFilter(AFilter):
+    related_strategy = filters.JOIN
+
+
+class ExistsPostFilter(PostFilter):
+    related_strategy = filters.EXISTS
+
+
+class ExistsUserFilter(UserFilter):
+    related_strategy = filters.EXISTS
+
+
+class MaterializePostFilter(PostFilter):
+    related_strategy = filters.MATERIALIZE
+    materialize_threshold = 1
+
+
+class RelatedStrategyData:
+
+    @classmethod
+    def setUpTestData(cls):
+        bob = User.objects.create(username='bob', email='bob@example.com')
+        joe = User.objects.create(username='joe', email='', is_active=False)
+
+        Note.objects.create(author=bob, title='Note 1')
+        Note.objects.create(author=bob, title='Note 2')
+        Note.objects.create(author=joe, title='Note 3')
+
+        t1 = Tag.objects.create(name='Tag 1')
+        t2 = Tag.objects.create(name='Tag 2')
+
+        Post.objects.create(author=bob, title='Post 1').tags.set([t1, t2])
+        Post.objects.create(author=joe, title='Post 2').tags.set([t1])
+        Post.objects.create(author=None, title='Post 3')
+
+    def assertEquivalent(self, filterset_class, data, expected):
+        queryset = filterset_class._meta.model.objects.all()
+        qs = filterset_class(data, queryset=queryset).qs
+
+        # force the subquery strategy for comparison
+        filterset = filterset_class(data, queryset=queryset)
+        filterset.filter_related_filterset = filterset.subquery_related_filterset
+        subquery = filterset.qs
+
+        # the results must be equivalent to the subquery strategy
+        self.assertEqual(sorted(o.title for o in qs), expected)
+        self.assertEqual(sorted(o.title for o in subquery), expected)
+
+        return qs
+
+    def assertJoined(self, filterset_class, data, expected):
+        sql = str(self.assertEquivalent(filterset_class, data, expected).query)
+
+        self.assertNotIn('IN (SELECT', sql)
+        self.assertIn('JOIN', sql)
+
+    def assertSubquery(self, filterset_class, data, expected):
+        sql = str(self.assertEquivalent(filterset_class, data, expected).query)
+
+        self.assertIn('IN (SELECT', sql)
+
+    def assertExists(self, filterset_class, data, expected):
+        qs = self.assertEquivalent(filterset_class, data, expected)
+        self.assertEqual(qs.count(), len(expected))
+
+        sql = str(qs.query)
+        self.assertIn('EXISTS', sql)
+        self.assertNotIn('DISTINCT', sql)
+        self.assertFalse(qs.query.distinct)
+
+
+class JoinStrategyTests(RelatedStrategyData, TestCase):
+
+    def test_join(self):
+        self.assertJoined(
+            JoinNoteFilter, {'author__username': 'bob'}, ['Note 1', 'Note 2'],
+        )
+
+    def test_join_multiple_filters(self):
+        self.assertJoined(
+            JoinNoteFilter,
+            {'author__username__startswith': 'b', 'author__email': 'joe@example.com'},
+            [],
+        )
+
+    def test_join_exclusion(self):
+        self.assertJoined(JoinNoteFilter, {'author__username!': 'bob'}, ['Note 3'])
+
+    def test_nullable_exclusion(self):
+        # Post 3 has no author, and must not be matched by the joined exclusion
+        self.assertJoined(JoinPostFilter, {'author__username!': 'bob'}, ['Post 2'])
+
+    def test_nullable_isnull(self):
+        self.assertJoined(
+            JoinPostFilter, {'author__last_login__isnull': 'true'}, ['Post 1', 'Post 2'],
+        )
+
+    def test_filterset_default(self):
+        self.assertEqual(PostFilter.related_strategy, filters.SUBQUERY)
+        self.assertEqual(JoinPostFilter.related_strategy, filters.JOIN)
+        self.assertJoined(JoinPostFilter, {'author__username': 'joe'}, ['Post 2'])
+
+    def test_restricted_queryset_fallback(self):
+        class F(NoteFilter):
+            author = filters.RelatedFilter(
+                UserFilter,
+                queryset=User.objects.filter(is_active=True),
+                strategy=filters.JOIN,
+            )
+
+        # joe is not active, so would only be matched by the unrestricted join
+        self.assertSubquery(F, {'author__username': 'joe'}, [])
+
+    def test_multi_valued_fallback(self):
+        self.assertSubquery(JoinPostFilter, {'tags__name': 'Tag 1'}, ['Post 1', 'Post 2'])
+
+    def test_nested_related(self):
+        self.assertJoined(JoinPostFilter, {'note__author__username': 'bob'}, [])
+
+    def test_nested_multi_valued_fallback(self):
+        self.assertSubquery(JoinNoteFilter, {'author__posts__title': 'Post 1'}, [
+            'Note 1', 'Note 2',
+        ])
+
+    def test_multi_valued_filter_fallback(self):
+        # the related filter traverses posts, so joining it would duplicate notes
+        class F(UserFilter):
+            post_title = filters.CharFilter(
+                field_name='post__title', lookup_expr='startswith',
+            )
+
+        class G(NoteFilter):
+            author = filters.RelatedFilter(
+                F, queryset=User.objects.all(), strategy=filters.JOIN,
+            )
+
+        Post.objects.create(author=User.objects.get(username='joe'), title='Post 4')
+        data = {'author__post_title': 'Post'}
+
+        self.assertFalse(G(data).can_join_related(Note.objects.all(), 'author'))
+        self.assertSubquery(G, data, ['Note 1', 'Note 2', 'Note 3'])
+
+    def test_nested_cycle(self):
+        c = C.objects.create(title='c')
+        b = B.objects.create(name='b', c=c)
+        c.a = A.objects.create(title='a1', b=b)
+        c.save()
+        A.objects.create(title='a2', b=b)
+        A.objects.create(title='a3', b=B.objects.create(name='b'))
+        A.objects.create(title='a4')
+
+        # A -> B -> C -> A is flattened into a single query
+        self.assertJoined(JoinAFilter, {'b__c__a__title': 'a1'}, ['a1', 'a2'])
+        self.assertJoined(
+            JoinAFilter, {'b__name': 'b', 'b__c__title!': 'd'}, ['a1', 'a2'],
+        )
+        self.assertJoined(JoinAFilter, {'b__c__a__b__c__title': 'c'}, ['a1', 'a2'])
+        self.assertJoined(JoinAFilter, {'b__c__a__title!': 'a1'}, [])
+        self.assertJoined(JoinAFilter, {'b__c__a__b__name!': 'b'}, [])
+
+    def test_nested_strategy_fallback(self):
+        class F(BFilter):
+            c = filters.RelatedFilter(
+                'tests.testapp.filters.CFilter',
+                queryset=C.objects.all(),
+                strategy=filters.SUBQUERY,
+            )
+
+        class G(AFilter):
+            b = filters.RelatedFilter(F, queryset=B.objects.all())
+
+            related_strategy = filters.JOIN
+
+        c = C.objects.create(title='c')
+        A.objects.create(title='a1', b=B.objects.create(name='b', c=c))
+
+        filterset = G({'b__name': 'b', 'b__c__title': 'c'}, queryset=A.objects.all())
+        self.assertFalse(filterset.can_join_related(A.objects.all(), 'b'))
+        self.assertSubquery(G, {'b__name': 'b', 'b__c__title': 'c'}, ['a1'])
+
+        # the nested filterset's strategy is only relevant when it has data
+        self.assertJoined(G, {'b__name': 'b'}, ['a1'])
+
+    def test_nested_restricted_queryset_fallback(self):
+        class F(BFilter):
+            c = filters.RelatedFilter(
+                'tests.testapp.filters.CFilter', queryset=C.objects.filter(title='c'),
+            )
+
+        class G(AFilter):
+            b = filters.RelatedFilter(F, queryset=B.objects.all())
+
+            related_strategy = filters.JOIN
+
+        A.objects.create(title='a1', b=B.objects.create(name='b', c=C.objects.create()))
+
+        # the unrestricted join would match the untitled C
+        self.assertSubquery(G, {'b__c__title__isnull': 'false'}, [])
+
+    def test_method_filter_fallback(self):
+        class F(UserFilter):
+            name = filters.CharFilter(method='filter_name')
+
+            def filter_name(self, queryset, field_name, value):
+                return queryset.filter(username=value)
+
+        class G(NoteFilter):
+            author = filters.RelatedFilter(
+                F, queryset=User.objects.all(), strategy=filters.JOIN,
+            )
+
+        self.assertSubquery(G, {'author__name': 'joe'}, ['Note 3'])
+
+    def test_invalid_strategy(self):
+        msg = ("Invalid related filter strategy 'foo'. "
+               "Expected one of: subquery, join, exists, materialize.")
+        with self.assertRaisesMessage(ValueError, msg):
+            filters.RelatedFilter(TagFilter, queryset=Tag.objects.all(), strategy='foo')
+
+    def test_can_join_related(self):
+        filterset = JoinPostFilter({'author__username': 'bob', 'tags__name': 'Tag 1'})
+
+        self.assertTrue(filterset.can_join_related(Post.objects.all(), 'author'))
+        self.assertFalse(filterset.can_join_related(Post.objects.all(), 'tags'))
+
+    def test_custom_qs(self):
+        # the filtering of an overridden `qs` can't be joined
+        class ActiveUserFilter(UserFilter):
+            @property
+            def qs(self):
+                return super().qs.filter(is_active=True)
+
+        class F(JoinPostFilter):
+            author = filters.RelatedFilter(ActiveUserFilter, queryset=User.objects.all())
+
+        data = {'author__username__in': 'bob,joe'}
+        filterset = F(data)
+
+        self.assertFalse(filterset.can_join_related(Post.objects.all(), 'author'))
+        self.assertSubquery(F, data, ['Post 1'])
+
+    def test_custom_filter_related_filtersets(self):
+        class F(UserFilter):
+            def filter_related_filtersets(self, queryset):
+                return super().filter_related_filtersets(queryset).filter(is_active=True)
+
+        class G(JoinPostFilter):
+            author = filters.RelatedFilter(F, queryset=User.objects.all())
+
+        data = {'author__username__in': 'bob,joe'}
+        filterset = G(data)
+
+        self.assertFalse(filterset.can_join_related(Post.objects.all(), 'author'))
+        self.assertSubquery(G, data, ['Post 1'])
+
+
+class ExistsStrategyTests(RelatedStrategyData, TestCase):
+
+    def test_many_to_many(self):
+        # Post 1 has both tags, but must not be duplicated
+        self.assertExists(ExistsPostFilter, {'tags__name__contains': 'Tag'}, [
+            'Post 1', 'Post 2',
+        ])
+
+    def test_reverse_foreign_key(self):
+        Post.objects.create(author=User.objects.get(username='bob'), title='Post 4')
+
+        qs = ExistsUserFilter(
+            {'posts__title__startswith': 'Post'}, queryset=User.objects.all(),
+        ).qs
+
+        self.assertIn('EXISTS', str(qs.query))
+        self.assertEqual(sorted(u.username for u in qs), ['bob', 'joe'])
+
+    def test_forward_foreign_key(self):
+        self.assertExists(ExistsPostFilter, {'author__username': 'bob'}, ['Post 1'])
+
+    def test_to_field(self):
+        # the foreign key targets `Customer.ssn` instead of the primary key
+        c1 = Customer.objects.create(name='c1', ssn='111', dob='1990-01-01')
+        c2 = Customer.objects.create(name='c2', ssn='222', dob='1990-01-01')
+        Customer.objects.create(name='c3', ssn='333', dob='1990-01-01')
+        Account.objects.create(customer=c1, type='c', name='a1')
+        Account.objects.create(customer=c2, type='c', name='a2')
+        Account.objects.create(customer=c2, type='s', name='a3')
+
+        class F(CustomerFilter):
+            related_strategy = filters.EXISTS
+
+        class G(AccountFilter):
+            related_strategy = filters.EXISTS
+
+        cases = [
+            (F, {'accounts__type': 'c'}, Customer, ['c1', 'c2']),
+            (F, {'accounts__type': 's'}, Customer, ['c2']),
+            (G, {'customer__name': 'c2'}, Account, ['a2', 'a3']),
+        ]
+        for filterset_class, data, model, expected in cases:
+            with self.subTest(data=data):
+                qs = filterset_class(data, queryset=model.objects.all()).qs
+
+                self.assertIn('EXISTS', str(qs.query))
+                self.assertEqual(sorted(o.name for o in qs), expected)
+
+    def test_restricted_queryset(self):
+        class F(PostFilter):
+            author = filters.RelatedFilter(
+                UserFilter,
+                queryset=User.objects.filter(is_active=True),
+                strategy=filters.EXISTS,
+            )
+
+        self.assertExists(F, {'author__username__startswith': 'j'}, [])
+        self.assertExists(F, {'author__username__startswith': 'b'}, ['Post 1'])
+
+    def test_hidden_reverse_relation_fallback(self):
+        filterset = ExistsPostFilter({'tags__name': 'Tag 1'})
+        self.assertTrue(filterset.can_correlate_related(Post.objects.all(), 'tags'))
+
+        with mock.patch.object(utils, 'get_reverse_path', return_value=None):
+            self.assertFalse(filterset.can_correlate_related(Post.objects.all(), 'tags'))
+
+
+class MaterializeStrategyTests(RelatedStrategyData, TestCase):
+
+    def assertMaterialized(self, filterset_class, data, expected):
+        sql = str(self.assertEquivalent(filterset_class, data, expected).query)
+
+        self.assertNotIn('IN (SELECT', sql)
+
+    def test_materialize(self):
+        self.assertMaterialized(MaterializePostFilter, {'author__username': 'bob'}, [
+            'Post 1',
+        ])
+
+    def test_empty(self):
+        filterset = MaterializePostFilter(
+            {'author__username': 'foo'}, queryset=Post.objects.all(),
+        )
+
+        # an empty list of values doesn't query the filtered queryset
+        with self.assertNumQueries(1):
+            self.assertEqual(list(filterset.qs), [])
+
+    def test_threshold_fallback(self):
+        self.assertSubquery(MaterializePostFilter, {'author__email__contains': ''}, [
+            'Post 1', 'Post 2',
+        ])
+
+    def test_threshold_query(self):
+        filterset = MaterializePostFilter(
+            {'author__username': 'bob'}, queryset=Post.objects.all(),
+        )
+
+        # the related values are fetched with a limit of threshold + 1
+        with self.assertNumQueries(1) as cm:
+            filterset.qs
+        self.assertIn('LIMIT 2', cm.captured_queries[0]['sql'])
+
+    def test_per_relation_threshold(self):
+        class F(MaterializePostFilter):
+            author = filters.RelatedFilter(
+                UserFilter, queryset=User.objects.all(), materialize_threshold=2,
+            )
+
+        self.assertMaterialized(F, {'author__email__contains': ''}, [
+            'Post 1', 'Post 2',
+        ])
+
+    def test_multi_valued(self):
+        class F(MaterializePostFilter):
+            materialize_threshold = 2
+
+        self.assertMaterialized(F, {'tags__name__contains': 'Tag'}, [
+            'Post 1', 'Post 2',
+        ])
+
+    def test_stats(self):
+        class F(MaterializePostFilter):
+            materialize_stats = Counter()
+
+        F({'author__username': 'bob'}, queryset=Post.objects.all()).qs
+        F({'author__username': 'joe'}, queryset=Post.objects.all()).qs
+        F({'author__email__contains': ''}, queryset=Post.objects.all()).qs
+
+        self.assertEqual(F.materialize_stats, {
+            ('testapp.Post.author', 'materialized'): 2,
+            ('testapp.Post.author', 'subquery'): 1,
+        })
+
+    def test_disabled_stats(self):
+        self.assertIsNone(FilterSet.materialize_stats)
+
+
+class SubqueryStrategyTests(RelatedStrategyData, TestCase):
+
+    def test_subquery_strategy(self):
+        class F(FilterSet):
+            author = filters.RelatedFilter(
+                UserFilter, queryset=User.objects.all(), strategy=filters.SUBQUERY,
+            )
+
+            related_strategy = filters.JOIN
+
+            class Meta:
+                model = Note
+                fields = []
+
+        qs = F({'author__username': 'bob'}, queryset=Note.objects.all()).qs
+
+        self.assertIn('IN (SELECT', str(qs.query))
+        self.assertEqual(qs.count(), 2)
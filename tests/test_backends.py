@@ -1,15 +1,25 @@
+from unittest import mock
 from urllib.parse import quote, urlencode
 
 import django_filters
+from django import forms
+from django.db import connection
+from django.db.models import QuerySet
 from django.test import modify_settings
-from rest_framework import status
+from rest_framework import renderers, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.test import APIRequestFactory, APITestCase
 
-from rest_framework_filters import FilterSet, filters
-from rest_framework_filters.backends import RestFrameworkFilterBackend
+from rest_framework_filters import FilterSet, backends, filters, utils
+from rest_framework_filters.backends import (
+    ComplexFilterBackend, RestFrameworkFilterBackend,
+)
+from rest_framework_filters.complex_ops import Operand
+from rest_framework_filters.costs import LookupCostPolicy
 from rest_framework_filters.filterset import SubsetDisabledMixin
 
 from .testapp import models, views
+from .testapp.filters import NoteFilter, PostFilter
 
 factory = APIRequestFactory()
 
@@ -129,6 +139,85 @@ class BackendTests(APITestCase):
             self.assertIsNone(backend.get_filterset(request, view.queryset, view))
 
 
+class QueryComplexityTests(APITestCase):
+
+    class Backend(RestFrameworkFilterBackend):
+        max_related_depth = 1
+        max_related_filtersets = 2
+        max_filters = 3
+
+    def filter_queryset(self, querystring, backend=Backend):
+        view = views.NoteViewSet(action_map={})
+        request = view.initialize_request(factory.get('/?' + querystring))
+        return backend().filter_queryset(request, view.get_queryset(), view)
+
+    def test_within_limits(self):
+        qs = self.filter_queryset('title=a&author__username=b&author__email=c')
+        self.assertEqual(list(qs), [])
+
+    def test_related_depth(self):
+        with self.assertRaises(ValidationError) as cm:
+            self.filter_queryset('author__posts__title=a')
+
+        self.assertEqual(cm.exception.detail, [
+            'Filtering across relationships is limited to a depth of 1.',
+        ])
+
+    def test_multiple_limits(self):
+        querystring = 'title=a&title!=b&author__username=c&author__posts__note__title=d'
+        with self.assertRaises(ValidationError) as cm:
+            self.filter_queryset(querystring)
+
+        self.assertEqual(cm.exception.detail, [
+            'Filtering across relationships is limited to a depth of 1.',
+            'Filtering is limited to 2 related filtersets.',
+            'Filtering is limited to 3 filters.',
+        ])
+
+    def test_checked_before_initialization(self):
+        with mock.patch.object(NoteFilter, '__init__') as init:
+            with self.assertRaises(ValidationError):
+                self.filter_queryset('author__posts__title=a')
+
+        init.assert_not_called()
+
+    def test_no_limits(self):
+        qs = self.filter_queryset(
+            'author__posts__note__author__username=a', backend=RestFrameworkFilterBackend,
+        )
+        self.assertEqual(list(qs), [])
+
+    def test_response(self):
+        class ViewSet(views.NoteViewSet):
+            filter_backends = [self.Backend]
+
+        view = ViewSet.as_view({'get': 'list'})
+        response = view(factory.get('/', {'author__posts__title': 'a'}))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [
+            'Filtering across relationships is limited to a depth of 1.',
+        ])
+
+    def test_browsable_api(self):
+        # rendering the filter form doesn't check the query complexity again
+        class Backend(RestFrameworkFilterBackend):
+            max_filters = 1
+
+        class ViewSet(views.NoteViewSet):
+            filter_backends = [Backend]
+            renderer_classes = [renderers.BrowsableAPIRenderer, renderers.JSONRenderer]
+
+        view = ViewSet.as_view({'get': 'list'})
+        response = view(factory.get('/', {'title': 'x', 'author': '1'}))
+        response.render()
+
+        content = response.rendered_content.decode()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('Filtering is limited to 1 filters.', content)
+        self.assertIn('<h2>Field filters</h2>', content)
+
+
 class BackendRenderingTests(RenderMixin, APITestCase):
 
     def test_sanity(self):
@@ -405,6 +494,7 @@ class BackendCrispyFormsRenderingTests(RenderMixin, APITestCase):
 
 
 class ComplexFilterBackendTests(APITestCase):
+    complex_filter_mode = 'combine'
 
     @classmethod
     def setUpTestData(cls):
@@ -413,6 +503,20 @@ class ComplexFilterBackendTests(APITestCase):
         models.User.objects.create(username="user3", email="user3@example.org")
         models.User.objects.create(username="user4", email="user4@example.org")
 
+    def setUp(self):
+        patcher = mock.patch.object(
+            views.ComplexFilterFieldsUserViewSet, 'complex_filter_mode',
+            self.complex_filter_mode, create=True,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_complex_filter_mode(self):
+        view = views.ComplexFilterFieldsUserViewSet()
+        mode = ComplexFilterBackend().get_complex_filter_mode(view)
+
+        self.assertEqual(mode, self.complex_filter_mode)
+
     def test_valid(self):
         readable = quote('(username%3Duser1)|(email__contains%3Dexample.org)')
         response = self.client.get('/ffcomplex-users/?filters=' + readable)
@@ -429,9 +533,123 @@ class ComplexFilterBackendTests(APITestCase):
 
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertDictEqual(response.data, {
-            'filters': ["Invalid querystring operator. Matched: 'asdf'."],
+            'filters': ["Invalid querystring operator 'asdf' at position 16."],
+        })
+
+    def test_nested_groups(self):
+        readable = quote(
+            "((username%3Duser1) | (email__contains%3Dexample.org))"
+            " & ~(username%3Duser3)",
+        )
+        response = self.client.get('/ffcomplex-users/?filters=' + readable)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(
+            [r['username'] for r in response.data],
+            ['user1', 'user4'],
+        )
+
+    def test_precedence(self):
+        # parsed as: (username=user1) | ((email__contains=example.org) & (username=user3))
+        readable = quote(
+            '(username%3Duser1) | (email__contains%3Dexample.org) & (username%3Duser3)',
+        )
+        response = self.client.get('/ffcomplex-users/?filters=' + readable)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertListEqual(
+            [r['username'] for r in response.data],
+            ['user1', 'user3'],
+        )
+
+    def test_max_complex_length(self):
+        class Backend(ComplexFilterBackend):
+            max_complex_length = 30
+
+        class ViewSet(views.ComplexFilterFieldsUserViewSet):
+            filter_backends = [Backend]
+
+        view = ViewSet.as_view({'get': 'list'})
+        readable = quote('(username%3Duser1) | (username%3Duser2)')
+        response = view(factory.get('/?filters=' + readable))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertDictEqual(response.data, {
+            'filters': ['Ensure the complex querystring has at most 30 characters.'],
+        })
+
+    def test_max_complex_depth(self):
+        view = views.ComplexFilterFieldsUserViewSet.as_view({'get': 'list'})
+        readable = '(username%3Duser1)'
+        for _ in range(50):
+            readable = '~((username%3Duser2) | ' + readable + ')'
+
+        response = view(factory.get('/', {'filters': quote(readable)}))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertDictEqual(response.data, {
+            'filters': [
+                'Ensure the complex querystring is nested at most 10 levels deep '
+                '(position 115).',
+            ],
         })
 
+    def test_request_not_modified(self):
+        params = []
+
+        class F(FilterSet):
+            class Meta:
+                model = models.User
+                fields = ['username']
+
+            def __init__(self, *args, request=None, **kwargs):
+                params.append((request.query_params.dict(), kwargs['data'].dict()))
+                super().__init__(*args, request=request, **kwargs)
+
+        class ViewSet(views.ComplexFilterFieldsUserViewSet):
+            filterset_class = F
+
+        view = ViewSet.as_view({'get': 'list'})
+        readable = quote('(username%3Duser1) | (username%3Duser2)')
+
+        with mock.patch.object(ComplexFilterBackend, 'get_filterset_class',
+                               side_effect=ComplexFilterBackend.get_filterset_class,
+                               autospec=True) as get_filterset_class:
+            response = view(factory.get('/', {'filters': readable}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['username'] for r in response.data], ['user1', 'user2'])
+
+        # the filterset class is resolved once
+        get_filterset_class.assert_called_once()
+        self.assertEqual(params, [
+            ({'filters': readable}, {'username': 'user1'}),
+            ({'filters': readable}, {'username': 'user2'}),
+        ])
+
+    def test_custom_get_filterset(self):
+        # each querystring's filterset is built by `get_filterset()`
+        data = []
+
+        class Backend(ComplexFilterBackend):
+            def get_filterset(self, request, queryset, view):
+                filterset = super().get_filterset(request, queryset, view)
+                data.append(filterset.data.dict())
+                return filterset
+
+        class ViewSet(views.ComplexFilterFieldsUserViewSet):
+            filter_backends = [Backend]
+
+        view = ViewSet.as_view({'get': 'list'})
+        readable = quote('(username%3Duser1) | (email%3Duser2%40example.com)')
+        response = view(factory.get('/', {'filters': readable}))
+
+        self.assertEqual(data, [
+            {'username': 'user1'}, {'email': 'user2@example.com'},
+        ])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['username'] for r in response.data], ['user1', 'user2'])
+
     def test_invalid_filterset_errors(self):
         readable = quote('(id%3Dfoo) | (id%3Dbar)')
         response = self.client.get('/ffcomplex-users/?filters=' + readable)
@@ -448,6 +666,38 @@ class ComplexFilterBackendTests(APITestCase):
             },
         })
 
+    def test_max_complex_ops(self):
+        class Backend(ComplexFilterBackend):
+            max_complex_ops = 2
+            max_filters = 1
+
+        class ViewSet(views.ComplexFilterFieldsUserViewSet):
+            filter_backends = [Backend]
+
+        view = ViewSet.as_view({'get': 'list'})
+        readable = quote('(username%3Duser1) | (username%3Duser2)')
+        response = view(factory.get('/?filters=' + readable))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        readable = quote('(username%3Duser1) | (username%3Duser2) | (id%3D3)')
+        response = view(factory.get('/?filters=' + readable))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertDictEqual(response.data, {
+            'filters': ['Complex filtering is limited to 2 querystrings.'],
+        })
+
+        # the other limits are checked for each querystring
+        readable = quote('(username%3Duser1%26id%3D1) | (username%3Duser2)')
+        response = view(factory.get('/?filters=' + readable))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertDictEqual(response.data, {
+            'filters': {
+                'username=user1&id=1': ['Filtering is limited to 1 filters.'],
+            },
+        })
+
     def test_pagination_compatibility(self):
         # Ensure that complex-filtering does not affect additional query param processing.
         readable = quote('(email__contains%3Dexample.org)')
@@ -480,3 +730,609 @@ class ComplexFilterBackendTests(APITestCase):
             [r['username'] for r in response.data['results']],
             ['user3'],
         )
+
+
+class CompileModeComplexFilterBackendTests(ComplexFilterBackendTests):
+    complex_filter_mode = 'compile'
+
+
+class SetsModeComplexFilterBackendTests(ComplexFilterBackendTests):
+    complex_filter_mode = 'sets'
+
+
+class CompiledComplexFilterBackendTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        bob = models.User.objects.create(username='bob', email='bob@example.com')
+        joe = models.User.objects.create(username='joe', email='joe@example.org')
+        models.User.objects.create(username='sue', email='sue@example.org')
+
+        models.Note.objects.create(author=bob, title='Note 1')
+        models.Note.objects.create(author=joe, title='Note 2')
+        models.Note.objects.create(author=joe, title='Note 3')
+
+    def get_view(self, mode, **attrs):
+        attrs['complex_filter_mode'] = mode
+        Backend = type('Backend', (ComplexFilterBackend, ), attrs)
+
+        class ViewSet(views.NoteViewSet):
+            queryset = models.Note.objects.order_by('pk')
+            filter_backends = [Backend]
+
+        return ViewSet.as_view({'get': 'list'})
+
+    def get_titles(self, mode, readable, **attrs):
+        view = self.get_view(mode, **attrs)
+        response = view(factory.get('/', {'filters': quote(readable)}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [r['title'] for r in response.data]
+
+    def assertEquivalent(self, readable, expected):
+        self.assertEqual(self.get_titles('combine', readable), expected)
+        self.assertEqual(self.get_titles('compile', readable), expected)
+        self.assertEqual(self.get_titles('sets', readable), expected)
+
+    def test_equivalent(self):
+        self.assertEquivalent('(title%3DNote 1) | (author__username%3Djoe)', [
+            'Note 1', 'Note 2', 'Note 3',
+        ])
+        self.assertEquivalent(
+            '(author__username__startswith%3Dj) & ~((title%3DNote 2) | (title%3DNote 4))',
+            ['Note 3'],
+        )
+        self.assertEquivalent('~(author__username%3Djoe%26title%3DNote 2)', [
+            'Note 1', 'Note 3',
+        ])
+
+    def test_unfiltered_operands(self):
+        # operands without active filters match all rows, in every mode
+        notes = ['Note 1', 'Note 2', 'Note 3']
+        self.assertEquivalent('(title%3DNote 1) | (foo%3Dbar)', notes)
+        self.assertEquivalent('(title%3DNote 1) | (title%3D)', notes)
+        self.assertEquivalent('~(foo%3Dbar)', [])
+        self.assertEquivalent('~(title%3D)', [])
+        self.assertEquivalent('(title%3DNote 1) | ~(title%3D)', ['Note 1'])
+
+    def test_unfiltered_operands_without_filterset(self):
+        cases = [
+            ('(title%3DNote 1) | (foo%3Dbar)', ['Note 1', 'Note 2', 'Note 3']),
+            ('~(foo%3Dbar)', []),
+        ]
+        for mode in ['combine', 'compile', 'sets']:
+            class ViewSet(views.NoteViewSet):
+                queryset = models.Note.objects.order_by('pk')
+                filter_backends = [type('Backend', (ComplexFilterBackend, ), {
+                    'complex_filter_mode': mode,
+                })]
+                filterset_class = None
+
+            view = ViewSet.as_view({'get': 'list'})
+            for readable, expected in cases:
+                with self.subTest(mode=mode, readable=readable):
+                    response = view(factory.get('/', {'filters': quote(readable)}))
+
+                    self.assertEqual([r['title'] for r in response.data], expected)
+
+    def test_nullable_relation(self):
+        # negations match the rows for which the negated conditions are unknown
+        bob = models.User.objects.get(username='bob')
+        models.Post.objects.create(title='a', author=bob)
+        models.Post.objects.create(title='b')
+
+        class ViewSet(views.NoteViewSet):
+            queryset = models.Post.objects.order_by('pk')
+            filterset_class = PostFilter
+
+        cases = [
+            ('~(author__username%3Dbob)', ['b']),
+            ('~(author__username%3Djoe)', ['a', 'b']),
+            ('(title%3Db) | ~(author%3D{})'.format(bob.pk), ['b']),
+            ('~((title%3Da) & (author__username%3Dbob))', ['b']),
+        ]
+        for mode in ['combine', 'compile', 'sets']:
+            backend = type('Backend', (ComplexFilterBackend, ), {
+                'complex_filter_mode': mode,
+            })
+
+            for readable, expected in cases:
+                with self.subTest(mode=mode, readable=readable):
+                    view = ViewSet(action_map={})
+                    request = view.initialize_request(
+                        factory.get('/', {'filters': quote(readable)}),
+                    )
+                    qs = backend().filter_queryset(request, view.get_queryset(), view)
+
+                    self.assertEqual([post.title for post in qs], expected)
+
+    def test_single_query(self):
+        readable = quote('(title%3DNote 1) | ~(author__username%3Djoe)')
+
+        with self.assertNumQueries(1) as cm:
+            self.get_view('compile')(factory.get('/', {'filters': readable}))
+
+        sql = cm.captured_queries[0]['sql']
+        self.assertEqual(sql.count('IN (SELECT'), 1)
+        self.assertIn(' OR ', sql)
+
+    def test_compiled(self):
+        with mock.patch.object(ComplexFilterBackend, 'get_filtered_querysets') as m:
+            self.get_titles('compile', '(title%3DNote 1) | (title%3DNote 2)')
+
+        m.assert_not_called()
+
+    def test_fallback(self):
+        # method filters can't be compiled, so the querysets are combined
+        class F(NoteFilter):
+            title = filters.CharFilter(method='filter_title')
+
+            def filter_title(self, queryset, field_name, value):
+                return queryset.filter(title=value)
+
+        class ViewSet(views.NoteViewSet):
+            queryset = models.Note.objects.order_by('pk')
+            filter_backends = [type('Backend', (ComplexFilterBackend, ), {
+                'complex_filter_mode': 'compile',
+            })]
+            filterset_class = F
+
+        view = ViewSet.as_view({'get': 'list'})
+        readable = quote('(title%3DNote 1) | (author__username%3Djoe)')
+
+        with mock.patch('rest_framework_filters.backends.combine_complex_tree',
+                        wraps=backends.combine_complex_tree) as m:
+            response = view(factory.get('/', {'filters': readable}))
+
+        m.assert_called_once()
+        self.assertEqual([r['title'] for r in response.data], [
+            'Note 1', 'Note 2', 'Note 3',
+        ])
+
+    def test_custom_qs(self):
+        # filtering added by an overridden `qs` property is not skipped
+        class F(NoteFilter):
+            @property
+            def qs(self):
+                return super().qs.exclude(title='Note 2')
+
+        class ViewSet(views.NoteViewSet):
+            queryset = models.Note.objects.order_by('pk')
+            filter_backends = [type('Backend', (ComplexFilterBackend, ), {
+                'complex_filter_mode': 'compile',
+            })]
+            filterset_class = F
+
+        view = ViewSet.as_view({'get': 'list'})
+        readable = quote('(title%3DNote 1) | (author__username%3Djoe)')
+        response = view(factory.get('/', {'filters': readable}))
+
+        self.assertEqual([r['title'] for r in response.data], ['Note 1', 'Note 3'])
+
+    def test_custom_operators(self):
+        # custom operators are not compiled
+        operators = {'&': QuerySet.__and__, '|': QuerySet.__or__}
+
+        with mock.patch.object(ComplexFilterBackend, 'compile_complex_queryset') as m:
+            titles = self.get_titles(
+                'compile', '(title%3DNote 1) | (title%3DNote 2)', operators=operators,
+            )
+
+        m.assert_not_called()
+        self.assertEqual(titles, ['Note 1', 'Note 2'])
+
+    def test_errors(self):
+        view = self.get_view('compile')
+        response = view(factory.get('/', {'filters': quote('(author%3Dfoo) | (id%3D1)')}))
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {
+            'filters': {
+                'author=foo': {
+                    'author': [
+                        'Select a valid choice. '
+                        'That choice is not one of the available choices.',
+                    ],
+                },
+            },
+        })
+
+
+class SetsComplexFilterBackendTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        bob = models.User.objects.create(username='bob')
+        joe = models.User.objects.create(username='joe')
+
+        models.Note.objects.create(author=bob, title='Note 1')
+        models.Note.objects.create(author=joe, title='Note 2')
+        models.Note.objects.create(author=joe, title='Note 3')
+
+    def get_view(self, backend_mode=None, view_mode=None):
+        attrs = {'complex_filter_mode': backend_mode} if backend_mode else {}
+        Backend = type('Backend', (ComplexFilterBackend, ), attrs)
+
+        class ViewSet(views.NoteViewSet):
+            queryset = models.Note.objects.order_by('pk')
+            filter_backends = [Backend]
+
+        if view_mode:
+            ViewSet.complex_filter_mode = view_mode
+
+        return ViewSet.as_view({'get': 'list'})
+
+    def get_response(self, view, readable):
+        with self.assertNumQueries(1) as cm:
+            response = view(factory.get('/', {'filters': quote(readable)}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return [r['title'] for r in response.data], cm.captured_queries[0]['sql']
+
+    def test_set_operations(self):
+        view = self.get_view('sets')
+        titles, sql = self.get_response(
+            view, '(title%3DNote 1) | (author__username%3Djoe) & ~(title%3DNote 2)',
+        )
+
+        self.assertEqual(titles, ['Note 1', 'Note 3'])
+        self.assertIn(' UNION ', sql)
+        self.assertIn(' INTERSECT ', sql)
+        self.assertIn(' EXCEPT ', sql)
+        self.assertNotIn(' OR ', sql)
+
+    def test_view_mode(self):
+        readable = '(title%3DNote 1) | (title%3DNote 2)'
+
+        titles, sql = self.get_response(self.get_view(view_mode='sets'), readable)
+        self.assertEqual(titles, ['Note 1', 'Note 2'])
+        self.assertIn(' UNION ', sql)
+
+        # the view's mode takes precedence
+        titles, sql = self.get_response(self.get_view('sets', 'combine'), readable)
+        self.assertEqual(titles, ['Note 1', 'Note 2'])
+        self.assertNotIn(' UNION ', sql)
+
+    def test_single_operand(self):
+        titles, sql = self.get_response(self.get_view('sets'), '(title%3DNote 1)')
+
+        self.assertEqual(titles, ['Note 1'])
+        self.assertNotIn(' IN (SELECT', sql)
+
+    def test_unsupported(self):
+        features = connection.features
+
+        with mock.patch.object(features, 'supports_select_difference', False):
+            titles, sql = self.get_response(
+                self.get_view('sets'), '(title%3DNote 1) | ~(author__username%3Djoe)',
+            )
+
+        self.assertEqual(titles, ['Note 1'])
+        self.assertNotIn(' UNION ', sql)
+
+
+class FactorComplexOpsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        bob = models.User.objects.create(username='bob')
+        joe = models.User.objects.create(username='joe')
+
+        models.Note.objects.create(author=bob, title='Note 1')
+        models.Note.objects.create(author=bob, title='Note 2')
+        models.Note.objects.create(author=joe, title='Note 1')
+
+        models.Post.objects.create(author=bob, title='Post 1')
+        models.Post.objects.create(author=bob, title='Post 2')
+
+    def get_view(self, filterset_class=NoteFilter, **attrs):
+        Backend = type('Backend', (ComplexFilterBackend, ), attrs)
+
+        class ViewSet(views.NoteViewSet):
+            queryset = models.Note.objects.order_by('pk')
+            filter_backends = [Backend]
+
+        ViewSet.filterset_class = filterset_class
+        return ViewSet.as_view({'get': 'list'})
+
+    def get_querystrings(self, readable, filterset_class=NoteFilter, **attrs):
+        view = self.get_view(filterset_class, **attrs)
+
+        with mock.patch.object(ComplexFilterBackend, 'get_filtersets',
+                               side_effect=ComplexFilterBackend.get_filtersets,
+                               autospec=True) as get_filtersets:
+            response = view(factory.get('/', {'filters': quote(readable)}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK, response.data)
+        return get_filtersets.call_args[0][1], [
+            (r['author'], r['title']) for r in response.data
+        ]
+
+    def test_factored(self):
+        readable = '(author__username%3Dbob%26title%3DNote 1) | ' \
+                   '(author__username%3Dbob%26title%3DNote 2)'
+
+        for mode in ['combine', 'compile']:
+            with self.subTest(mode=mode):
+                querystrings, results = self.get_querystrings(
+                    readable, complex_filter_mode=mode,
+                )
+
+                self.assertEqual(querystrings, [
+                    'author__username=bob', 'title=Note 1', 'title=Note 2',
+                ])
+                self.assertEqual(results, [(1, 'Note 1'), (1, 'Note 2')])
+
+    def test_single_subquery(self):
+        readable = quote('(author__username%3Dbob%26title%3DNote 1) | '
+                         '(author__username%3Dbob%26title%3DNote 2)')
+        view = self.get_view(complex_filter_mode='compile')
+
+        with self.assertNumQueries(1) as cm:
+            view(factory.get('/', {'filters': readable}))
+
+        self.assertEqual(cm.captured_queries[0]['sql'].count('IN (SELECT'), 1)
+
+    def test_multi_valued_relationship(self):
+        # the shared posts param must match the same post as the other params
+        readable = '(author__posts__title%3DPost 1' \
+                   '%26author__posts__title__endswith%3D2) | ' \
+                   '(author__posts__title%3DPost 1%26title%3DNote 2)'
+
+        querystrings, results = self.get_querystrings(readable)
+
+        self.assertEqual(len(querystrings), 2)
+        self.assertEqual(results, [(1, 'Note 2')])
+
+    def test_invalid_absorbed_operand(self):
+        # the operands are validated as sent, before they're factored
+        readable = '(title%3DNote 1) | (title%3DNote 1%26author%3Dxyz)'
+
+        for simplify in [True, False]:
+            with self.subTest(simplify=simplify):
+                view = self.get_view(simplify_complex_ops=simplify)
+                response = view(factory.get('/', {'filters': quote(readable)}))
+
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(list(response.data['filters']), [
+                    'title=Note 1&author=xyz',
+                ])
+
+    def test_invalid_factored_operands(self):
+        # a title is only valid with an author, so the title can't be factored
+        class Form(forms.Form):
+            def clean(self):
+                cleaned_data = super().clean()
+                if cleaned_data.get('title') and not cleaned_data.get('author'):
+                    raise forms.ValidationError('Titles require an author.')
+                return cleaned_data
+
+        class F(NoteFilter):
+            class Meta(NoteFilter.Meta):
+                form = Form
+
+        readable = '(title%3DNote 1%26author%3D1) | (title%3DNote 1%26author%3D2)'
+        querystrings, results = self.get_querystrings(readable, filterset_class=F)
+
+        self.assertEqual(querystrings, ['title=Note 1&author=1', 'title=Note 1&author=2'])
+        self.assertEqual(results, [(1, 'Note 1'), (2, 'Note 1')])
+
+    def test_custom_filtering(self):
+        # the filtering of an overridden `qs` may depend on the combination of params
+        class F(NoteFilter):
+            @property
+            def qs(self):
+                return super().qs
+
+        class G(NoteFilter):
+            cost_policy = LookupCostPolicy()
+
+        readable = '(title%3DNote 1%26author%3D1) | (title%3DNote 1%26author%3D2)'
+        for filterset_class in [F, G]:
+            with self.subTest(filterset_class=filterset_class):
+                querystrings, results = self.get_querystrings(
+                    readable, filterset_class=filterset_class,
+                )
+
+                self.assertEqual(len(querystrings), 2)
+                self.assertEqual(results, [(1, 'Note 1'), (2, 'Note 1')])
+
+    def test_disabled(self):
+        readable = '(title%3DNote 1%26author%3D1) | (title%3DNote 1%26author%3D2)'
+
+        querystrings, results = self.get_querystrings(readable, factor_complex_ops=False)
+
+        self.assertEqual(querystrings, ['title=Note 1&author=1', 'title=Note 1&author=2'])
+        self.assertEqual(results, [(1, 'Note 1'), (2, 'Note 1')])
+
+
+class SimplifyComplexOpsTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        bob = models.User.objects.create(username='bob')
+        models.Note.objects.create(author=bob, title='Note 1')
+        models.Note.objects.create(author=bob, title='Note 2')
+
+    def get_response(self, readable, filterset_class=NoteFilter, **attrs):
+        Backend = type('Backend', (ComplexFilterBackend, ), attrs)
+
+        class ViewSet(views.NoteViewSet):
+            queryset = models.Note.objects.order_by('pk')
+            filter_backends = [Backend]
+
+        ViewSet.filterset_class = filterset_class
+        view = ViewSet.as_view({'get': 'list'})
+        return view(factory.get('/', {'filters': quote(readable)}))
+
+    def test_redundant_operands(self):
+        readable = '(title%3DNote 1) | ~~(title%3DNote 1) & (author%3D1) | ' \
+                   '(title%3DNote 1)'
+
+        with mock.patch.object(ComplexFilterBackend, 'get_filtersets',
+                               side_effect=ComplexFilterBackend.get_filtersets,
+                               autospec=True) as get_filtersets:
+            response = self.get_response(readable)
+
+        self.assertEqual(get_filtersets.call_args[0][1], ['title=Note 1'])
+        self.assertEqual([r['title'] for r in response.data], ['Note 1'])
+
+    def test_contradiction(self):
+        readable = '(author%3D1) & ~(author%3D1) & (title%3DNote 1)'
+
+        with mock.patch('rest_framework_filters.backends.combine_complex_tree') as m:
+            response = self.get_response(readable)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, [])
+        m.assert_not_called()
+
+    def test_invalid_contradiction(self):
+        # simplified operands are still validated
+        readable = '(author%3Dnotanint) & ~(author%3Dnotanint)'
+
+        for simplify in [True, False]:
+            with self.subTest(simplify=simplify):
+                response = self.get_response(readable, simplify_complex_ops=simplify)
+
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(list(response.data['filters']), ['author=notanint'])
+
+    def test_invalid_absorbed_operand(self):
+        readable = '(title%3DNote 1) | (title%3DNote 1) & (author%3Dxyz)'
+        response = self.get_response(readable)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.data['filters']), ['author=xyz'])
+
+    def test_simplified_query_complexity(self):
+        # the complexity limits are checked for contradictions and tautologies
+        readable = '(author__username%3Dbob) & ~(author__username%3Dbob)'
+        response = self.get_response(readable, max_related_depth=0)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'filters': {'author__username=bob': [
+            'Filtering across relationships is limited to a depth of 0.',
+        ]}})
+
+        readable = '(author__username%3Dbob) | ~(author__username%3Dbob)'
+        response = self.get_response(readable, max_filters=0)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_simplified_cost_policy(self):
+        class F(NoteFilter):
+            cost_policy = LookupCostPolicy(max_regex_length=2)
+
+        readable = '(title__regex%3Dabc) & ~(title__regex%3Dabc)'
+        response = self.get_response(readable, filterset_class=F)
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(list(response.data['filters']), ['title__regex=abc'])
+
+    def test_negated_contradiction(self):
+        # the negated contradiction is a tautology, which absorbs the OR operation
+        readable = '~((title%3DNote 2) | ~((title%3DNote 1) & ~(title%3DNote 1)))'
+
+        for mode in ['combine', 'compile', 'sets']:
+            for simplify in [True, False]:
+                with self.subTest(mode=mode, simplify=simplify):
+                    response = self.get_response(
+                        readable, complex_filter_mode=mode, simplify_complex_ops=simplify,
+                    )
+
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+                    self.assertEqual(response.data, [])
+
+    def test_tautology(self):
+        readable = '(title%3DNote 1) | ~(title%3DNote 1)'
+
+        with mock.patch('rest_framework_filters.backends.combine_complex_tree') as m:
+            response = self.get_response(readable)
+
+        self.assertEqual([r['title'] for r in response.data], ['Note 1', 'Note 2'])
+        m.assert_not_called()
+
+    def test_disabled(self):
+        readable = '(author%3D1) & ~(author%3D1)'
+
+        with mock.patch('rest_framework_filters.backends.combine_complex_tree',
+                        wraps=backends.combine_complex_tree) as m:
+            response = self.get_response(readable, simplify_complex_ops=False)
+
+        m.assert_called_once()
+        self.assertEqual(response.data, [])
+
+    def test_filtersets_built_once(self):
+        readable = '(title%3DNote 1) | (title%3DNote 1) & (author%3D1)'
+
+        with mock.patch.object(NoteFilter, '__init__', side_effect=NoteFilter.__init__,
+                               autospec=True) as init:
+            self.get_response(readable, factor_complex_ops=False)
+
+        # each querystring's filterset is validated and filtered, but built once
+        self.assertEqual(init.call_count, 2)
+
+
+class ComplexCacheTests(APITestCase):
+
+    def get_backend(self, **attrs):
+        attrs.setdefault('complex_cache', utils.LRUCache(maxsize=2))
+        return type('Backend', (ComplexFilterBackend, ), attrs)()
+
+    def test_cached(self):
+        backend = self.get_backend()
+        encoded = quote('(a%3D1) | (b%3D2)')
+
+        with mock.patch('rest_framework_filters.backends.parse_complex_ops',
+                        wraps=backends.parse_complex_ops) as m:
+            tree = backend.parse_complex_ops(encoded)
+            self.assertIs(backend.parse_complex_ops(encoded), tree)
+
+        m.assert_called_once()
+        self.assertEqual(backend.complex_cache.info(), (1, 1, 2, 1))
+
+    def test_cache_key(self):
+        cache = utils.LRUCache()
+        encoded = quote('(a%3D1) | ~(b%3D2)')
+
+        self.get_backend(complex_cache=cache).parse_complex_ops(encoded)
+        self.get_backend(complex_cache=cache).parse_complex_ops(encoded)
+        self.assertEqual(cache.info().hits, 1)
+
+        # the tree depends on the operators and negation
+        with self.assertRaises(ValidationError):
+            self.get_backend(
+                complex_cache=cache, operators={'&': QuerySet.__and__},
+            ).parse_complex_ops(encoded)
+
+        backend = self.get_backend(complex_cache=cache, negation=False)
+        with self.assertRaises(ValidationError):
+            backend.parse_complex_ops(encoded)
+
+        self.assertEqual(cache.info(), (1, 3, 128, 3))
+
+    def test_cached_error(self):
+        backend = self.get_backend()
+        encoded = quote('(a%3D1) foo (b%3D2)')
+        msg = "Invalid querystring operator 'foo' at position 8."
+
+        for _ in range(2):
+            with self.assertRaisesMessage(ValidationError, msg):
+                backend.parse_complex_ops(encoded)
+
+        self.assertEqual(backend.complex_cache.info(), (1, 1, 2, 1))
+
+    def test_max_length_not_cached(self):
+        backend = self.get_backend(max_complex_length=10)
+
+        with self.assertRaises(ValidationError):
+            backend.parse_complex_ops(quote('(a%3D1) | (b%3D2)'))
+
+        self.assertEqual(backend.complex_cache.info(), (0, 0, 2, 0))
+
+    def test_disabled(self):
+        backend = self.get_backend(complex_cache=None)
+        encoded = quote('(a%3D1)')
+
+        self.assertEqual(backend.parse_complex_ops(encoded), Operand('a=1'))
@@ -2,12 +2,15 @@ import sys
 from operator import attrgetter
 from urllib.parse import quote
 
-from django.db.models import QuerySet
+from django.db.models import Q, QuerySet
 from django.test import TestCase
 from rest_framework.serializers import ValidationError
 
 from rest_framework_filters.complex_ops import (
-    ComplexOp, combine_complex_queryset, decode_complex_ops,
+    EMPTY, UNIVERSAL, ComplexOp, Negation, Operand, Operation, Token,
+    combine_complex_queryset, combine_complex_sets, combine_complex_tree,
+    compile_complex_tree, decode_complex_ops, factor_complex_tree, get_operands,
+    parse_complex_ops, simplify_complex_tree, tokenize_complex_ops,
 )
 from tests.testapp import models
 
@@ -68,7 +71,7 @@ class DecodeComplexOpsTests(TestCase):
             decode_complex_ops(encoded)
 
         self.assertEqual(exc.exception.detail, [
-            "Unable to parse querystring. Decoded: 'a%3D1'.",
+            "Expected '(' at position 0.",
         ])
 
     def test_missing_closing_paren(self):
@@ -81,7 +84,7 @@ class DecodeComplexOpsTests(TestCase):
             decode_complex_ops(encoded)
 
         self.assertEqual(exc.exception.detail, [
-            "Unable to parse querystring. Decoded: '(a%3D1'.",
+            "Missing ')' for the querystring at position 0.",
         ])
 
     def test_missing_op(self):
@@ -94,7 +97,7 @@ class DecodeComplexOpsTests(TestCase):
             decode_complex_ops(encoded)
 
         self.assertEqual(exc.exception.detail, [
-            "Invalid querystring operator. Matched: ''.",
+            'Expected an operator at position 7.',
         ])
 
     def test_invalid_ops(self):
@@ -107,9 +110,7 @@ class DecodeComplexOpsTests(TestCase):
             decode_complex_ops(encoded)
 
         self.assertEqual(exc.exception.detail, [
-            "Invalid querystring operator. Matched: 'asdf'.",
-            "Invalid querystring operator. Matched: 'qwerty'.",
-            "Ending querystring must not have trailing characters. Matched: '&'.",
+            "Invalid querystring operator 'asdf' at position 7.",
         ])
 
     def test_negation(self):
@@ -147,14 +148,22 @@ class DecodeComplexOpsTests(TestCase):
     def test_duplicate_negation(self):
         encoded = '%28a%253D1%29%20%26%20~~%28b%253D2%29'
         readable = '(a%3D1) & ~~(b%3D2)'
+        result = [
+            ('a=1', False, QuerySet.__and__),
+            ('b=2', False, None),
+        ]
 
         self.assertEqual(encode(readable), encoded)
+        self.assertEqual(decode_complex_ops(encoded), result)
+
+    def test_nested_groups(self):
+        encoded = quote('((a%3D1) | (b%3D2)) & (c%3D3)')
 
         with self.assertRaises(ValidationError) as exc:
             decode_complex_ops(encoded)
 
         self.assertEqual(exc.exception.detail, [
-            "Invalid querystring operator. Matched: ' & ~'.",
+            'Nested groups are not supported (position 0).',
         ])
 
     def test_tilde_decoding(self):
@@ -171,6 +180,432 @@ class DecodeComplexOpsTests(TestCase):
         self.assertEqual(decode_complex_ops(encoded_rfc2396), result)
 
 
+class TokenizeComplexOpsTests(TestCase):
+
+    def test_docstring(self):
+        self.assertEqual(tokenize_complex_ops('~((a%3D1) | (b%3D2))'), [
+            Token('~', '~', 0),
+            Token('(', '(', 1),
+            Token('querystring', 'a%3D1', 2),
+            Token('op', '|', 10),
+            Token('querystring', 'b%3D2', 12),
+            Token(')', ')', 19),
+        ])
+
+    def test_negated_group(self):
+        tokens = tokenize_complex_ops('( ~ ~(a%3D1))')
+
+        self.assertEqual([t.kind for t in tokens], ['(', '~', '~', 'querystring', ')'])
+
+    def test_querystring_tilde(self):
+        # a tilde within a querystring is not a negation
+        tokens = tokenize_complex_ops('(a%3D~1)')
+
+        self.assertEqual(tokens, [Token('querystring', 'a%3D~1', 0)])
+
+    def test_unexpected_paren(self):
+        with self.assertRaises(ValidationError) as exc:
+            tokenize_complex_ops('(a%3D1(b%3D2)')
+
+        self.assertEqual(exc.exception.detail, ["Unexpected '(' at position 6."])
+
+    def test_empty_querystring(self):
+        with self.assertRaises(ValidationError) as exc:
+            tokenize_complex_ops('(a%3D1) | ( )')
+
+        self.assertEqual(exc.exception.detail, ['Empty querystring at position 10.'])
+
+
+class ParseComplexOpsTests(TestCase):
+
+    def parse(self, readable, **kwargs):
+        return parse_complex_ops(encode(readable), **kwargs)
+
+    def assertParseError(self, readable, error, **kwargs):
+        with self.assertRaises(ValidationError) as exc:
+            self.parse(readable, **kwargs)
+
+        self.assertEqual(exc.exception.detail, [error])
+
+    def test_docstring(self):
+        encoded = '%28%28a%253D1%29%20%7C%20%28b%253D2%29%29%20%26%20~%28c%253D3%29'
+        readable = '((a%3D1) | (b%3D2)) & ~(c%3D3)'
+
+        self.assertEqual(encode(readable), encoded)
+        self.assertEqual(parse_complex_ops(encoded), Operation('&', (
+            Operation('|', (Operand('a=1'), Operand('b=2'))),
+            Negation(Operand('c=3')),
+        )))
+
+    def test_single_op(self):
+        self.assertEqual(self.parse('(a%3D1)'), Operand('a=1'))
+
+    def test_flat(self):
+        self.assertEqual(self.parse('(a%3D1) & (b%3D2) & (c%3D3)'), Operation('&', (
+            Operand('a=1'), Operand('b=2'), Operand('c=3'),
+        )))
+
+    def test_precedence(self):
+        self.assertEqual(self.parse('(a%3D1) | (b%3D2) & (c%3D3)'), Operation('|', (
+            Operand('a=1'),
+            Operation('&', (Operand('b=2'), Operand('c=3'))),
+        )))
+
+        self.assertEqual(self.parse('(a%3D1) & (b%3D2) | (c%3D3)'), Operation('|', (
+            Operation('&', (Operand('a=1'), Operand('b=2'))),
+            Operand('c=3'),
+        )))
+
+    def test_nested_groups(self):
+        self.assertEqual(self.parse('(((a%3D1)) & ((b%3D2) | (c%3D3)))'), Operation('&', (
+            Operand('a=1'),
+            Operation('|', (Operand('b=2'), Operand('c=3'))),
+        )))
+
+    def test_negated_group(self):
+        self.assertEqual(self.parse('~((a%3D1) | ~(b%3D2))'), Negation(Operation('|', (
+            Operand('a=1'),
+            Negation(Operand('b=2')),
+        ))))
+
+    def test_custom_operators(self):
+        operators = {'&': QuerySet.intersection, '-': QuerySet.difference}
+
+        # custom operators have the same precedence as '|'
+        self.assertEqual(self.parse('(a%3D1) - (b%3D2) & (c%3D3)', operators=operators),
+                         Operation('-', (
+                             Operand('a=1'),
+                             Operation('&', (Operand('b=2'), Operand('c=3'))),
+                         )))
+
+        self.assertParseError(
+            '(a%3D1) | (b%3D2)', "Invalid querystring operator '|' at position 8.",
+            operators=operators,
+        )
+
+    def test_missing_closing_group(self):
+        self.assertParseError(
+            '((a%3D1) | (b%3D2)', "Missing ')' for the group at position 0.",
+        )
+
+    def test_unexpected_closing_group(self):
+        self.assertParseError('(a%3D1))', "Unexpected ')' at position 7.")
+
+    def test_trailing_operator(self):
+        self.assertParseError('(a%3D1) &', 'Unexpected end of querystring at position 9.')
+
+    def test_leading_operator(self):
+        self.assertParseError('& (a%3D1)', "Expected '(' at position 0.")
+
+    def test_empty(self):
+        self.assertParseError('', 'Unexpected end of querystring at position 0.')
+
+    def test_negation_disabled(self):
+        self.assertParseError(
+            '(a%3D1) & ~(b%3D2)', 'Negation is not supported (position 10).',
+            negation=False,
+        )
+
+    def test_max_length(self):
+        self.assertEqual(self.parse('(a%3D1)', max_length=15), Operand('a=1'))
+        self.assertParseError(
+            '(a%3D1) & (b%3D2)',
+            'Ensure the complex querystring has at most 15 characters.',
+            max_length=15,
+        )
+
+    def test_max_depth(self):
+        self.assertEqual(self.parse('~((a%3D1) | (b%3D2))', max_depth=2), Negation(
+            Operation('|', (Operand('a=1'), Operand('b=2'))),
+        ))
+        self.assertParseError(
+            '~(~(a%3D1) | (b%3D2))',
+            'Ensure the complex querystring is nested at most 2 levels deep '
+            '(position 2).',
+            max_depth=2,
+        )
+        self.assertParseError(
+            '(((a%3D1)))',
+            'Ensure the complex querystring is nested at most 1 levels deep '
+            '(position 1).',
+            max_depth=1,
+        )
+
+    def test_deeply_nested(self):
+        self.assertParseError(
+            '(' * 10000 + '(a%3D1)' + ')' * 10000,
+            'The complex querystring is nested too deeply.',
+        )
+
+    def test_get_operands(self):
+        tree = self.parse('~((a%3D1) | (b%3D2)) & (a%3D1)')
+
+        self.assertEqual(get_operands(tree), [
+            Operand('a=1'), Operand('b=2'), Operand('a=1'),
+        ])
+
+
+class CombineComplexTreeTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        models.User.objects.create(username='u1', first_name='Bob', last_name='Jones')
+        models.User.objects.create(username='u2', first_name='Joe', last_name='Jones')
+        models.User.objects.create(username='u3', first_name='Bob', last_name='Smith')
+        models.User.objects.create(username='u4', first_name='Joe', last_name='Smith')
+
+    def get_conditions(self):
+        return {
+            'first_name=Bob': Q(first_name='Bob'),
+            'last_name=Smith': Q(last_name='Smith'),
+            'username=u2': Q(username='u2'),
+        }
+
+    def get_querysets(self):
+        return {
+            querystring: models.User.objects.filter(q)
+            for querystring, q in self.get_conditions().items()
+        }
+
+    def combine(self, readable):
+        return self.combine_tree(parse_complex_ops(encode(readable)))
+
+    def combine_tree(self, tree):
+        qs = combine_complex_tree(tree, self.get_querysets(), models.User.objects.all())
+
+        return sorted(qs.values_list('username', flat=True))
+
+    def test_precedence(self):
+        self.assertEqual(
+            self.combine('(username%3Du2) | (first_name%3DBob) & (last_name%3DSmith)'),
+            ['u2', 'u3'],
+        )
+
+    def test_nested_groups(self):
+        self.assertEqual(
+            self.combine('((username%3Du2) | (first_name%3DBob)) & (last_name%3DSmith)'),
+            ['u3'],
+        )
+
+    def test_negated_group(self):
+        self.assertEqual(
+            self.combine('~((first_name%3DBob) | (last_name%3DSmith))'),
+            ['u2'],
+        )
+
+    def test_negated_left_operand(self):
+        # the right operand must not be negated along with the left operand
+        self.assertEqual(
+            self.combine('~(first_name%3DBob) & (last_name%3DSmith)'), ['u4'],
+        )
+        self.assertEqual(
+            self.combine('~(first_name%3DBob) | (last_name%3DSmith)'), ['u2', 'u3', 'u4'],
+        )
+
+    def test_negated_left_group(self):
+        self.assertEqual(
+            self.combine('~((first_name%3DBob) | (username%3Du2)) & (last_name%3DSmith)'),
+            ['u4'],
+        )
+
+    def test_negation_does_not_mutate(self):
+        # the same queryset is used both negated and not negated
+        self.assertEqual(
+            self.combine('(first_name%3DBob) | ~(first_name%3DBob)'),
+            ['u1', 'u2', 'u3', 'u4'],
+        )
+
+    def test_empty_operations(self):
+        u2 = Operand('username=u2')
+
+        self.assertEqual(self.combine_tree(EMPTY), [])
+        self.assertEqual(self.combine_tree(UNIVERSAL), ['u1', 'u2', 'u3', 'u4'])
+        self.assertEqual(self.combine_tree(Negation(EMPTY)), ['u1', 'u2', 'u3', 'u4'])
+        self.assertEqual(self.combine_tree(Operation('|', (u2, EMPTY))), ['u2'])
+        self.assertEqual(self.combine_tree(Operation('|', (EMPTY, u2))), ['u2'])
+        self.assertEqual(self.combine_tree(Operation('&', (u2, UNIVERSAL))), ['u2'])
+        self.assertEqual(self.combine_tree(Operation('&', (u2, EMPTY))), [])
+
+
+class FactorComplexTreeTests(TestCase):
+
+    def factor(self, readable, is_factorable=lambda param: True):
+        return factor_complex_tree(parse_complex_ops(encode(readable)), is_factorable)
+
+    def test_shared_params(self):
+        self.assertEqual(
+            self.factor('(a%3D1%26b%3D2) | (c%3D3%26a%3D1) | (a%3D1%26d%3D4)'),
+            Operation('&', (
+                Operand('a=1'),
+                Operation('|', (Operand('b=2'), Operand('c=3'), Operand('d=4'))),
+            )),
+        )
+
+    def test_different_values(self):
+        readable = '(a%3D1%26b%3D2) | (a%3D2%26c%3D3)'
+        self.assertEqual(self.factor(readable), parse_complex_ops(encode(readable)))
+
+        # all values of a param must be shared
+        readable = '(a%3D1%26a%3D2%26b%3D2) | (a%3D1%26c%3D3)'
+        self.assertEqual(self.factor(readable), parse_complex_ops(encode(readable)))
+
+    def test_absorption(self):
+        self.assertEqual(self.factor('(a%3D1) | (a%3D1%26b%3D2)'), Operand('a=1'))
+
+    def test_not_factorable(self):
+        self.assertEqual(
+            self.factor('(a%3D1%26b%3D2) | (a%3D1%26b%3D2%26c%3D3)',
+                        lambda param: param != 'a'),
+            Operation('&', (
+                Operand('b=2'),
+                Operation('|', (Operand('a=1'), Operand('a=1&c=3'))),
+            )),
+        )
+
+    def test_nested_operations(self):
+        # only the operands of OR operations are factored
+        self.assertEqual(
+            self.factor(
+                '~((a%3D1%26b%3D2) | (a%3D1%26c%3D3) | ~(a%3D1)) & (a%3D1%26b%3D2)',
+            ),
+            Operation('&', (
+                Negation(Operation('|', (
+                    Operation('&', (
+                        Operand('a=1'),
+                        Operation('|', (Operand('b=2'), Operand('c=3'))),
+                    )),
+                    Negation(Operand('a=1')),
+                ))),
+                Operand('a=1&b=2'),
+            )),
+        )
+
+    def test_raw_pairs(self):
+        # the encoded pairs are retained
+        self.assertEqual(
+            self.factor('(a%3Dx%2520y%26b%3D2) | (a%3Dx%2520y%26c%3D3)'),
+            Operation('&', (
+                Operand('a=x%20y'),
+                Operation('|', (Operand('b=2'), Operand('c=3'))),
+            )),
+        )
+
+
+class SimplifyComplexTreeTests(TestCase):
+
+    def simplify(self, readable, **kwargs):
+        return simplify_complex_tree(parse_complex_ops(encode(readable), **kwargs))
+
+    def test_flatten(self):
+        self.assertEqual(
+            self.simplify('(a%3D1) & ((b%3D2) & ((c%3D3) | ((d%3D4) | (e%3D5))))'),
+            Operation('&', (
+                Operand('a=1'),
+                Operand('b=2'),
+                Operation('|', (Operand('c=3'), Operand('d=4'), Operand('e=5'))),
+            )),
+        )
+
+    def test_duplicates(self):
+        self.assertEqual(
+            self.simplify('(a%3D1) | (b%3D2) | (a%3D1) | ~(c%3D3) | ~(c%3D3)'),
+            Operation('|', (Operand('a=1'), Operand('b=2'), Negation(Operand('c=3')))),
+        )
+        self.assertEqual(self.simplify('(a%3D1) & (a%3D1)'), Operand('a=1'))
+
+    def test_absorption(self):
+        self.assertEqual(self.simplify('(a%3D1) | (a%3D1) & (b%3D2)'), Operand('a=1'))
+        self.assertEqual(self.simplify('(a%3D1) & ((b%3D2) | (a%3D1))'), Operand('a=1'))
+        self.assertEqual(
+            self.simplify('(c%3D3) | (a%3D1) & (b%3D2) | ~(a%3D1) & (c%3D3)'),
+            Operation('|', (
+                Operand('c=3'),
+                Operation('&', (Operand('a=1'), Operand('b=2'))),
+            )),
+        )
+
+    def test_double_negation(self):
+        self.assertEqual(self.simplify('~~(a%3D1)'), Operand('a=1'))
+        self.assertEqual(
+            self.simplify('~(~(a%3D1) & ~~(b%3D2))'),
+            Negation(Operation('&', (Negation(Operand('a=1')), Operand('b=2')))),
+        )
+
+    def test_contradiction(self):
+        self.assertEqual(self.simplify('(a%3D1) & ~(a%3D1)'), EMPTY)
+        self.assertEqual(self.simplify('(b%3D2) & (a%3D1) & ~(a%3D1)'), EMPTY)
+        self.assertEqual(
+            self.simplify('(a%3D1) & (b%3D2) & ~((a%3D1) & (b%3D2))'), EMPTY,
+        )
+        self.assertEqual(
+            self.simplify('(a%3D1) & ~(a%3D1) | (b%3D2) & ~(b%3D2)'), EMPTY,
+        )
+        self.assertEqual(self.simplify('(b%3D2) | (a%3D1) & ~(a%3D1)'), Operand('b=2'))
+        self.assertEqual(get_operands(EMPTY), [])
+
+    def test_tautology(self):
+        self.assertEqual(self.simplify('(a%3D1) | ~(a%3D1)'), UNIVERSAL)
+        self.assertEqual(
+            self.simplify('(a%3D1) | (b%3D2) | ~((a%3D1) | (b%3D2))'), UNIVERSAL,
+        )
+        self.assertEqual(self.simplify('(b%3D2) & ((a%3D1) | ~(a%3D1))'), Operand('b=2'))
+        self.assertEqual(get_operands(UNIVERSAL), [])
+
+    def test_negated_contradiction(self):
+        self.assertEqual(self.simplify('~((a%3D1) & ~(a%3D1)) & (b%3D2)'), Operand('b=2'))
+        self.assertEqual(self.simplify('~((a%3D1) & ~(a%3D1)) | (b%3D2)'), UNIVERSAL)
+        self.assertEqual(self.simplify('~((a%3D1) | ~(a%3D1)) | (b%3D2)'), Operand('b=2'))
+        self.assertEqual(
+            self.simplify('~((b%3D2) | ~((a%3D1) & ~(a%3D1)))'), EMPTY,
+        )
+
+    def test_custom_operators(self):
+        operators = {'&': QuerySet.__and__, '-': QuerySet.difference}
+
+        # the operands of custom operators are simplified
+        self.assertEqual(
+            self.simplify('(a%3D1) - ~~((b%3D2) & (b%3D2))', operators=operators),
+            Operation('-', (Operand('a=1'), Operand('b=2'))),
+        )
+        self.assertEqual(
+            self.simplify('(a%3D1) - ~((b%3D2) & ~(b%3D2))', operators=operators),
+            Operation('-', (Operand('a=1'), UNIVERSAL)),
+        )
+
+
+class CombineComplexSetsTests(CombineComplexTreeTests):
+
+    def combine_tree(self, tree):
+        queryset = models.User.objects.order_by('username')
+        pks = combine_complex_sets(tree, self.get_querysets(), queryset)
+
+        return list(queryset.filter(pk__in=pks).values_list('username', flat=True))
+
+    def test_set_operations(self):
+        queryset = models.User.objects.all()
+        tree = parse_complex_ops(encode('(username%3Du2) | ~(first_name%3DBob)'))
+        sql = str(combine_complex_sets(tree, self.get_querysets(), queryset).query)
+
+        self.assertIn(' UNION ', sql)
+        self.assertIn(' EXCEPT ', sql)
+        self.assertNotIn('ORDER BY', sql)
+
+    def test_nested_difference(self):
+        # the EXCEPT must only be applied to the negated operand
+        self.assertEqual(
+            self.combine('(username%3Du2) | ~(first_name%3DBob) & (last_name%3DSmith)'),
+            ['u2', 'u4'],
+        )
+
+
+class CompileComplexTreeTests(CombineComplexTreeTests):
+
+    def combine_tree(self, tree):
+        q = compile_complex_tree(tree, self.get_conditions())
+
+        return sorted(models.User.objects.filter(q).values_list('username', flat=True))
+
+
 class CombineComplexQuerysetTests(TestCase):
 
     @classmethod
@@ -204,6 +639,21 @@ class CombineComplexQuerysetTests(TestCase):
             ['u1'], attrgetter('username'), False,
         )
 
+    def test_leading_negation(self):
+        querysets = [
+            models.User.objects.filter(first_name='Bob'),
+            models.User.objects.filter(last_name='Smith'),
+        ]
+        complex_ops = [
+            ComplexOp(None, True, QuerySet.__and__),
+            ComplexOp(None, False, None),
+        ]
+
+        self.assertQuerysetEqual(
+            combine_complex_queryset(querysets, complex_ops),
+            ['u4'], attrgetter('username'), False,
+        )
+
     def test_OR(self):
         querysets = [
             models.User.objects.filter(first_name='Bob'),
@@ -0,0 +1,196 @@
+from django.test import TestCase
+
+from rest_framework_filters import FilterSet, filters
+from rest_framework_filters.costs import LookupCostPolicy
+
+from .testapp.filters import NoteFilter, UserFilter
+from .testapp.models import Note, User
+
+MAX_COST_MSG = 'The cost of the requested filters (10) exceeds the maximum of 6.'
+
+
+def policy_filter(**kwargs):
+    class F(UserFilter):
+        cost_policy = LookupCostPolicy(**kwargs)
+
+        class Meta:
+            model = User
+            fields = {'email': ['regex', 'icontains']}
+
+    return F
+
+
+class LookupCostPolicyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        User.objects.create(username='bob', email='bob@example.com')
+        User.objects.create(username='joe', email='joe@example.org')
+
+    def test_cost(self):
+        policy = LookupCostPolicy()
+        F = policy_filter()
+
+        self.assertEqual(policy.get_cost(F.base_filters['username']), 1)
+        self.assertEqual(policy.get_cost(F.base_filters['username__icontains']), 5)
+
+        # date (3) + week_day (3) + exact (1)
+        f = F.base_filters['last_login__date__week_day']
+        self.assertEqual(f.lookup_expr, 'date__week_day__exact')
+        self.assertEqual(policy.get_cost(f), 7)
+
+    def test_weights(self):
+        policy = LookupCostPolicy(weights={'icontains': 7}, default_weight=2)
+        F = policy_filter()
+
+        self.assertEqual(policy.get_cost(F.base_filters['username']), 2)
+        self.assertEqual(policy.get_cost(F.base_filters['username__icontains']), 7)
+
+    def test_invalid_attribute(self):
+        msg = "'foo' is not a cost policy attribute."
+        with self.assertRaisesMessage(TypeError, msg):
+            LookupCostPolicy(foo=1)
+
+    def test_is_indexed(self):
+        policy = LookupCostPolicy()
+        F = policy_filter()
+
+        self.assertTrue(policy.is_indexed(F.base_filters['username'], User))
+        self.assertTrue(policy.is_indexed(F.base_filters['username__startswith'], User))
+        self.assertFalse(policy.is_indexed(F.base_filters['username__icontains'], User))
+        self.assertFalse(policy.is_indexed(F.base_filters['email'], User))
+
+    def test_max_cost(self):
+        F = policy_filter(max_cost=6)
+
+        filterset = F({'username__icontains': 'o', 'email__icontains': 'example'})
+        self.assertFalse(filterset.is_valid())
+        self.assertEqual(filterset.errors, {
+            '__all__': [MAX_COST_MSG],
+        })
+
+        filterset = F({'username__icontains': 'o', 'email': 'bob@example.com'})
+        self.assertTrue(filterset.is_valid())
+        self.assertEqual([u.username for u in filterset.qs], ['bob'])
+
+    def test_empty_values_not_counted(self):
+        F = policy_filter(max_cost=6)
+
+        filterset = F({'username__icontains': 'o', 'email__icontains': ''})
+        self.assertTrue(filterset.is_valid())
+
+    def test_max_regex_length(self):
+        F = policy_filter(max_regex_length=5)
+
+        filterset = F({'email__regex': '^(a+)+$$$'})
+        self.assertFalse(filterset.is_valid())
+        self.assertEqual(filterset.errors, {
+            'email__regex': ['Ensure this regular expression has at most 5 characters.'],
+        })
+
+        filterset = F({'email__regex': '^bob'})
+        self.assertTrue(filterset.is_valid())
+        self.assertEqual([u.username for u in filterset.qs], ['bob'])
+
+    def test_paired_cost(self):
+        F = policy_filter(paired_cost=5)
+        msg = 'This filter must be combined with a filter on an indexed field.'
+
+        filterset = F({'email__icontains': 'example', 'email': 'bob@example.com'})
+        self.assertFalse(filterset.is_valid())
+        self.assertEqual(filterset.errors, {'email__icontains': [msg]})
+
+        # the username is unique, and therefore indexed
+        filterset = F({'email__icontains': 'example', 'username__in': 'bob,joe'})
+        self.assertTrue(filterset.is_valid())
+        self.assertEqual(filterset.qs.count(), 2)
+
+    def test_exclusion_not_indexed(self):
+        F = policy_filter(paired_cost=5)
+
+        filterset = F({'email__icontains': 'example', 'username!': 'bob'})
+        self.assertFalse(filterset.is_valid())
+        self.assertIn('email__icontains', filterset.errors)
+
+    def test_max_scan_rows(self):
+        F = policy_filter(max_scan_rows=2)
+
+        filterset = F({'email__icontains': 'example'})
+        self.assertTrue(filterset.is_valid())
+
+        # the row count is cached
+        User.objects.create(username='sue', email='sue@example.com')
+        filterset = F({'email__icontains': 'example'})
+        self.assertTrue(filterset.is_valid())
+
+        F.cost_policy._row_counts.clear()
+        filterset = F({'email__icontains': 'example'})
+        self.assertFalse(filterset.is_valid())
+        self.assertIn('email__icontains', filterset.errors)
+
+        # leading-wildcard lookups are only restricted if they aren't paired
+        filterset = F({'email__icontains': 'example', 'username': 'sue'})
+        self.assertTrue(filterset.is_valid())
+
+        filterset = F({'email': 'sue@example.com'})
+        self.assertTrue(filterset.is_valid())
+
+    def test_related_filterset(self):
+        class F(FilterSet):
+            author = filters.RelatedFilter(
+                policy_filter(max_cost=6), queryset=User.objects.all(),
+            )
+
+            class Meta:
+                model = Note
+                fields = []
+
+        filterset = F({
+            'author__username__icontains': 'o', 'author__email__icontains': 'example',
+        })
+        self.assertFalse(filterset.is_valid())
+        self.assertEqual(filterset.errors, {
+            '__all__': [MAX_COST_MSG],
+        })
+
+    def test_across_relationships(self):
+        # the root policy applies to the related filters
+        class F(NoteFilter):
+            cost_policy = LookupCostPolicy(max_regex_length=3, max_cost=6)
+
+        filterset = F({'author__username__regex': 'abcdef'})
+        self.assertFalse(filterset.is_valid())
+        self.assertEqual(filterset.errors, {
+            'author__username__regex': [
+                'Ensure this regular expression has at most 3 characters.',
+            ],
+            '__all__': [
+                'The cost of the requested filters (10) exceeds the maximum of 6.',
+            ],
+        })
+
+        # the related filters count towards the total cost
+        filterset = F({'title__icontains': 'a', 'author__username__icontains': 'b'})
+        self.assertFalse(filterset.is_valid())
+        self.assertEqual(filterset.errors, {
+            '__all__': [MAX_COST_MSG],
+        })
+
+        filterset = F({'title__icontains': 'a', 'author__username': 'bob'})
+        self.assertTrue(filterset.is_valid())
+
+    def test_related_pairing(self):
+        # expensive filters must be paired with an indexed filter of their own table
+        class F(NoteFilter):
+            cost_policy = LookupCostPolicy(paired_cost=5)
+
+        msg = 'This filter must be combined with a filter on an indexed field.'
+
+        filterset = F({'author__username__icontains': 'o', 'author': '1'})
+        self.assertFalse(filterset.is_valid())
+        self.assertEqual(filterset.errors, {'author__username__icontains': [msg]})
+
+        filterset = F({
+            'author__username__icontains': 'o', 'author__username__in': 'bob,joe',
+        })
+        self.assertTrue(filterset.is_valid())
@@ -0,0 +1,260 @@
+from unittest import mock
+
+from django.test import TestCase
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.test import APIRequestFactory
+
+from rest_framework_filters import backends, explain
+from rest_framework_filters.explain import (
+    ExplainPolicy, QueryPlanIssue, QueryPlanWarning, get_plan_issues, parse_plan,
+)
+
+from .testapp import views
+from .testapp.models import Note, User
+
+factory = APIRequestFactory()
+
+SQLITE_PLAN = '''\
+6 0 0 SEARCH testapp_post USING INDEX testapp_post_author_id_8a5cf4c0 (author_id=?)
+10 0 0 LIST SUBQUERY 1
+12 10 0 SCAN U0
+20 0 0 SCAN testapp_note
+24 0 0 SCAN auth_user USING COVERING INDEX sqlite_autoindex_auth_user_1
+30 0 0 USE TEMP B-TREE FOR ORDER BY'''
+
+POSTGRES_PLAN = '''\
+Sort  (cost=58.60..58.61 rows=1 width=88)
+  Sort Key: testapp_note.title
+  ->  Seq Scan on testapp_note  (cost=25.88..58.59 rows=1 width=88)
+        Filter: (hashed SubPlan 1)
+        SubPlan 1
+          ->  Seq Scan on auth_user u0  (cost=0.00..25.88 rows=6 width=4)
+                Filter: ((username)::text = 'bob'::text)'''
+
+
+class ParsePlanTests(TestCase):
+
+    def test_sqlite(self):
+        self.assertEqual(parse_plan(SQLITE_PLAN)[1:3], [
+            ('LIST SUBQUERY 1', ()),
+            ('SCAN U0', ('LIST SUBQUERY 1', )),
+        ])
+
+    def test_postgres(self):
+        entries = parse_plan(POSTGRES_PLAN)
+
+        self.assertEqual(entries[2], (
+            'Seq Scan on testapp_note  (cost=25.88..58.59 rows=1 width=88)',
+            ('Sort  (cost=58.60..58.61 rows=1 width=88)', ),
+        ))
+        self.assertEqual(entries[5][1][-1], 'SubPlan 1')
+
+    def test_sqlite_issues(self):
+        self.assertEqual(get_plan_issues(SQLITE_PLAN), [
+            QueryPlanIssue(explain.SUBQUERY_SCAN, 'U0', 'SCAN U0'),
+            QueryPlanIssue(explain.FULL_SCAN, 'testapp_note', 'SCAN testapp_note'),
+            QueryPlanIssue(explain.TEMP_B_TREE, None, 'USE TEMP B-TREE FOR ORDER BY'),
+        ])
+
+    def test_postgres_issues(self):
+        issues = get_plan_issues(POSTGRES_PLAN)
+
+        self.assertEqual([(i.kind, i.table) for i in issues], [
+            (explain.TEMP_B_TREE, None),
+            (explain.FULL_SCAN, 'testapp_note'),
+            (explain.SUBQUERY_SCAN, 'auth_user'),
+        ])
+
+    def test_older_sqlite_format(self):
+        issues = get_plan_issues('2 0 0 SCAN TABLE testapp_note\n3 0 0 SCAN CONSTANT ROW')
+
+        self.assertEqual([(i.kind, i.table) for i in issues], [
+            (explain.FULL_SCAN, 'testapp_note'),
+        ])
+
+
+class ExplainPolicyTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        bob = User.objects.create(username='bob')
+        Note.objects.create(author=bob, title='Note 1')
+
+    def test_full_scan(self):
+        policy = ExplainPolicy()
+        issues = policy.get_issues(Note.objects.filter(title='Note 1'))
+
+        self.assertEqual([(i.kind, i.table) for i in issues], [
+            (explain.FULL_SCAN, 'testapp_note'),
+        ])
+
+    def test_index_search(self):
+        policy = ExplainPolicy()
+
+        self.assertEqual(policy.get_issues(Note.objects.filter(pk=1)), [])
+
+    def test_checks(self):
+        policy = ExplainPolicy(checks={explain.TEMP_B_TREE})
+
+        self.assertEqual(policy.get_issues(Note.objects.filter(title='Note 1')), [])
+
+    def test_ignored_tables(self):
+        policy = ExplainPolicy(ignored_tables={'testapp_note'})
+
+        self.assertEqual(policy.get_issues(Note.objects.filter(title='Note 1')), [])
+
+    def test_cached_by_query_shape(self):
+        policy = ExplainPolicy()
+
+        with mock.patch.object(policy, 'explain', wraps=policy.explain) as explain_mock:
+            policy.get_issues(Note.objects.filter(title='Note 1'))
+            policy.get_issues(Note.objects.filter(title='Note 2'))
+            self.assertEqual(explain_mock.call_count, 1)
+
+            policy.get_issues(Note.objects.filter(title='Note 1', pk=1))
+            self.assertEqual(explain_mock.call_count, 2)
+
+        self.assertEqual(policy.cache.info(), (1, 2, 256, 2))
+
+    def test_reject(self):
+        policy = ExplainPolicy(action='reject')
+
+        with self.assertRaises(ValidationError) as cm:
+            policy.check(Note.objects.filter(title='Note 1'))
+
+        self.assertEqual(cm.exception.detail, [
+            "The filtered query scans the full 'testapp_note' table.",
+        ])
+
+    def test_warn(self):
+        policy = ExplainPolicy(action='warn')
+        msg = "The filtered query scans the full 'testapp_note' table."
+
+        with self.assertWarnsMessage(QueryPlanWarning, msg):
+            policy.check(Note.objects.filter(title='Note 1'))
+
+    def test_log(self):
+        policy = ExplainPolicy(action='log')
+
+        with self.assertLogs('rest_framework_filters.explain') as cm:
+            policy.check(Note.objects.filter(title='Note 1'))
+
+        self.assertEqual(cm.output, [
+            "WARNING:rest_framework_filters.explain:"
+            "The filtered query scans the full 'testapp_note' table.",
+        ])
+
+    def test_empty_queryset(self):
+        policy = ExplainPolicy(action='reject')
+
+        with mock.patch.object(policy, 'explain') as explain_mock:
+            policy.check(Note.objects.none())
+            policy.check(Note.objects.filter(pk__in=[]))
+
+        explain_mock.assert_not_called()
+
+    def test_introduced_issues(self):
+        policy = ExplainPolicy()
+        base = Note.objects.order_by('title')
+
+        # the sort is not introduced by the filtering, unlike the full scan
+        issues = policy.get_introduced_issues(base.filter(title='Note 1'), base)
+        self.assertEqual([(i.kind, i.table) for i in issues], [
+            (explain.FULL_SCAN, 'testapp_note'),
+        ])
+
+        issues = policy.get_introduced_issues(base.filter(author=1), base)
+        self.assertEqual(issues, [])
+
+    def test_unfiltered(self):
+        policy = ExplainPolicy(action='reject')
+
+        with mock.patch.object(policy, 'explain') as explain_mock:
+            policy.check(Note.objects.all(), Note.objects.all())
+
+        explain_mock.assert_not_called()
+
+    def test_unsupported(self):
+        with mock.patch.object(explain, 'SUPPORTS_EXPLAIN', False):
+            with self.assertWarns(RuntimeWarning):
+                policy = ExplainPolicy(action='reject')
+
+            with mock.patch.object(policy, 'explain') as explain_mock:
+                policy.check(Note.objects.filter(title='Note 1'))
+
+        explain_mock.assert_not_called()
+
+    def test_invalid_action(self):
+        msg = "Invalid explain policy action 'foo'. Expected one of: reject, warn, log."
+        with self.assertRaisesMessage(ValueError, msg):
+            ExplainPolicy(action='foo')
+
+    def test_invalid_attribute(self):
+        msg = "'foo' is not an explain policy attribute."
+        with self.assertRaisesMessage(TypeError, msg):
+            ExplainPolicy(foo=1)
+
+
+class ExplainBackendTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        bob = User.objects.create(username='bob')
+        Note.objects.create(author=bob, title='Note 1')
+
+    def get_view(self, backend_class, queryset=None):
+        class Backend(backend_class):
+            explain_policy = ExplainPolicy(action='reject')
+
+        class ViewSet(views.NoteViewSet):
+            filter_backends = [Backend]
+
+        if queryset is not None:
+            ViewSet.queryset = queryset
+
+        return ViewSet.as_view({'get': 'list'})
+
+    def test_reject(self):
+        view = self.get_view(backends.RestFrameworkFilterBackend)
+
+        response = view(factory.get('/', {'author': '1'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = view(factory.get('/', {'title': 'Note 1'}))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, [
+            "The filtered query scans the full 'testapp_note' table.",
+        ])
+
+    def test_unfiltered(self):
+        # the unfiltered queryset scans the table, but is not rejected
+        for backend_class in [backends.RestFrameworkFilterBackend,
+                              backends.ComplexFilterBackend]:
+            view = self.get_view(backend_class)
+
+            for params in [{}, {'foo': 'bar'}, {'title': ''}]:
+                with self.subTest(backend=backend_class.__name__, params=params):
+                    response = view(factory.get('/', params))
+                    self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_view_ordering(self):
+        # the sort is introduced by the view's queryset, not by the filtering
+        view = self.get_view(
+            backends.RestFrameworkFilterBackend, Note.objects.order_by('title'),
+        )
+
+        response = view(factory.get('/', {'author': '1'}))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_complex_operations(self):
+        view = self.get_view(backends.ComplexFilterBackend)
+
+        with mock.patch.object(ExplainPolicy, 'check') as check:
+            response = view(factory.get('/', {'filters': '(author=1)|(title=Note 1)'}))
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        # only the combined queryset is checked
+        check.assert_called_once()
+        self.assertIn(' OR ', str(check.call_args[0][0].query))
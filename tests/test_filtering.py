@@ -385,7 +385,8 @@ class RelatedFilterTests(TestCase):
         msg = "Expected `.get_queryset()` for related filter 'NoteFilter.author' " \
               "to return a `QuerySet`, but got `None`."
         with self.assertRaisesMessage(AssertionError, msg):
-            NoteFilter(GET, queryset=Note.objects.all())
+            # related filtersets are lazily initialized, so evaluate the queryset
+            NoteFilter(GET, queryset=Note.objects.all()).qs
 
     def test_relatedfilter_request_is_passed(self):
         called = False
@@ -3,19 +3,24 @@ import unittest
 import warnings
 
 import django_filters
+from django.db.models import Q, QuerySet
+from django.http import QueryDict
 from django.test import TestCase
+from django.utils.datastructures import MultiValueDict
 from django_filters.filters import BaseInFilter
 from rest_framework.test import APIRequestFactory
 from rest_framework.views import APIView
 
-from rest_framework_filters import FilterSet, filters
-from rest_framework_filters.filterset import FilterSetMetaclass, SubsetDisabledMixin
+from rest_framework_filters import FilterSet, filters, utils, warmup
+from rest_framework_filters.filterset import (
+    FilterSetMetaclass, RelatedFiltersets, SubsetDisabledMixin,
+)
 
 from .testapp.filters import (
-    AFilter, NoteFilter, NoteFilterWithAlias, PersonFilter, PostFilter, TagFilter,
-    UserFilter,
+    AFilter, BFilter, CFilter, NoteFilter, NoteFilterWithAlias, PersonFilter, PostFilter,
+    TagFilter, UserFilter,
 )
-from .testapp.models import Note, Person, Post, Tag, User
+from .testapp.models import A, Note, Person, Post, Tag, User
 
 factory = APIRequestFactory()
 
@@ -37,6 +42,10 @@ class MetaclassTests(TestCase):
         functions = [
             'get_auto_filters',
             'expand_auto_filter',
+            'expand_auto_filters',
+            'get_auto_filter_fields',
+            'resolve_auto_filters',
+            'get_param_filter_names',
         ]
 
         for func in functions:
@@ -156,6 +165,62 @@ class AutoFilterTests(TestCase):
                         'xyz': '__all__',
                     }
 
+    def test_autofilters_expanded_in_single_pass(self):
+        calls = []
+
+        class Base(FilterSet):
+            @classmethod
+            def get_fields(cls):
+                calls.append(cls._meta.fields)
+                return super().get_fields()
+
+        class F(Base):
+            title = filters.AutoFilter(lookups=['exact'])
+            author = filters.AutoFilter(lookups=['exact'])
+            pk = filters.AutoFilter(field_name='id', lookups=['exact'])
+
+            class Meta:
+                model = Note
+                fields = []
+
+        # once for 'Meta.fields', and once for the auto filters
+        self.assertEqual(calls, [
+            [], {'title': ['exact'], 'author': ['exact'], 'id': ['exact']},
+        ])
+        self.assertEqual(list(F.base_filters), ['title', 'author', 'pk'])
+
+    def test_autofilter_aliases(self):
+        class F(FilterSet):
+            title = filters.AutoFilter(lookups=['exact'])
+            heading = filters.AutoFilter(field_name='title', lookups='__all__')
+            name = filters.AutoFilter(field_name='title', lookups=['exact', 'in'])
+
+            class Meta:
+                model = Note
+                fields = []
+
+        self.assertEqual(F.base_filters['title'].field_name, 'title')
+        self.assertIn('heading__icontains', F.base_filters)
+        self.assertIn('name__in', F.base_filters)
+        self.assertNotIn('name__icontains', F.base_filters)
+
+        # generated filters are not shared between aliases
+        filter_ids = {id(f) for f in F.base_filters.values()}
+        self.assertEqual(len(filter_ids), len(F.base_filters))
+        self.assertIsNot(F.base_filters['heading'], F.base_filters['name'])
+
+    def test_autofilter_meta_exclude(self):
+        class F(FilterSet):
+            title = filters.AutoFilter(lookups=['exact'])
+            author = filters.AutoFilter(lookups=['exact'])
+
+            class Meta:
+                model = Note
+                exclude = ['title']
+
+        self.assertNotIn('title', F.base_filters)
+        self.assertIn('author', F.base_filters)
+
     def test_relatedfilter_doesnt_expand_declared(self):
         # See: https://github.com/philipn/django-rest-framework-filters/issues/234
         class F(FilterSet):
@@ -289,6 +354,121 @@ class AutoFilterTests(TestCase):
         self.assertIs(w[0].category, DeprecationWarning)
 
 
+class DynamicAutoFilterTests(TestCase):
+
+    class StaticFilter(FilterSet):
+        joined = filters.AutoFilter(field_name='datetime_joined', lookups='__all__')
+        name = filters.AutoFilter(lookups=['exact', 'contains'])
+
+        class Meta:
+            model = Person
+            fields = []
+
+    class DynamicFilter(FilterSet):
+        joined = filters.AutoFilter(
+            field_name='datetime_joined', lookups='__all__', dynamic=True,
+        )
+        name = filters.AutoFilter(lookups=['exact', 'contains'], dynamic=True)
+
+        class Meta:
+            model = Person
+            fields = []
+
+    def test_not_expanded(self):
+        F = self.DynamicFilter
+
+        self.assertEqual(F.base_filters, {})
+        self.assertEqual(list(F.dynamic_lookups), ['joined', 'name'])
+        self.assertEqual(F.dynamic_lookups['name'].lookups, {'exact', 'contains'})
+
+    def test_accepted_params(self):
+        # The accepted params must be identical to those of the expanded filters
+        static, dynamic = self.StaticFilter, self.DynamicFilter
+        lookups = utils.lookups_for_field(Person._meta.get_field('datetime_joined'))
+        self.assertEqual(len(static.base_filters), len(lookups) + 2)
+
+        params = list(static.base_filters) + [
+            'joined__exact', 'joined__foo', 'joined__year__foo', 'joined__', 'joined_',
+            'name__icontains', 'name__exact', 'names', 'foo', 'joined__year__exact!',
+        ]
+        for param in params:
+            with self.subTest(param=param):
+                self.assertEqual(
+                    dynamic.get_param_filter_name(param),
+                    static.get_param_filter_name(param),
+                )
+
+                dynamic_filter = dynamic.get_dynamic_filter(param)
+                static_filter = static.base_filters.get(param)
+                # filter classes may be generated, so compare by name
+                self.assertEqual(
+                    type(dynamic_filter).__name__,
+                    type(static_filter).__name__,
+                )
+
+                if static_filter is not None:
+                    self.assertEqual(dynamic_filter.field_name, static_filter.field_name)
+                    self.assertEqual(
+                        dynamic_filter.lookup_expr,
+                        static_filter.lookup_expr,
+                    )
+
+    def test_filters_cached(self):
+        class F(FilterSet):
+            name = filters.AutoFilter(lookups=['exact'], dynamic=True)
+
+            class Meta:
+                model = Person
+                fields = []
+
+        f = F.get_dynamic_filter('name')
+        self.assertEqual(F.dynamic_filters, {'name': f})
+        self.assertIs(F.get_dynamic_filter('name'), f)
+
+        # invalid names are not cached
+        self.assertIsNone(F.get_dynamic_filter('name__contains'))
+        self.assertEqual(F.dynamic_filters, {'name': f})
+
+    def test_filter_subset(self):
+        F = self.DynamicFilter
+        subset = F.get_filter_subset(['name__contains', 'joined__year__gte', 'foo'])
+
+        self.assertEqual(list(subset), ['joined__year__gte', 'name__contains'])
+        self.assertIs(subset['name__contains'], F.get_dynamic_filter('name__contains'))
+
+    def test_subset_disabled(self):
+        F = self.DynamicFilter.disable_subset()
+        subset = F.get_filter_subset(['joined__date__lt'])
+
+        self.assertEqual(list(subset), ['joined__date__lt'])
+
+    def test_meta_exclude(self):
+        class F(FilterSet):
+            name = filters.AutoFilter(lookups=['exact'], dynamic=True)
+
+            class Meta:
+                model = Person
+                exclude = ['name']
+
+        self.assertEqual(F.dynamic_lookups, {})
+        self.assertIsNone(F.get_param_filter_name('name'))
+
+    def test_filtering(self):
+        Person.objects.create(name='Bob')
+        Person.objects.create(name='Joe')
+
+        GET = {'name__contains': 'o', 'name!': 'Bob', 'joined__year__gte': '2000'}
+        filterset = self.DynamicFilter(GET, queryset=Person.objects.all())
+
+        self.assertEqual(
+            list(filterset.filters),
+            ['joined__year__gte', 'name', 'name!', 'name__contains'],
+        )
+        self.assertTrue(filterset.filters['name!'].exclude)
+        self.assertIs(filterset.filters['name__contains'].parent, filterset)
+        self.assertQuerysetEqual(filterset.qs, ['Joe'], lambda p: p.name)
+
+
 class GetRelatedFiltersetsTests(TestCase):
 
     def test_not_bound(self):
@@ -349,6 +529,58 @@ class GetRelatedFiltersetsTests(TestCase):
         self.assertIsInstance(filtersets['note'], NoteFilter)
         self.assertIsInstance(filtersets['tags'], TagFilter)
 
+    def test_lazy_initialization(self):
+        filterset = NoteFilter({'author__username': 'bob'})
+        filtersets = filterset.related_filtersets
+
+        self.assertIsInstance(filtersets, RelatedFiltersets)
+        self.assertEqual(list(filtersets), ['author'])
+        self.assertEqual(filtersets.filtersets, {})
+
+        related_filterset = filtersets['author']
+        self.assertIsInstance(related_filterset, UserFilter)
+        self.assertIs(filtersets['author'], related_filterset)
+
+        with self.assertRaises(KeyError):
+            filtersets['foo']
+
+    def test_unused_not_initialized(self):
+        # The related filterset is not needed when only the related filter is used.
+        filterset = NoteFilter({'author': '1'}, queryset=Note.objects.all())
+        filterset.qs
+
+        self.assertEqual(list(filterset.related_filtersets), ['author'])
+        self.assertEqual(filterset.related_filtersets.filtersets, {})
+
+    def test_chain_initialization(self):
+        filterset = AFilter({'b__c__title': 'foo'}, queryset=A.objects.all())
+        filterset.qs
+
+        b = filterset.related_filtersets['b']
+        c = b.related_filtersets['c']
+        self.assertEqual(list(c.related_filtersets), [])
+        self.assertEqual(c.relationship, 'b__c')
+
+    def test_related_data(self):
+        filterset = PostFilter({
+            'title': 'a', 'note__title': 'b', 'note__author__username': 'c', 'tags': 'd',
+        })
+        note = filterset.related_filtersets['note']
+        author = note.related_filtersets['author']
+
+        # each filterset only receives the params addressed to it
+        self.assertEqual(note.data, {'note__title': 'b', 'note__author__username': 'c'})
+        self.assertEqual(author.data, {'note__author__username': 'c'})
+        self.assertEqual(filterset.related_filtersets['tags'].data, {})
+
+    def test_related_data_multiple_values(self):
+        data = QueryDict('title=a&note__title__in=b&note__title__in=c')
+        note = PostFilter(data).related_filtersets['note']
+
+        self.assertIsInstance(note.data, MultiValueDict)
+        self.assertEqual(note.data.getlist('note__title__in'), ['b', 'c'])
+        self.assertNotIn('title', note.data)
+
 
 class GetParamFilterNameTests(TestCase):
 
@@ -442,6 +674,43 @@ class GetParamFilterNameTests(TestCase):
         name = PostFilterNameHiding.get_param_filter_name('note2__author')
         self.assertEqual('note2', name)
 
+    def test_overlapping_separators(self):
+        class F(FilterSet):
+            note_ = filters.RelatedFilter(NoteFilter, field_name='note')
+            note = filters.RelatedFilter(NoteFilter)
+
+            class Meta:
+                model = Post
+                fields = []
+
+        name = F.get_param_filter_name('note___title')
+        self.assertEqual('note_', name)
+
+        name = F.get_param_filter_name('note__title')
+        self.assertEqual('note', name)
+
+    def test_exclusion_name_precedence(self):
+        # a filter named with a trailing `!` is matched before the exclusion filter.
+        class Meta:
+            model = Post
+            fields = []
+
+        F = type('F', (FilterSet, ), {
+            'title': filters.CharFilter(),
+            'title!': filters.CharFilter(field_name='title'),
+            'Meta': Meta,
+        })
+
+        self.assertEqual(F.param_filter_names['title!'], 'title!')
+        self.assertEqual(F.get_param_filter_name('title!'), 'title!')
+
+    def test_compiled_param_filter_names(self):
+        # param names are compiled into a lookup table when the class is created.
+        names = NoteFilter.param_filter_names
+        self.assertEqual(names['title__contains'], 'title__contains')
+        self.assertEqual(names['title__contains!'], 'title__contains')
+        self.assertNotIn('author__email', names)
+
 
 class GetFilterSubsetTests(TestCase):
 
@@ -512,6 +781,213 @@ class GetFilterSubsetTests(TestCase):
         self.assertEqual(list(filter_subset), ['content', 'author'])
 
 
+class FilterPlanTests(TestCase):
+
+    def setUp(self):
+        self.original_cache = FilterSet.plan_cache
+        FilterSet.plan_cache = utils.LRUCache(maxsize=4)
+
+    def tearDown(self):
+        FilterSet.plan_cache = self.original_cache
+
+    def test_plan(self):
+        plan = PostFilter.build_filter_plan([
+            'title', 'title!', 'author', 'note__author__username', 'tags__name!',
+        ])
+
+        self.assertEqual(list(plan.filters), ['author', 'note', 'tags', 'title'])
+        self.assertEqual(plan.excluded, {'title'})
+        self.assertEqual(plan.related, {
+            'note': ('note__author__username', ),
+            'tags': ('tags__name!', ),
+        })
+
+    def test_relationship_plan(self):
+        params = ['title!', 'note__title!', 'note__author__username']
+        plan = NoteFilter.build_filter_plan(params, rel='note')
+
+        self.assertEqual(list(plan.filters), ['author', 'title'])
+        self.assertEqual(plan.excluded, {'title'})
+        self.assertEqual(plan.related, {'author': ('note__author__username', )})
+
+    def test_related_partitioning(self):
+        plan = PostFilter.build_filter_plan([
+            'note__title', 'note___title', 'note__author__username', 'tags__', 'notes',
+        ])
+
+        # the leading separator of `note___title` is part of the relationship prefix
+        self.assertEqual(plan.related, {
+            'note': ('note__title', 'note___title', 'note__author__username'),
+            'tags': ('tags__', ),
+        })
+
+    def test_cached(self):
+        plan = PostFilter.get_filter_plan({'title': 'a'})
+        self.assertIs(PostFilter.get_filter_plan({'title': 'b'}), plan)
+        self.assertIsNot(PostFilter.get_filter_plan({'title!': 'b'}), plan)
+        self.assertEqual(FilterSet.plan_cache.info(), (1, 2, 4, 2))
+
+    def test_cache_key(self):
+        # plans are keyed by the filterset class and relationship.
+        class F(PostFilter):
+            pass
+
+        plan = PostFilter.get_filter_plan({'title': 'a'})
+        self.assertIsNot(F.get_filter_plan({'title': 'a'}), plan)
+        self.assertIsNot(PostFilter.get_filter_plan({'title': 'a'}, 'post'), plan)
+
+    def test_cache_disabled(self):
+        FilterSet.plan_cache = None
+
+        plan = PostFilter.get_filter_plan({'title': 'a'})
+        self.assertIsNot(PostFilter.get_filter_plan({'title': 'a'}), plan)
+        self.assertEqual(plan, PostFilter.get_filter_plan({'title': 'a'}))
+
+    def test_filterset_plan(self):
+        filterset = PostFilter({'title': 'a', 'note__title!': 'b'})
+        related_filterset = filterset.related_filtersets['note']
+
+        self.assertEqual(list(filterset.filters), ['note', 'title'])
+        self.assertEqual(list(related_filterset.filters), ['title', 'title!'])
+        self.assertEqual(FilterSet.plan_cache.info().currsize, 2)
+
+        # repeated request shape reuses the plans
+        PostFilter({'title': 'c', 'note__title!': 'd'}).related_filtersets['note']
+        self.assertEqual(FilterSet.plan_cache.info().hits, 2)
+
+
+class QueryComplexityTests(TestCase):
+
+    def test_complexity(self):
+        complexity = AFilter.get_query_complexity({
+            'title': 'a', 'b__name': 'b', 'b__c__title!': 'c', 'b__c__a__title': 'd',
+        })
+
+        self.assertEqual(complexity, (3, 3, 4))
+        self.assertEqual(complexity.depth, 3)
+        self.assertEqual(complexity.related_filtersets, 3)
+        self.assertEqual(complexity.filters, 4)
+
+    def test_no_related(self):
+        complexity = NoteFilter.get_query_complexity({'title': 'a', 'title!': 'b'})
+
+        self.assertEqual(complexity, (0, 0, 2))
+
+    def test_related_filter(self):
+        # the related filter is applied, but its relationship isn't traversed
+        complexity = NoteFilter.get_query_complexity({'author': '1'})
+
+        self.assertEqual(complexity, (0, 0, 1))
+
+    def test_unknown_params(self):
+        complexity = NoteFilter.get_query_complexity({'foo': 'a', 'author__foo': 'b'})
+
+        self.assertEqual(complexity, (1, 1, 0))
+
+    def test_sibling_relationships(self):
+        complexity = PostFilter.get_query_complexity({
+            'note__title': 'a', 'note__author__username': 'b', 'tags__name': 'c',
+        })
+
+        self.assertEqual(complexity, (2, 3, 3))
+
+
+class GetFilterQTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        bob = User.objects.create(username='bob')
+        joe = User.objects.create(username='joe')
+
+        Note.objects.create(author=bob, title='Note 1')
+        Note.objects.create(author=joe, title='Note 2')
+        Note.objects.create(author=joe, title='Post 3')
+
+    def assertEquivalent(self, filterset):
+        q, distinct = filterset.get_filter_q()
+        qs = Note.objects.filter(q)
+
+        self.assertFalse(distinct)
+        self.assertCountEqual(qs, filterset.qs)
+        return q
+
+    def test_filters(self):
+        filterset = NoteFilter({'title__startswith': 'Note', 'title!': 'Note 1'})
+        q = self.assertEquivalent(filterset)
+
+        self.assertEqual(q, ~Q(title__exact='Note 1') & Q(title__startswith='Note'))
+
+    def test_related_filterset(self):
+        filterset = NoteFilter({'title__startswith': 'Note', 'author__username': 'joe'})
+        q = self.assertEquivalent(filterset)
+
+        self.assertIn('IN (SELECT', str(Note.objects.filter(q).query))
+
+    def test_empty(self):
+        self.assertEqual(self.assertEquivalent(NoteFilter({})), Q())
+
+    def test_distinct(self):
+        filterset = PostFilter({'tags__name': 'a'})
+        self.assertIsNone(filterset.get_filter_q())
+
+        class F(NoteFilter):
+            title = filters.CharFilter(distinct=True)
+
+        self.assertEqual(F({'title': 'a'}).get_filter_q(), (Q(title__exact='a'), True))
+
+    def test_invalid(self):
+        self.assertIsNone(NoteFilter({'author': 'foo'}).get_filter_q())
+
+    def test_method_filter(self):
+        self.assertIsNone(PostFilter({'is_published': 'true'}).get_filter_q())
+
+    def test_multi_valued_path(self):
+        class F(FilterSet):
+            post__title = filters.CharFilter()
+
+            class Meta:
+                model = User
+                fields = []
+
+        self.assertIsNone(F({'post__title': 'a'}).get_filter_q())
+
+    def test_unsupported_queryset_method(self):
+        class OrderedFilter(filters.CharFilter):
+            def filter(self, qs, value):
+                return super().filter(qs, value).order_by('title')
+
+        class F(NoteFilter):
+            title = OrderedFilter()
+
+        self.assertIsNone(F({'title': 'a'}).get_filter_q())
+
+    def test_custom_filter_queryset(self):
+        class F(NoteFilter):
+            def filter_queryset(self, queryset):
+                return super().filter_queryset(queryset).order_by('title')
+
+        self.assertIsNone(F({'title': 'a'}).get_filter_q())
+
+    def test_custom_qs(self):
+        class F(NoteFilter):
+            @property
+            def qs(self):
+                return super().qs.exclude(title='Note 1')
+
+        self.assertIsNone(F({'title__startswith': 'Note'}).get_filter_q())
+
+    def test_related_custom_qs(self):
+        class ActiveUserFilter(UserFilter):
+            @property
+            def qs(self):
+                return super().qs.filter(is_active=True)
+
+        class F(NoteFilter):
+            author = filters.RelatedFilter(ActiveUserFilter, queryset=User.objects.all())
+
+        self.assertIsNone(F({'author__username': 'joe'}).get_filter_q())
+
+
 class DisableSubsetTests(TestCase):
     class F(FilterSet):
         class Meta:
@@ -548,9 +1024,37 @@ class DisableSubsetTests(TestCase):
         self.assertEqual(list(F({}).form.fields), ['author'])
         self.assertEqual(list(F({'author': ''}).form.fields), ['author'])
 
+    def test_cached(self):
+        F = self.F.disable_subset()
+
+        self.assertIs(self.F.disable_subset(), F)
+        self.assertIs(self.F.subset_disabled_classes[0], F)
+        self.assertIsNot(self.F.disable_subset(depth=1), F)
+        self.assertEqual(F.subset_disabled_classes, {})
+
 
 class DisableSubsetRecursiveTests(TestCase):
 
+    def test_cached(self):
+        F = AFilter.disable_subset(depth=2)
+        self.assertIs(AFilter.disable_subset(depth=2), F)
+
+        # related filtersets are cached by their respective depths
+        B = F.base_filters['b'].filterset
+        self.assertIs(BFilter.disable_subset(depth=1), B)
+        self.assertIs(B.base_filters['c'].filterset, CFilter.disable_subset())
+
+    def test_disabled_class_not_modified(self):
+        F = AFilter.disable_subset()
+        related = F.base_filters['b']
+
+        D = F.disable_subset(depth=1)
+        self.assertIsNot(D, F)
+        self.assertTrue(issubclass(D, F))
+        self.assertIs(F.base_filters['b'], related)
+        self.assertIs(F.base_filters['b'].filterset, BFilter)
+        self.assertTrue(issubclass(D.base_filters['b'].filterset, SubsetDisabledMixin))
+
     def test_depth0(self):
         F = AFilter.disable_subset(depth=0)
         f = F()
@@ -616,6 +1120,122 @@ class DisableSubsetRecursiveTests(TestCase):
         self.assertTrue(issubclass(original, F))
 
 
+class WarmupTests(TestCase):
+
+    def get_filterset_class(self):
+        class F(FilterSet):
+            author = filters.RelatedFilter(
+                'tests.testapp.filters.UserFilter', queryset=User.objects.all(),
+            )
+
+            class Meta:
+                model = Note
+                fields = []
+
+        return F
+
+    def test_resolves_related_filtersets(self):
+        F = self.get_filterset_class()
+        self.assertIsInstance(F.base_filters['author']._filterset, str)
+
+        self.assertEqual(warmup([F]), [F])
+        self.assertIs(F.base_filters['author']._filterset, UserFilter)
+
+    def test_prebuilds_subset_disabled_classes(self):
+        F = self.get_filterset_class()
+        warmup([F])
+
+        self.assertEqual(list(F.subset_disabled_classes), [1])
+        self.assertIs(F.disable_subset(depth=1), F.subset_disabled_classes[1])
+
+    def test_depth(self):
+        F = self.get_filterset_class()
+        warmup([F], depth=0)
+
+        self.assertEqual(list(F.subset_disabled_classes), [0])
+
+    def test_all_filtersets(self):
+        F = self.get_filterset_class()
+        prepared = warmup()
+
+        self.assertIn(F, prepared)
+        self.assertIn(UserFilter, prepared)
+        self.assertIs(F.base_filters['author']._filterset, UserFilter)
+
+        # subset-disabled classes are not prepared
+        for filterset_class in prepared:
+            self.assertFalse(issubclass(filterset_class, SubsetDisabledMixin))
+
+
+class BindFiltersTests(TestCase):
+
+    def test_bound_filters(self):
+        filterset = PostFilter({'title': 'foo'})
+        base = PostFilter.base_filters['title']
+        bound = filterset.filters['title']
+
+        self.assertIsNot(bound, base)
+        self.assertIs(bound.parent, filterset)
+        self.assertIs(bound.model, Post)
+        self.assertFalse(hasattr(base, 'parent'))
+        self.assertFalse(hasattr(base, 'model'))
+
+    def test_shared_definition(self):
+        base = PostFilter.base_filters['title__in']
+        bound = PostFilter({'title__in': 'foo'}).filters['title__in']
+
+        self.assertIs(bound.field_class, base.field_class)
+        self.assertIsNot(bound.extra, base.extra)
+        self.assertEqual(bound.extra, base.extra)
+
+    def test_extra_isolation(self):
+        # A callable queryset is resolved into `extra` when creating the form field.
+        def users(request):
+            return User.objects.all()
+
+        class F(FilterSet):
+            author = filters.RelatedFilter(UserFilter, queryset=users)
+
+            class Meta:
+                model = Note
+                fields = []
+
+        base = F.base_filters['author']
+        bound = F({'author': '1'}).filters['author']
+        bound.field
+
+        self.assertIsInstance(bound.extra['queryset'], QuerySet)
+        self.assertIs(base.extra['queryset'], users)
+        self.assertFalse(hasattr(base, '_field'))
+
+    def test_method_filter(self):
+        filterset = PostFilter({'is_published': 'true'})
+        bound = filterset.filters['is_published']
+
+        self.assertIs(bound.filter.f, bound)
+        self.assertEqual(bound.filter.method, filterset.filter_is_published)
+
+    def test_exclusion_filter(self):
+        filterset = PostFilter({'title!': 'foo'})
+
+        self.assertFalse(filterset.filters['title'].exclude)
+        self.assertTrue(filterset.filters['title!'].exclude)
+        self.assertIs(filterset.filters['title!'].parent, filterset)
+        self.assertFalse(PostFilter.base_filters['title'].exclude)
+
+    def test_deepcopy_filters(self):
+        class F(PostFilter):
+            deepcopy_filters = True
+
+        filterset = F({'title': 'foo', 'is_published': 'true'})
+        base = F.base_filters['title__in']
+        bound = filterset.filters['is_published']
+
+        self.assertIs(bound.parent, filterset)
+        self.assertIs(bound.filter.f, bound)
+        self.assertIsNot(F({'title__in': ''}).filters['title__in'].extra, base.extra)
+
+
 class FilterExclusionTests(TestCase):
 
     @classmethod
@@ -662,6 +1282,35 @@ class FilterExclusionTests(TestCase):
 
         self.assertTrue(filterset.filters['name__contains!'].exclude)
 
+    def test_exclusion_prototype(self):
+        f = TagFilter.get_exclusion_filter('name__contains')
+
+        self.assertTrue(f.exclude)
+        self.assertIs(f, TagFilter.get_exclusion_filter('name__contains'))
+        self.assertIsNot(f, TagFilter.base_filters['name__contains'])
+        self.assertFalse(TagFilter.base_filters['name__contains'].exclude)
+
+        # the prototype is bound to the filterset, not used directly.
+        filterset = TagFilter({'name__contains!': 'Tag'})
+        self.assertIsNot(filterset.filters['name__contains!'], f)
+        self.assertFalse(hasattr(f, 'parent'))
+
+    def test_exclusion_prototype_per_class(self):
+        class F(TagFilter):
+            pass
+
+        self.assertIsNot(F.exclusion_filters, TagFilter.exclusion_filters)
+        self.assertIsNot(
+            F.get_exclusion_filter('name'),
+            TagFilter.get_exclusion_filter('name'),
+        )
+
+    def test_no_exclusion_params(self):
+        filterset = TagFilter({'name__contains': 'Tag'})
+
+        self.assertIs(filterset.get_request_filters(), filterset.filters)
+        self.assertEqual(list(filterset.filters), ['name__contains'])
+
     def test_exclusion_results(self):
         GET = {
             'name__contains!': 'Tag',
@@ -0,0 +1,304 @@
+import json
+import tempfile
+from collections import Counter
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.db.models.functions import ExtractYear, Upper
+from django.test import TestCase
+
+from rest_framework_filters import FilterSet, filters, indexes
+from rest_framework_filters.indexes import IndexAdvisor, resolve_lookup_path
+
+from .testapp.models import Note, Post, Tag, User
+
+
+class NoteFilter(FilterSet):
+    title = filters.AutoFilter(lookups=['exact', 'iexact', 'icontains'])
+    author = filters.RelatedFilter('tests.testapp.filters.UserFilter')
+    author__username = filters.CharFilter()
+    author__email = filters.CharFilter(lookup_expr='iexact')
+    content = filters.CharFilter(method='filter_content')
+
+    class Meta:
+        model = Note
+        fields = []
+
+
+class PostFilter(FilterSet):
+    publish_date = filters.AutoFilter(lookups=['year__gte', 'isnull'])
+
+    class Meta:
+        model = Post
+        fields = []
+
+
+class ResolveLookupPathTests(TestCase):
+
+    def test_field(self):
+        target = resolve_lookup_path(Note, 'title__icontains')
+
+        self.assertEqual(target.model, Note)
+        self.assertEqual(target.field, Note._meta.get_field('title'))
+        self.assertEqual(target.lookup_expr, 'icontains')
+        self.assertEqual(target.transforms, [])
+        self.assertEqual(target.lookup, 'icontains')
+
+    def test_related_field(self):
+        target = resolve_lookup_path(Post, 'author__username__iexact')
+
+        self.assertEqual(target.model, User)
+        self.assertEqual(target.field, User._meta.get_field('username'))
+        self.assertEqual(target.lookup_expr, 'iexact')
+
+    def test_foreign_key_lookup(self):
+        target = resolve_lookup_path(Post, 'author__in')
+
+        self.assertEqual(target.model, Post)
+        self.assertEqual(target.field, Post._meta.get_field('author'))
+        self.assertEqual(target.lookup, 'in')
+
+    def test_transforms(self):
+        target = resolve_lookup_path(Post, 'publish_date__year__gte')
+
+        self.assertEqual(target.transforms, [ExtractYear])
+        self.assertEqual(target.lookup, 'gte')
+
+        # a trailing transform implies the 'exact' lookup
+        target = resolve_lookup_path(Post, 'publish_date__year')
+        self.assertEqual(target.lookup_expr, 'year')
+        self.assertEqual(target.lookup, 'exact')
+
+    def test_unresolvable(self):
+        self.assertIsNone(resolve_lookup_path(Post, 'foo__exact'))
+        self.assertIsNone(resolve_lookup_path(Post, 'title__foo'))
+        self.assertIsNone(resolve_lookup_path(Post, 'tags__exact'))
+        self.assertIsNone(resolve_lookup_path(User, 'post__exact'))
+
+
+class IndexAdvisorTests(TestCase):
+
+    def get_suggestions(self, *filtersets, **kwargs):
+        advisor = IndexAdvisor(filtersets, kwargs.pop('usage', None))
+        return [
+            ('%s.%s' % (s.model.__name__, s.field.name), s.expression, s.lookups, s.usage)
+            for s in advisor.get_suggestions(**kwargs)
+        ]
+
+    def test_suggestions(self):
+        self.assertEqual(self.get_suggestions(NoteFilter), [
+            ('User.email', (Upper, ), ['iexact'], 0),
+            ('Note.title', (), ['exact'], 0),
+            ('Note.title', (Upper, ), ['iexact'], 0),
+            ('Note.title', None, ['icontains'], 0),
+        ])
+
+    def test_transforms(self):
+        self.assertEqual(self.get_suggestions(PostFilter), [
+            ('Post.publish_date', (ExtractYear, ), ['year__gte'], 0),
+            ('Post.publish_date', (), ['isnull'], 0),
+        ])
+
+    def test_related_filters(self):
+        class F(PostFilter):
+            author = filters.RelatedFilter(
+                'tests.testapp.filters.UserFilter', queryset=User.objects.all(),
+            )
+            tags = filters.RelatedMultipleFilter(
+                'tests.testapp.filters.TagFilter', queryset=Tag.objects.all(),
+            )
+
+        # the related filters' lookups belong to the related filtersets
+        self.assertEqual(list(IndexAdvisor([F]).get_lookup_paths()), [
+            (Post, 'publish_date__year__gte'),
+            (Post, 'publish_date__isnull'),
+        ])
+
+    def test_dynamic_lookups(self):
+        class F(FilterSet):
+            publish_date = filters.AutoFilter(
+                lookups=['year__gte', 'isnull'], dynamic=True,
+            )
+
+            class Meta:
+                model = Post
+                fields = []
+
+        self.assertEqual(F.base_filters, {})
+        self.assertCountEqual(self.get_suggestions(F), self.get_suggestions(PostFilter))
+
+    def test_usage(self):
+        usage = {
+            'testapp.Note.title__icontains': 5,
+            'testapp.Note.title__exact': 2,
+            'testapp.Post.content__iexact': 3,
+            'testapp.Post.foo__exact': 1,
+            'foo.Bar.baz__exact': 1,
+        }
+
+        # recorded lookups are included, and ordered by their usage
+        self.assertEqual(self.get_suggestions(NoteFilter, usage=usage, min_usage=1), [
+            ('Note.title', None, ['icontains'], 5),
+            ('Post.content', (Upper, ), ['iexact'], 3),
+            ('Note.title', (), ['exact'], 2),
+        ])
+
+    def test_existing_index(self):
+        advisor = IndexAdvisor([])
+        title = Note._meta.get_field('title')
+
+        self.assertTrue(advisor.has_index(User, User._meta.get_field('username'), ()))
+        self.assertTrue(advisor.has_index(Note, Note._meta.get_field('author'), ()))
+        self.assertFalse(advisor.has_index(Note, title, ()))
+        self.assertFalse(advisor.has_index(Note, title, (Upper, )))
+
+    def test_index_name(self):
+        advisor = IndexAdvisor([])
+        title = Note._meta.get_field('title')
+
+        name = advisor.get_index_name(Note, title, (Upper, ))
+        self.assertRegex(name, r'^note_upp_[0-9a-f]{6}_idx$')
+        self.assertEqual(name, advisor.get_index_name(Note, title, (Upper, )))
+        self.assertNotEqual(name, advisor.get_index_name(Note, title, ()))
+
+    @mock.patch.object(indexes, 'SUPPORTS_FUNCTIONAL_INDEXES', True)
+    def test_migration(self):
+        advisor = IndexAdvisor([PostFilter])
+        migrations = advisor.get_migrations(advisor.get_suggestions())
+        name = advisor.get_index_name(
+            Post, Post._meta.get_field('publish_date'), (ExtractYear, ),
+        )
+
+        self.assertEqual(list(migrations), ['testapp'])
+        self.assertIn('from django.db.models.functions import ExtractYear\n',
+                      migrations['testapp'])
+        self.assertIn("('testapp', '0001_initial'),", migrations['testapp'])
+        self.assertIn(
+            "index=models.Index(ExtractYear('publish_date'), name='%s')," % name,
+            migrations['testapp'],
+        )
+
+        # the draft migration must be valid python
+        compile(migrations['testapp'], 'migration', 'exec')
+
+    @mock.patch.object(indexes, 'SUPPORTS_FUNCTIONAL_INDEXES', False)
+    def test_migration_without_functional_indexes(self):
+        advisor = IndexAdvisor([NoteFilter])
+        migrations = advisor.get_migrations(advisor.get_suggestions())
+        name = advisor.get_index_name(Note, Note._meta.get_field('title'), (Upper, ))
+
+        # functional indexes are commented SQL, while column indexes are migrated
+        self.assertNotIn('import Upper', migrations['testapp'])
+        self.assertNotIn('models.Index(Upper(', migrations['testapp'])
+        self.assertIn(
+            '        # CREATE INDEX "%s" ON "testapp_note" (UPPER("title"));\n' % name,
+            migrations['testapp'],
+        )
+        self.assertIn("models.Index(fields=['title']", migrations['testapp'])
+        compile(migrations['testapp'], 'migration', 'exec')
+
+    def test_migration_project_apps(self):
+        advisor = IndexAdvisor([NoteFilter])
+        suggestions = advisor.get_suggestions()
+        migrations = advisor.get_migrations(suggestions)
+
+        # `auth.User.email` is suggested, but the auth app can't be migrated
+        self.assertIn('auth.User', [s.model._meta.label for s in suggestions])
+        self.assertEqual(list(migrations), ['testapp'])
+
+
+class UsageTests(TestCase):
+
+    def test_record_usage(self):
+        class F(NoteFilter):
+            usage = Counter()
+
+        F({'title': 'a', 'title!': 'b', 'author__email': 'c', 'author': '1'})
+        F({'title__icontains': 'a', 'content': 'b'})
+
+        self.assertEqual(F.usage, {
+            'testapp.Note.title__exact': 1,
+            'testapp.Note.title__icontains': 1,
+            'testapp.Note.author__email__iexact': 1,
+        })
+
+    def test_related_multiple_filter(self):
+        class F(PostFilter):
+            tags = filters.RelatedMultipleFilter(
+                'tests.testapp.filters.TagFilter', queryset=Tag.objects.all(),
+            )
+            usage = Counter()
+
+        tag = Tag.objects.create(name='a')
+        F({'tags': [tag.pk], 'tags__name': 'a'})
+
+        # the related filter's lookups are recorded by the related filterset
+        self.assertEqual(F.usage, {})
+
+    def test_disabled(self):
+        self.assertIsNone(FilterSet.usage)
+
+
+class SuggestFilterIndexesCommandTests(TestCase):
+
+    def call_command(self, *args):
+        stdout = StringIO()
+        call_command('suggest_filter_indexes', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    @mock.patch.object(indexes, 'SUPPORTS_FUNCTIONAL_INDEXES', True)
+    def test_report(self):
+        output = self.call_command('tests.test_indexes.PostFilter')
+
+        self.assertEqual(output, (
+            "testapp.Post.publish_date: year__gte\n"
+            "    models.Index(ExtractYear('publish_date'), name='%s')\n"
+            "    filtersets: PostFilter\n"
+            "testapp.Post.publish_date: isnull\n"
+            "    models.Index(fields=['publish_date'], name='%s')\n"
+            "    filtersets: PostFilter\n"
+        ) % (
+            IndexAdvisor([]).get_index_name(
+                Post, Post._meta.get_field('publish_date'), (ExtractYear, )),
+            IndexAdvisor([]).get_index_name(
+                Post, Post._meta.get_field('publish_date'), ()),
+        ))
+
+    @mock.patch.object(indexes, 'SUPPORTS_FUNCTIONAL_INDEXES', False)
+    def test_report_without_functional_indexes(self):
+        output = self.call_command('tests.test_indexes.NoteFilter')
+        name = IndexAdvisor([]).get_index_name(
+            Note, Note._meta.get_field('title'), (Upper, ))
+
+        self.assertIn(
+            'testapp.Note.title: iexact\n'
+            '    CREATE INDEX "%s" ON "testapp_note" (UPPER("title"));\n' % name,
+            output,
+        )
+
+    def test_usage(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'testapp.Post.publish_date__year__gte': 3}, f)
+            f.flush()
+
+            output = self.call_command(
+                'tests.test_indexes.PostFilter', '--usage', f.name, '--usage', f.name,
+                '--min-usage', '1',
+            )
+
+        self.assertTrue(output.startswith(
+            'testapp.Post.publish_date: year__gte (used 6 times)\n',
+        ))
+        self.assertNotIn('isnull', output)
+
+    def test_no_suggestions(self):
+        output = self.call_command('tests.test_indexes.PostFilter', '--min-usage', '1')
+
+        self.assertEqual(output, 'All filtered lookups are supported by an index.\n')
+
+    def test_migration(self):
+        output = self.call_command('tests.test_indexes.PostFilter', '--migration')
+
+        self.assertTrue(output.startswith('# testapp\n'))
+        self.assertIn('migrations.AddIndex(', output)
@@ -1,8 +1,9 @@
+from django.db.models import CharField, IntegerField, Lookup, Q
 from django.test import TestCase
 
 from rest_framework_filters import utils
 
-from .testapp.models import Note, Person
+from .testapp.models import A, Note, Person, Post
 
 
 class LookupsForFieldTests(TestCase):
@@ -41,6 +42,139 @@ class LookupsForTransformTests(TestCase):
         self.assertNotIn('unaccent__unaccent__exact', lookups)
 
 
+class NotEqual(Lookup):
+    lookup_name = 'ne'
+
+
+class LookupsCacheTests(TestCase):
+    def setUp(self):
+        utils.clear_lookups_cache()
+
+    def tearDown(self):
+        utils.clear_lookups_cache()
+
+    def test_cached_per_field_class(self):
+        name = Person._meta.get_field('name')
+        title = Note._meta.get_field('title')
+
+        lookups = utils.lookups_for_field(name)
+        self.assertEqual(len(utils._lookups_cache), 1)
+        self.assertEqual(utils.lookups_for_field(title), lookups)
+        self.assertEqual(len(utils._lookups_cache), 1)
+
+    def test_results_are_copies(self):
+        model_field = Person._meta.get_field('name')
+        utils.lookups_for_field(model_field).append('foo')
+
+        self.assertNotIn('foo', utils.lookups_for_field(model_field))
+
+    def test_register_lookup_invalidation(self):
+        model_field = Person._meta.get_field('name')
+        self.assertNotIn('ne', utils.lookups_for_field(model_field))
+
+        CharField.register_lookup(NotEqual)
+        try:
+            self.assertIn('ne', utils.lookups_for_field(model_field))
+        finally:
+            CharField._unregister_lookup(NotEqual)
+            # older versions of Django don't clear the lookups cache
+            CharField._clear_cached_lookups()
+
+        self.assertNotIn('ne', utils.lookups_for_field(model_field))
+
+    def test_transform_output_field_invalidation(self):
+        # ``year`` outputs an IntegerField, which is unrelated to the DateTimeField
+        model_field = Person._meta.get_field('datetime_joined')
+        self.assertNotIn('year__ne', utils.lookups_for_field(model_field))
+
+        IntegerField.register_lookup(NotEqual)
+        try:
+            lookups = utils.lookups_for_field(model_field)
+        finally:
+            IntegerField._unregister_lookup(NotEqual)
+            # older versions of Django don't clear the lookups cache
+            IntegerField._clear_cached_lookups()
+
+        self.assertIn('year__ne', lookups)
+        self.assertNotIn('ne', lookups)
+
+    def test_precompute_lookups(self):
+        count = utils.precompute_lookups([Person])
+        self.assertGreater(count, 0)
+        self.assertEqual(count, len(utils._lookups_cache))
+
+        # all lookups are served from the cache
+        model_field = Person._meta.get_field('datetime_joined')
+        self.assertEqual(utils.precompute_lookups([Person]), count)
+        self.assertIn('date__year__exact', utils.lookups_for_field(model_field))
+
+
+class RelationPathTests(TestCase):
+    def test_get_relation_path(self):
+        fields = utils.get_relation_path(A, 'b__c')
+        self.assertEqual([f.name for f in fields], ['b', 'c'])
+
+    def test_get_relation_path_invalid(self):
+        self.assertIsNone(utils.get_relation_path(A, 'title'))
+        self.assertIsNone(utils.get_relation_path(A, 'b__foo'))
+
+    def test_get_reverse_path(self):
+        def reverse(model, path):
+            return utils.get_reverse_path(utils.get_relation_path(model, path))
+
+        self.assertEqual(reverse(A, 'b__c'), 'b__a')
+        self.assertEqual(reverse(Post, 'tags'), 'post')
+        self.assertEqual(reverse(A, 'c'), 'a')
+
+    def test_is_target_field(self):
+        fields = utils.get_relation_path(Note, 'author')
+        self.assertTrue(utils.is_target_field(fields, None))
+        self.assertTrue(utils.is_target_field(fields, 'pk'))
+        self.assertTrue(utils.is_target_field(fields, 'id'))
+        self.assertFalse(utils.is_target_field(fields, 'username'))
+
+    def test_is_single_valued(self):
+        self.assertTrue(utils.is_single_valued(utils.get_relation_path(Note, 'author')))
+        self.assertFalse(utils.is_single_valued(utils.get_relation_path(Post, 'tags')))
+        self.assertFalse(utils.is_single_valued(utils.get_relation_path(A, 'c')))
+
+    def test_is_nullable(self):
+        self.assertFalse(utils.is_nullable(utils.get_relation_path(Note, 'author')))
+        self.assertTrue(utils.is_nullable(utils.get_relation_path(Post, 'author')))
+
+    def test_is_unrestricted(self):
+        self.assertTrue(utils.is_unrestricted(Note.objects.all(), Note))
+        self.assertFalse(utils.is_unrestricted(Note.objects.all(), Post))
+        self.assertFalse(utils.is_unrestricted(Note.objects.filter(title='a'), Note))
+        self.assertFalse(utils.is_unrestricted(Note.objects.all()[:5], Note))
+        self.assertFalse(utils.is_unrestricted(Note.objects.distinct(), Note))
+
+    def test_is_multi_valued_path(self):
+        self.assertFalse(utils.is_multi_valued_path(Note, 'title'))
+        self.assertFalse(utils.is_multi_valued_path(Note, 'author__username__iexact'))
+        self.assertTrue(utils.is_multi_valued_path(Post, 'tags__name'))
+        self.assertTrue(utils.is_multi_valued_path(A, 'c__title'))
+        self.assertFalse(utils.is_multi_valued_path(A, 'b__c__a__title'))
+        self.assertFalse(utils.is_multi_valued_path(A, 'foo__bar'))
+
+
+class QueryRecorderTests(TestCase):
+    def test_record(self):
+        recorder = utils.QueryRecorder()
+        result = recorder.filter(a=1).exclude(Q(b=2) | Q(c=3), d=4).filter(e=5)
+
+        self.assertIs(result, recorder)
+        self.assertEqual(recorder.q, Q(a=1) & ~(Q(Q(b=2) | Q(c=3), d=4)) & Q(e=5))
+        self.assertFalse(recorder.is_distinct)
+
+        recorder.distinct()
+        self.assertTrue(recorder.is_distinct)
+
+    def test_unsupported_method(self):
+        with self.assertRaises(AttributeError):
+            utils.QueryRecorder().annotate(a=1)
+
+
 class LookaheadTests(TestCase):
     def test_empty(self):
         result = list(utils.lookahead([]))
@@ -57,3 +191,47 @@ class LookaheadTests(TestCase):
             (2, True),
             (3, False),
         ])
+
+
+class LRUCacheTests(TestCase):
+    def test_get_set(self):
+        cache = utils.LRUCache()
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('a', 1), 1)
+
+        cache.set('a', 2)
+        self.assertEqual(cache.get('a'), 2)
+        self.assertIn('a', cache)
+        self.assertEqual(len(cache), 1)
+
+    def test_eviction(self):
+        cache = utils.LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        # mark 'a' as recently used, so 'b' is evicted
+        cache.get('a')
+        cache.set('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_unbounded(self):
+        cache = utils.LRUCache(maxsize=None)
+        for i in range(1000):
+            cache.set(i, i)
+
+        self.assertEqual(len(cache), 1000)
+
+    def test_info(self):
+        cache = utils.LRUCache(maxsize=2)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('a')
+        cache.get('b')
+
+        self.assertEqual(cache.info(), (2, 1, 2, 1))
+
+        cache.clear()
+        self.assertEqual(cache.info(), (0, 0, 2, 0))